@@ -0,0 +1,192 @@
+# Vectorized capacity analysis over a saved topology.
+# Device properties and links are loaded once into NumPy arrays indexed by device position, and every
+# metric is computed for all devices/links at once; the graph parts use scipy.sparse.csgraph.
+from dataclasses import dataclass
+from itertools import chain
+from typing import Any, Dict, List
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+NUMERIC_PROPERTIES = ("num_ports", "total_bandwidth", "throughput_per_port", "estimated_load")
+
+@dataclass
+class TopologyArrays:
+    device_ids: np.ndarray # Sorted DB ids; a device's position in this array is its index everywhere else
+    num_ports: np.ndarray
+    total_bandwidth: np.ndarray
+    throughput_per_port: np.ndarray
+    estimated_load: np.ndarray
+    link_ids: np.ndarray
+    link_source: np.ndarray # Device indexes, not DB ids
+    link_target: np.ndarray
+
+def load_topology_arrays(db: Session, project_id: int) -> TopologyArrays:
+    # Typed columns come back as plain numbers (missing values coalesced to 0), so no JSON is decoded
+    device_rows = db.execute(
+        select(models.Device.id, *(func.coalesce(getattr(models.Device, name), 0) for name in NUMERIC_PROPERTIES))
+        .where(models.Device.project_id == project_id)
+        .order_by(models.Device.id)
+    ).all()
+    width = 1 + len(NUMERIC_PROPERTIES)
+    columns = np.fromiter(chain.from_iterable(device_rows), dtype=np.float64, count=width * len(device_rows)).reshape(-1, width)
+    device_ids = columns[:, 0].astype(np.int64)
+    numeric = {name: columns[:, i + 1] for i, name in enumerate(NUMERIC_PROPERTIES)}
+
+    link_rows = db.execute(
+        select(models.Link.id, models.Link.source_device_id, models.Link.target_device_id)
+        .where(models.Link.project_id == project_id)
+        .order_by(models.Link.id)
+    ).all()
+    # fromiter over the flattened tuples; np.array on Row objects goes through slow per-row attribute lookups
+    links = np.fromiter(chain.from_iterable(link_rows), dtype=np.int64, count=3 * len(link_rows)).reshape(-1, 3)
+    source = np.searchsorted(device_ids, links[:, 1])
+    target = np.searchsorted(device_ids, links[:, 2])
+    # Drop links whose endpoints are not devices of this project
+    valid = (source < len(device_ids)) & (target < len(device_ids))
+    valid[valid] &= (device_ids[source[valid]] == links[valid, 1]) & (device_ids[target[valid]] == links[valid, 2])
+
+    return TopologyArrays(
+        device_ids=device_ids,
+        link_ids=links[valid, 0],
+        link_source=source[valid],
+        link_target=target[valid],
+        **numeric,
+    )
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # NaN where the denominator is unknown/zero, so missing properties never look like over-use
+    out = np.full(numerator.shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+def _nan_to_none(values: np.ndarray) -> List[Any]:
+    return [None if np.isnan(value) else round(float(value), 6) for value in values]
+
+def link_capacities(arrays: TopologyArrays) -> np.ndarray:
+    """
+    Each link is limited by the slower of its endpoints' ports. NaN when either port throughput is unknown
+    (missing or not positive): the link's capacity is then unknown, not zero.
+    """
+    source_throughput = arrays.throughput_per_port[arrays.link_source]
+    target_throughput = arrays.throughput_per_port[arrays.link_target]
+    known = (source_throughput > 0) & (target_throughput > 0)
+    return np.where(known, np.minimum(source_throughput, target_throughput), np.nan)
+
+def analyze(arrays: TopologyArrays, max_components: int = 100, max_items: int = 1000) -> Dict[str, Any]:
+    """
+    Per-device utilization and port over-subscription, per-link load, connected components and the
+    bottleneck link of each component. Lists are limited to the flagged (over 100%) items, worst first.
+    """
+    n = len(arrays.device_ids)
+    source, target = arrays.link_source, arrays.link_target
+
+    degree = np.bincount(source, minlength=n) + np.bincount(target, minlength=n)
+    utilization = _ratio(arrays.estimated_load, arrays.total_bandwidth)
+    # Devices without a known port count are never reported as having too many links
+    excess_links = np.where(arrays.num_ports > 0, np.maximum(degree - arrays.num_ports, 0), 0).astype(np.int64)
+    # A device's load is assumed to spread evenly over its links
+    load_per_link = _ratio(arrays.estimated_load, degree.astype(np.float64))
+    port_utilization = _ratio(np.nan_to_num(load_per_link), arrays.throughput_per_port)
+    oversubscribed = (excess_links > 0) | (port_utilization > 1)
+
+    # Load propagation: each link carries its share of both endpoints' load and is limited by the slower port;
+    # links of unknown capacity get no utilization, so they are never flagged
+    shares = np.nan_to_num(load_per_link)
+    link_load = shares[source] + shares[target]
+    link_capacity = link_capacities(arrays)
+    link_utilization = _ratio(link_load, link_capacity)
+
+    component_count, labels = connected_components(
+        coo_matrix((np.ones(len(source)), (source, target)), shape=(n, n)), directed=False
+    )
+    components = _component_bottlenecks(arrays, labels, link_capacity, max_components)
+
+    flagged_devices = np.flatnonzero((utilization > 1) | oversubscribed)
+    flagged_devices = flagged_devices[np.argsort(-np.nan_to_num(utilization[flagged_devices], nan=np.inf))][:max_items]
+    flagged_links = np.flatnonzero(link_utilization > 1)
+    flagged_links = flagged_links[np.argsort(-link_utilization[flagged_links])][:max_items]
+
+    return {
+        "device_count": n,
+        "link_count": len(source),
+        "component_count": int(component_count),
+        "max_utilization": None if n == 0 or np.all(np.isnan(utilization)) else round(float(np.nanmax(utilization)), 6),
+        "overloaded_device_count": int(np.count_nonzero(utilization > 1)),
+        "oversubscribed_device_count": int(np.count_nonzero(oversubscribed)),
+        "overloaded_link_count": int(np.count_nonzero(link_utilization > 1)),
+        "devices": [
+            {"id": int(device_id), "utilization": util, "degree": int(deg), "excess_links": int(excess),
+             "port_utilization": port_util, "oversubscribed": bool(flag)}
+            for device_id, util, deg, excess, port_util, flag in zip(
+                arrays.device_ids[flagged_devices].tolist(),
+                _nan_to_none(utilization[flagged_devices]),
+                degree[flagged_devices],
+                excess_links[flagged_devices],
+                _nan_to_none(port_utilization[flagged_devices]),
+                oversubscribed[flagged_devices],
+            )
+        ],
+        "links": [
+            {"id": int(link_id), "load": round(float(load), 6), "capacity": capacity, "utilization": util}
+            for link_id, load, capacity, util in zip(
+                arrays.link_ids[flagged_links].tolist(),
+                link_load[flagged_links],
+                _nan_to_none(link_capacity[flagged_links]),
+                _nan_to_none(link_utilization[flagged_links]),
+            )
+        ],
+        "components": components,
+    }
+
+def _component_bottlenecks(arrays: TopologyArrays, labels: np.ndarray, link_capacity: np.ndarray, max_components: int) -> List[Dict[str, Any]]:
+    """
+    The widest-path bottleneck of each component: the lowest-capacity link of its maximum spanning tree.
+    Any two devices in the component can be joined by a path at least that wide, and that link is what
+    limits the component's weakest cut.
+    """
+    n = len(arrays.device_ids)
+    sizes = np.bincount(labels, minlength=labels.max() + 1 if n else 0)
+    bottleneck_link = np.full(len(sizes), -1, dtype=np.int64)
+    bottleneck_capacity = np.full(len(sizes), np.nan)
+
+    source, target = arrays.link_source, arrays.link_target
+    usable = (source != target) & (link_capacity > 0)
+    if np.any(usable):
+        edges = np.flatnonzero(usable)
+        low, high = np.minimum(source[edges], target[edges]), np.maximum(source[edges], target[edges])
+        # Keep the widest of parallel links, then turn the max spanning tree into a min spanning tree
+        # over positive weights (csgraph treats explicit zeros as missing edges)
+        order = np.lexsort((-link_capacity[edges], high, low))
+        edges, low, high = edges[order], low[order], high[order]
+        first = np.ones(len(edges), dtype=bool)
+        first[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+        edges, low, high = edges[first], low[first], high[first]
+        capacity = link_capacity[edges]
+        weight = capacity.max() + 1.0 - capacity
+
+        tree = minimum_spanning_tree(coo_matrix((weight, (low, high)), shape=(n, n))).tocoo()
+        # Map tree entries back to links; pair keys are unique and already sorted after deduplication
+        pair_keys = low * n + high
+        tree_keys = np.minimum(tree.row, tree.col).astype(np.int64) * n + np.maximum(tree.row, tree.col)
+        tree_edges = np.searchsorted(pair_keys, tree_keys)
+        if len(tree_edges):
+            tree_capacity = capacity[tree_edges]
+            tree_labels = labels[low[tree_edges]]
+            order = np.lexsort((tree_capacity, tree_labels))
+            tree_labels, first_in_component = np.unique(tree_labels[order], return_index=True)
+            bottleneck_link[tree_labels] = arrays.link_ids[edges[tree_edges[order][first_in_component]]]
+            bottleneck_capacity[tree_labels] = tree_capacity[order][first_in_component]
+
+    largest = np.argsort(-sizes, kind="stable")[:max_components]
+    return [
+        {"component": int(label), "device_count": int(sizes[label]),
+         "bottleneck_link_id": None if bottleneck_link[label] < 0 else int(bottleneck_link[label]),
+         "bottleneck_capacity": None if np.isnan(bottleneck_capacity[label]) else float(bottleneck_capacity[label])}
+        for label in largest
+    ]
@@ -0,0 +1,245 @@
+"""
+End-to-end API benchmark: throughput and p50/p99 latency of register/login, project listing,
+full topology save (PUT /projects/{id}/topology/) and topology load (GET /projects/{id}/topology/).
+
+"inprocess" drives the app through the ASGI test client, one request at a time, so the numbers are
+server-side cost without sockets. "uvicorn" starts a local uvicorn with --workers processes and drives
+it with --concurrency concurrent HTTP clients. Each mode runs against a fresh SQLite file.
+
+The results are JSON (stdout, or --output). Pass an earlier result file as --baseline to add the
+p50/p99 ratios against it; the command exits with status 1 when a p99 grew by more than --tolerance.
+Usage: python -m backend.benchmarks.bench_api --shape fat-tree --devices 2000 --mode both --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .bench_db_modes import _free_port, _percentile, _wait_until_up
+from .generators import SHAPES, make_topology
+
+SCENARIOS = ("register_login", "list_projects", "save_topology", "load_topology")
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+class Context:
+    """Requests for each scenario; `i` is the iteration number."""
+
+    def __init__(self, headers: Dict[str, str], project_ids: List[int], topology_body: bytes):
+        self.headers = headers
+        self.project_ids = project_ids
+        self.topology_body = topology_body
+        self.run_id = os.urandom(4).hex() # Keeps register usernames unique across warmup and measured runs
+
+    def requests(self, scenario: str, i: int) -> List[Request]:
+        project_id = self.project_ids[i % len(self.project_ids)]
+        if scenario == "register_login":
+            credentials = {"username": f"bench-{self.run_id}-{i}", "password": "bench"}
+            return [("POST", "/auth/register", {"json": credentials}), ("POST", "/auth/token", {"data": credentials})]
+        if scenario == "list_projects":
+            return [("GET", "/projects/", {"headers": self.headers})]
+        if scenario == "save_topology":
+            headers = {**self.headers, "Content-Type": "application/json"}
+            return [("PUT", f"/projects/{project_id}/topology/", {"headers": headers, "content": self.topology_body})]
+        return [("GET", f"/projects/{project_id}/topology/", {"headers": self.headers})]
+
+def _summary(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "operations": len(latencies),
+        "errors": errors,
+        "operations_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+def _setup(client_call: Callable[..., Any], projects: int, topology_body: bytes) -> Context:
+    credentials = {"username": "bench", "password": "bench"}
+    client_call("POST", "/auth/register", json=credentials).raise_for_status()
+    token = client_call("POST", "/auth/token", data=credentials).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    project_ids = []
+    for i in range(projects):
+        project = client_call("POST", "/projects/", json={"project_name": f"bench-{i}"}, headers=headers)
+        project_ids.append(project.raise_for_status().json()["id"])
+    context = Context(headers, project_ids, topology_body)
+    for project_id in project_ids: # Loads measure a saved topology from the first iteration on
+        client_call("PUT", f"/projects/{project_id}/topology/", **context.requests("save_topology", 0)[0][2]).raise_for_status()
+    return context
+
+def _iterations(args: argparse.Namespace, scenario: str) -> int:
+    # Password hashing is deliberately slow, so register/login gets its own, smaller count
+    return args.auth_iterations if scenario == "register_login" else args.iterations
+
+def _environment(args: argparse.Namespace) -> Dict[str, str]:
+    return {
+        **os.environ,
+        "TOPOLOGY_CACHE_MAX_BYTES": os.environ.get("TOPOLOGY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)) if args.cache else "0",
+        "LOG_LEVEL": "ERROR", # Access logs on the console would dominate small requests
+        "RATE_LIMIT_PER_MINUTE": "0", # The benchmark measures throughput, not the per-user limit
+    }
+
+def run_inprocess(args: argparse.Namespace, topology_body: bytes, database_path: str) -> Dict[str, Any]:
+    # The database and cache are configured at import, so the app is imported only now
+    os.environ.update({**_environment(args), "DATABASE_URL": f"sqlite:///{database_path}"})
+    from fastapi.testclient import TestClient
+    from ..main import app
+
+    results = {}
+    with TestClient(app) as client:
+        context = _setup(client.request, 1, topology_body)
+        for scenario in args.scenarios:
+            def operation(i: int) -> bool:
+                return all(client.request(method, url, **kwargs).status_code < 400
+                           for method, url, kwargs in context.requests(scenario, i))
+
+            for i in range(args.warmup):
+                operation(i)
+            latencies, errors = [], 0
+            started = time.perf_counter()
+            for i in range(_iterations(args, scenario)):
+                request_started = time.perf_counter()
+                errors += not operation(args.warmup + i)
+                latencies.append(time.perf_counter() - request_started)
+            results[scenario] = _summary(latencies, errors, time.perf_counter() - started)
+    return results
+
+async def _drive(client: httpx.AsyncClient, context: Context, scenario: str, iterations: int, concurrency: int,
+                 offset: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(offset, offset + iterations))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in remaining:
+            started = time.perf_counter()
+            try:
+                for method, url, kwargs in context.requests(scenario, i):
+                    response = await client.request(method, url, **kwargs)
+                    if response.status_code >= 400:
+                        errors += 1
+                        break
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summary(latencies, errors, time.perf_counter() - started)
+
+async def _drive_all(base_url: str, context: Context, args: argparse.Namespace) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300.0) as client:
+        for scenario in args.scenarios:
+            await _drive(client, context, scenario, args.warmup, args.concurrency, 0)
+            results[scenario] = await _drive(client, context, scenario, _iterations(args, scenario), args.concurrency, args.warmup)
+    return results
+
+def run_uvicorn(args: argparse.Namespace, topology_body: bytes, database_path: str) -> Dict[str, Any]:
+    env = {**_environment(args), "DATABASE_URL": f"sqlite:///{database_path}"}
+    # Create the schema once up front, as a deployment would, so the workers start on a current schema
+    subprocess.run([sys.executable, "-m", "backend.migrations"], env=env, check=True)
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        _wait_until_up(base_url)
+        with httpx.Client(base_url=base_url, timeout=300.0) as client:
+            # One project per concurrent client, so saves do not all queue on the same rows
+            context = _setup(client.request, args.concurrency, topology_body)
+        return asyncio.run(_drive_all(base_url, context, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Adds p50/p99 ratios against the baseline to each scenario; returns the scenarios whose p99 regressed."""
+    regressions = []
+    for mode, scenarios in results["results"].items():
+        for scenario, current in scenarios.items():
+            previous = baseline.get("results", {}).get(mode, {}).get(scenario)
+            if not previous:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                current[key.replace("_ms", "_ratio")] = round(current[key] / max(previous[key], 1e-3), 2)
+            if current["p99_ratio"] > 1 + tolerance:
+                regressions.append(f"{mode}/{scenario}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Topology API throughput and latency benchmark")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "both"], default="both")
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="fat-tree")
+    parser.add_argument("--devices", type=int, default=1000, help="approximate device count of the saved topology")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--auth-iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients against uvicorn")
+    parser.add_argument("--cache", action="store_true", help="keep the topology response cache enabled")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p99 growth over the baseline")
+    args = parser.parse_args()
+
+    topology = make_topology(args.shape, args.devices, args.seed)
+    topology_body = json.dumps(topology).encode()
+    results: Dict[str, Any] = {
+        "config": {
+            **{key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "topology_devices": len(topology["devices"]),
+            "topology_links": len(topology["links"]),
+            "topology_bytes": len(topology_body),
+        },
+        "environment": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.mode in ("uvicorn", "both"):
+            results["results"]["uvicorn"] = run_uvicorn(args, topology_body, os.path.join(tmp, "uvicorn.db"))
+        if args.mode in ("inprocess", "both"):
+            results["results"]["inprocess"] = run_inprocess(args, topology_body, os.path.join(tmp, "inprocess.db"))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        results["regressions"] = regressions
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as result_file:
+            result_file.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares the ORM full-replace path (PUT /topology/) with the batched bulk import path (POST /topology/import).
+Usage: python -m backend.benchmarks.bench_bulk_import --devices 50000 --links 100000 [--skip-orm]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import crud, models, schemas
+from ..database import Base
+from .generators import random_topology
+
+def _session_factory(path: str):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _make_project(SessionLocal) -> tuple:
+    with SessionLocal() as db:
+        user = models.User(username="bench", password_hash="x")
+        db.add(user)
+        db.flush()
+        project = models.Project(project_name="bench", user_id=user.id)
+        db.add(project)
+        db.commit()
+        return project.id, user.id
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk topology import benchmark")
+    parser.add_argument("--devices", type=int, default=50000)
+    parser.add_argument("--links", type=int, default=100000)
+    parser.add_argument("--skip-orm", action="store_true", help="only time the bulk path")
+    args = parser.parse_args()
+
+    raw = random_topology(args.devices, args.links)
+    topology_data = schemas.TopologyData.model_validate(raw)
+    results = {"devices": args.devices, "links": args.links}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        SessionLocal = _session_factory(os.path.join(tmp, "bench.db"))
+        project_id, user_id = _make_project(SessionLocal)
+
+        with SessionLocal() as db:
+            start = time.perf_counter()
+            summary = crud.bulk_import_project_topology(db, project_id, user_id, topology_data)
+            results["bulk_seconds"] = round(time.perf_counter() - start, 3)
+            results["bulk_summary"] = summary.model_dump()
+
+        if not args.skip_orm:
+            with SessionLocal() as db:
+                start = time.perf_counter()
+                crud.update_project_topology(db, project_id, user_id, topology_data)
+                results["orm_seconds"] = round(time.perf_counter() - start, 3)
+            results["speedup"] = round(results["orm_seconds"] / results["bulk_seconds"], 1)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Load benchmark comparing the sync (thread pool) and async (DB_ASYNC=1) database modes.
+Starts a local uvicorn worker per mode against a fresh SQLite file, then drives it with many concurrent
+clients polling the topology and project listing, and reports throughput and latency percentiles.
+Usage: python -m backend.benchmarks.bench_db_modes --concurrency 200 --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from .generators import random_topology
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _wait_until_up(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + "/", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+def _seed(base_url: str, devices: int, links: int) -> Dict[str, str]:
+    with httpx.Client(base_url=base_url, timeout=120.0) as client:
+        client.post("/auth/register", json={"username": "bench", "password": "bench"})
+        token = client.post("/auth/token", data={"username": "bench", "password": "bench"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        project_id = client.post("/projects/", json={"project_name": "bench"}, headers=headers).json()["id"]
+        client.post(f"/projects/{project_id}/topology/import", json=random_topology(devices, links), headers=headers).raise_for_status()
+    return {"headers": headers, "project_id": project_id}
+
+async def _drive(base_url: str, seed: dict, concurrency: int, total_requests: int) -> dict:
+    paths = [f"/projects/{seed['project_id']}/topology/", "/projects/", f"/projects/{seed['project_id']}"]
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total_requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=seed["headers"], limits=limits, timeout=60.0) as client:
+        async def worker() -> None:
+            nonlocal errors
+            for i in remaining:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(paths[i % len(paths)])
+                    errors += response.status_code != 200
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "requests_per_second": round(total_requests / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def run_mode(async_mode: bool, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        port = _free_port()
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            "DB_ASYNC": "1" if async_mode else "0",
+            "TOPOLOGY_CACHE_MAX_BYTES": "0", # Measure the database path, not cache hits
+            "RATE_LIMIT_PER_MINUTE": "0", # All clients share one user, who would be throttled otherwise
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            _wait_until_up(base_url)
+            seed = _seed(base_url, args.devices, args.links)
+            return asyncio.run(_drive(base_url, seed, args.concurrency, args.requests))
+        finally:
+            server.terminate()
+            server.wait()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync vs async database mode load benchmark")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--links", type=int, default=400)
+    args = parser.parse_args()
+
+    results = {"concurrency": args.concurrency, "devices": args.devices, "links": args.links}
+    results["sync"] = run_mode(False, args)
+    results["async"] = run_mode(True, args)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Graph index build time and warm query latency (p50/p99) for path, neighbourhood and failure queries.
+Usage: python -m backend.benchmarks.bench_graph --shape mesh --devices 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from .. import crud, graph
+from .bench_bulk_import import _make_project, _session_factory
+from .bench_db_modes import _percentile
+from .generators import SHAPES, make_topology
+
+def _timed(query: Callable[[int], object], count: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    for i in range(count):
+        start = time.perf_counter()
+        query(i)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Graph index query benchmark")
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="mesh")
+    parser.add_argument("--devices", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--hops", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    topology = make_topology(args.shape, args.devices, args.seed)
+    results = {"shape": args.shape, "devices": len(topology["devices"]), "links": len(topology["links"])}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        SessionLocal = _session_factory(os.path.join(tmp, "bench.db"))
+        project_id, user_id = _make_project(SessionLocal)
+        with SessionLocal() as db:
+            crud.bulk_import_topology_rows(db, project_id, user_id, **topology)
+            start = time.perf_counter()
+            index = graph.build_graph_index(db, project_id)
+            results["build_seconds"] = round(time.perf_counter() - start, 3)
+    results["index_bytes"] = index.nbytes
+
+    rng = random.Random(args.seed)
+    device_ids = index.device_ids.tolist()
+    pairs = [(rng.choice(device_ids), rng.choice(device_ids)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    index.critical_elements()
+    results["critical_elements_seconds"] = round(time.perf_counter() - start, 3)
+    index.components()
+
+    results["path_hops"] = _timed(lambda i: index.shortest_path(*pairs[i], "hops"), args.queries)
+    results["path_capacity"] = _timed(lambda i: index.shortest_path(*pairs[i], "capacity"), args.queries)
+    results["neighborhood"] = _timed(lambda i: index.neighborhood(pairs[i][0], args.hops, 10000), args.queries)
+    results["critical"] = _timed(lambda i: index.critical(1000), args.queries)
+    results["failure"] = _timed(lambda i: index.failure_impact([pairs[i][0]], [], 1000), args.queries)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
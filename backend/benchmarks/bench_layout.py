@@ -0,0 +1,67 @@
+"""
+Layout time for the force-directed and hierarchical algorithms, from a fresh and from an incremental start,
+with link length and nearest-neighbour spacing of the result as quality indicators.
+Usage: python -m backend.benchmarks.bench_layout --shape fat-tree --devices 20000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .. import crud, layout
+from .bench_bulk_import import _make_project, _session_factory
+from .generators import SHAPES, make_topology
+
+def _quality(graph: layout.LayoutGraph, positions: np.ndarray, spacing: float) -> Dict[str, Any]:
+    lengths = np.sqrt(((positions[graph.link_source] - positions[graph.link_target]) ** 2).sum(axis=1))
+    nearest = cKDTree(positions).query(positions, k=2)[0][:, 1]
+    return {
+        "link_length_p50": round(float(np.median(lengths)) / spacing, 2) if len(lengths) else None,
+        "nearest_p50": round(float(np.median(nearest)) / spacing, 2),
+        "nearest_p5": round(float(np.percentile(nearest, 5)) / spacing, 2),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Server-side layout benchmark")
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="fat-tree")
+    parser.add_argument("--devices", type=int, default=20000)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--spacing", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    topology = make_topology(args.shape, args.devices, args.seed)
+    results: Dict[str, Any] = {"shape": args.shape, "devices": len(topology["devices"]), "links": len(topology["links"])}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        SessionLocal = _session_factory(os.path.join(tmp, "bench.db"))
+        project_id, user_id = _make_project(SessionLocal)
+        with SessionLocal() as db:
+            crud.bulk_import_topology_rows(db, project_id, user_id, **topology)
+            start = time.perf_counter()
+            graph = layout.load_layout_graph(db, project_id)
+            results["load_seconds"] = round(time.perf_counter() - start, 3)
+
+            for algorithm in ("force", "hierarchical"):
+                # "incremental" starts from the positions the generator stored
+                for incremental in (False, True):
+                    start = time.perf_counter()
+                    positions = layout.compute_layout(graph, algorithm, [], args.iterations, args.spacing, incremental, args.seed)
+                    name = f"{algorithm}{'_incremental' if incremental else ''}"
+                    results[name] = {"seconds": round(time.perf_counter() - start, 3), **_quality(graph, positions, args.spacing)}
+
+            options = {"algorithm": "force", "pinned_device_ids": [], "iterations": args.iterations,
+                       "spacing": args.spacing, "incremental": False, "seed": args.seed}
+            start = time.perf_counter()
+            _, positions, _ = layout.layout_project(db, project_id, options)
+            crud.update_device_positions(db, project_id, user_id, positions)
+            results["end_to_end_seconds"] = round(time.perf_counter() - start, 3)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
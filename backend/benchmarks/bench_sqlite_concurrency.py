@@ -0,0 +1,141 @@
+"""
+Read throughput while topology saves are in flight, with and without the SQLite performance profile.
+"default" is the original setup: rollback journal, no pragmas, writers racing for the lock.
+"tuned" applies database.configure_sqlite and routes writes through a WriteQueue.
+Each profile reports the journal mode its connections ended up in and how many saves ran on the queue's
+writer thread, so a run shows the profile was in effect, along with read and save latency percentiles.
+Usage: python -m backend.benchmarks.bench_sqlite_concurrency --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from .. import crud, database, models, schemas
+from ..database import Base
+from .generators import random_topology
+
+def _setup(path: str, tuned: bool, devices: int, links: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        database.configure_sqlite(engine)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as db:
+        user = models.User(username="bench", password_hash="x")
+        db.add(user)
+        db.flush()
+        project = models.Project(project_name="bench", user_id=user.id)
+        db.add(project)
+        db.commit()
+        project_id, user_id = project.id, user.id
+        crud.bulk_import_topology_rows(db, project_id, user_id, **random_topology(devices, links))
+        device_ids = [row[0] for batch in crud.iter_project_device_rows(db, project_id) for row in batch]
+    return engine, SessionLocal, project_id, user_id, device_ids
+
+def _percentile(samples: list, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+
+def run_profile(tuned: bool, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, SessionLocal, project_id, user_id, device_ids = _setup(
+            os.path.join(tmp, "bench.db"), tuned, args.devices, args.links
+        )
+        queue = database.WriteQueue(
+            sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False), serialize=True
+        )
+        with engine.connect() as conn:
+            journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+        counts = {"reads": 0, "read_errors": 0, "writes": 0, "write_errors": 0, "queued_writes": 0}
+        latencies = {"reads": [], "writes": []}
+        lock = threading.Lock()
+        stop = time.monotonic() + args.seconds
+
+        def bump(key: str, started_at: float = None) -> None:
+            with lock:
+                counts[key] += 1
+                if started_at is not None:
+                    latencies[key].append(time.perf_counter() - started_at)
+
+        def reader() -> None:
+            while time.monotonic() < stop:
+                started_at = time.perf_counter()
+                try:
+                    with SessionLocal() as db:
+                        for _ in crud.iter_project_device_rows(db, project_id):
+                            pass
+                        for _ in crud.iter_project_link_rows(db, project_id):
+                            pass
+                    bump("reads", started_at)
+                except OperationalError:
+                    bump("read_errors")
+
+        def save(db, changeset):
+            if threading.current_thread().name.startswith("db-writer"):
+                bump("queued_writes")
+            return crud.apply_topology_changeset(db, project_id, user_id, changeset)
+
+        def writer(seed: int) -> None:
+            rng = random.Random(seed)
+            while time.monotonic() < stop:
+                changeset = schemas.TopologyChangeset(updated_devices=[
+                    {"id": device_id, "properties": {"x_position": rng.random() * 1000, "y_position": rng.random() * 1000}}
+                    for device_id in rng.sample(device_ids, args.changes)
+                ])
+                started_at = time.perf_counter()
+                try:
+                    if tuned:
+                        queue.run(save, changeset)
+                    else:
+                        with SessionLocal() as db:
+                            save(db, changeset)
+                    bump("writes", started_at)
+                except OperationalError:
+                    bump("write_errors")
+
+        threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    return {
+        "journal_mode": journal_mode,
+        **counts,
+        "reads_per_second": round(counts["reads"] / args.seconds, 1),
+        "writes_per_second": round(counts["writes"] / args.seconds, 1),
+        "read_p50_ms": _percentile(latencies["reads"], 0.50),
+        "read_p99_ms": _percentile(latencies["reads"], 0.99),
+        "write_p50_ms": _percentile(latencies["writes"], 0.50),
+        "write_p99_ms": _percentile(latencies["writes"], 0.99),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SQLite read/write concurrency benchmark")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--links", type=int, default=4000)
+    parser.add_argument("--changes", type=int, default=50, help="devices moved per save")
+    args = parser.parse_args()
+
+    results = {"readers": args.readers, "writers": args.writers, "seconds": args.seconds}
+    results["default"] = run_profile(False, args)
+    results["tuned"] = run_profile(True, args)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
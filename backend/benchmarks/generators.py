@@ -0,0 +1,109 @@
+# Synthetic topology generators shared by the benchmark scripts.
+# Output matches schemas.TopologyData so it can be posted to the API or fed to crud directly.
+import math
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEVICE_TYPES = ["Router", "Switch", "PC", "Server", "Firewall"]
+
+Topology = Dict[str, List[Dict[str, Any]]]
+
+def _device(index: int, rng: random.Random, device_type: Optional[str] = None,
+            position: Optional[Tuple[float, float]] = None) -> Dict[str, Any]:
+    num_ports = rng.choice([1, 4, 8, 24, 48])
+    throughput_per_port = rng.choice([100, 1000, 10000])
+    x, y = position if position is not None else (rng.random() * 10000, rng.random() * 10000)
+    return {
+        "client_id": f"d{index}",
+        "name": f"Device-{index}",
+        "device_type": device_type or rng.choice(DEVICE_TYPES),
+        "properties": {
+            "num_ports": num_ports,
+            "total_bandwidth": num_ports * throughput_per_port,
+            "throughput_per_port": throughput_per_port,
+            "estimated_load": round(rng.random() * num_ports * throughput_per_port, 2),
+            "x_position": round(x, 1),
+            "y_position": round(y, 1),
+        },
+    }
+
+def _link(source: int, target: int) -> Dict[str, Any]:
+    return {"source_device_client_id": f"d{source}", "target_device_client_id": f"d{target}"}
+
+def random_topology(num_devices: int, num_links: int, seed: int = 0) -> Topology:
+    """Devices with realistic properties joined by uniformly random links."""
+    rng = random.Random(seed)
+    devices = [_device(i, rng) for i in range(num_devices)]
+    links = []
+    for _ in range(num_links if num_devices > 1 else 0):
+        source, target = rng.sample(range(num_devices), 2)
+        links.append(_link(source, target))
+    return {"devices": devices, "links": links}
+
+def star_topology(num_devices: int, seed: int = 0) -> Topology:
+    """One central switch with every other device attached to it, laid out on a circle."""
+    rng = random.Random(seed)
+    devices = [_device(0, rng, "Switch", (5000.0, 5000.0))]
+    for i in range(1, num_devices):
+        angle = 2 * math.pi * i / max(num_devices - 1, 1)
+        devices.append(_device(i, rng, rng.choice(["PC", "Server"]), (5000 + 4500 * math.cos(angle), 5000 + 4500 * math.sin(angle))))
+    return {"devices": devices, "links": [_link(0, i) for i in range(1, num_devices)]}
+
+def fat_tree_topology(k: int, seed: int = 0) -> Topology:
+    """k-ary fat tree (k even): (k/2)^2 core switches, k pods of k/2 aggregation and k/2 edge switches,
+    and k/2 servers per edge switch, i.e. 5k^2/4 switches and k^3/4 servers."""
+    if k < 2 or k % 2:
+        raise ValueError("k must be an even number >= 2")
+    rng = random.Random(seed)
+    half = k // 2
+    devices: List[Dict[str, Any]] = []
+    links: List[Dict[str, Any]] = []
+
+    def add(device_type: str, layer: int, slot: float, slots: int) -> int:
+        index = len(devices)
+        devices.append(_device(index, rng, device_type, (10000 * (slot + 0.5) / slots, 1000 + 2500 * layer)))
+        return index
+
+    core = [add("Router", 0, i, half * half) for i in range(half * half)]
+    for pod in range(k):
+        aggregation = [add("Switch", 1, pod * half + i, k * half) for i in range(half)]
+        edge = [add("Switch", 2, pod * half + i, k * half) for i in range(half)]
+        for i, agg in enumerate(aggregation):
+            links.extend(_link(core[i * half + j], agg) for j in range(half))
+            links.extend(_link(agg, switch) for switch in edge)
+        for i, switch in enumerate(edge):
+            for j in range(half):
+                links.append(_link(switch, add("Server", 3, (pod * half + i) * half + j, k * half * half)))
+    return {"devices": devices, "links": links}
+
+def fat_tree_k(num_devices: int) -> int:
+    """Smallest even k whose fat tree has at least num_devices devices."""
+    k = 2
+    while 5 * k * k // 4 + k ** 3 // 4 < num_devices:
+        k += 2
+    return k
+
+def mesh_topology(num_devices: int, seed: int = 0) -> Topology:
+    """Routers on a square grid, each linked to its right and lower neighbour."""
+    rng = random.Random(seed)
+    side = max(1, math.ceil(math.sqrt(num_devices)))
+    spacing = 10000 / side
+    devices = [_device(i, rng, "Router", ((i % side + 0.5) * spacing, (i // side + 0.5) * spacing)) for i in range(num_devices)]
+    links = []
+    for i in range(num_devices):
+        if (i + 1) % side and i + 1 < num_devices:
+            links.append(_link(i, i + 1))
+        if i + side < num_devices:
+            links.append(_link(i, i + side))
+    return {"devices": devices, "links": links}
+
+SHAPES: Dict[str, Callable[[int, int], Topology]] = {
+    "random": lambda num_devices, seed: random_topology(num_devices, 2 * num_devices, seed),
+    "star": star_topology,
+    "fat-tree": lambda num_devices, seed: fat_tree_topology(fat_tree_k(num_devices), seed),
+    "mesh": mesh_topology,
+}
+
+def make_topology(shape: str, num_devices: int, seed: int = 0) -> Topology:
+    """Topology of the given shape with about num_devices devices (fat trees round up to the next k)."""
+    return SHAPES[shape](num_devices, seed)
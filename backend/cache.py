@@ -0,0 +1,360 @@
+# Caches and HTTP conditional-request helpers.
+#
+# CACHE_BACKEND selects where the topology and user caches live:
+#   memory  per-process LRU/TTL caches (the default, right for a single worker)
+#   sqlite  a cache database file that the workers of one host share (CACHE_PATH), a local stand-in for Redis
+#   redis   a Redis-compatible server at CACHE_URL (needs the optional redis package)
+# With several workers, per-process caches hold one copy per worker, and a change made through one worker
+# (a new user, say) stays invisible to the others until their entries expire. The shared backends also
+# hold the rate limiter's token buckets (see ratelimit.py). Analysis results and the NumPy-backed spatial
+# and graph indexes stay in process. Like the topology cache they are keyed by crud.project_topology_key,
+# which changes with every write and differs between a deleted project and a new one that reuses its id,
+# so an entry another worker did not invalidate is never served.
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+try:
+    import redis
+except ImportError: # redis is optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(tempfile.gettempdir(), "network-topology-cache.db"))
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024))) # sqlite backend only
+
+class LRUByteCache:
+    """
+    Thread-safe LRU cache bounded by total size: least recently used entries are evicted beyond max_bytes.
+    Values are encoded payloads by default; pass `sizeof` to store other objects (e.g. NumPy-backed indexes).
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return # Would evict everything else and still not fit
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def discard_project(self, project_id: int) -> None:
+        """Drops the entries whose key starts with project_id."""
+        self.discard_where(lambda key: key[0] == project_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+class SQLiteCacheBackend:
+    """
+    Shared cache in a local SQLite file (WAL, so readers do not block each other). Beyond max_bytes the
+    oldest entries are dropped first. Token buckets are updated in IMMEDIATE transactions, which serialize
+    the read-modify-write across processes.
+    """
+    errors: Tuple[type, ...] = (sqlite3.Error,)
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires_at REAL);
+            CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL);
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit, with explicit transactions where needed
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> None:
+        connection = self._connection()
+        expires_at = None if ttl_seconds is None else time.time() + ttl_seconds
+        # REPLACE gives the row a new rowid, so rowid order is write order
+        connection.execute("REPLACE INTO entries (key, value, size, expires_at) VALUES (?, ?, ?, ?)",
+                           (key, value, len(value), expires_at))
+        excess = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM entries WHERE rowid <= (SELECT rowid FROM (SELECT rowid, SUM(size) OVER (ORDER BY rowid) AS freed"
+                " FROM entries) WHERE freed >= ? ORDER BY rowid LIMIT 1)",
+                (excess,),
+            )
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        # A key range rather than LIKE, so the primary key index is used and no escaping is needed
+        self._connection().execute("DELETE FROM entries WHERE key >= ? AND key < ?", (prefix, prefix + "\U0010ffff"))
+
+    def take_token(self, key: str, rate: float, capacity: float) -> float:
+        """Takes a token from the bucket; returns 0, or the seconds until a token is available."""
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            connection.execute("REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                               (key, tokens - 1 if tokens >= 1 else tokens, now))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def clear(self) -> None:
+        connection = self._connection()
+        connection.execute("DELETE FROM entries")
+        connection.execute("DELETE FROM buckets")
+
+# Token bucket update as one atomic server-side step. The refilled count is returned as a string, since
+# Redis truncates Lua numbers to integers in replies.
+_REDIS_TAKE_TOKEN = """
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+class RedisCacheBackend:
+    """Shared cache on a Redis-compatible server; memory is bounded by the server's maxmemory policy and TTLs."""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis needs the redis package")
+        self.errors: Tuple[type, ...] = (redis.RedisError,)
+        self._client = redis.Redis.from_url(url)
+        self._take_token = self._client.register_script(_REDIS_TAKE_TOKEN)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> None:
+        self._client.set(key, value, px=None if ttl_seconds is None else int(ttl_seconds * 1000))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+    def delete_prefix(self, prefix: str) -> None:
+        pattern = "".join("\\" + char if char in "*?[]\\" else char for char in prefix) + "*"
+        keys = list(self._client.scan_iter(match=pattern, count=1000))
+        for start in range(0, len(keys), 1000):
+            self._client.unlink(*keys[start:start + 1000])
+
+    def take_token(self, key: str, rate: float, capacity: float) -> float:
+        return float(self._take_token(keys=[key], args=[rate, capacity, time.time()]))
+
+    def clear(self) -> None:
+        self.delete_prefix("")
+
+def _make_shared_backend():
+    if CACHE_BACKEND == "memory":
+        return None
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCacheBackend(CACHE_PATH, CACHE_MAX_BYTES)
+    if CACHE_BACKEND == "redis":
+        return RedisCacheBackend(CACHE_URL)
+    raise ValueError(f"Unknown CACHE_BACKEND {CACHE_BACKEND!r}; use memory, sqlite or redis")
+
+# None with the memory backend
+shared_backend = _make_shared_backend()
+
+class SharedCache:
+    """
+    Cache on a shared backend with the interface of the in-process caches it stands in for. Tuple keys
+    become "namespace:part:part". Values are bytes, or JSON-encodable objects with json_values. Backend
+    errors are logged and treated as misses, so an unavailable cache server slows requests down rather than
+    failing them.
+    """
+
+    def __init__(self, backend: Any, namespace: str, ttl_seconds: Optional[float] = None,
+                 max_value_bytes: Optional[int] = None, json_values: bool = False):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_value_bytes = max_value_bytes
+        self.json_values = json_values
+
+    def _key(self, key: Hashable) -> str:
+        parts = key if isinstance(key, tuple) else (key,)
+        return ":".join([self.namespace, *map(str, parts)])
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        try:
+            value = self.backend.get(self._key(key))
+        except self.backend.errors:
+            logger.warning("Shared cache read failed", exc_info=True)
+            return None
+        if value is None or not self.json_values:
+            return value
+        return json.loads(value)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        encoded = json.dumps(value).encode() if self.json_values else value
+        if self.max_value_bytes is not None and len(encoded) > self.max_value_bytes:
+            return
+        try:
+            self.backend.set(self._key(key), encoded, self.ttl_seconds)
+        except self.backend.errors:
+            logger.warning("Shared cache write failed", exc_info=True)
+
+    def invalidate(self, key: Hashable) -> None:
+        try:
+            self.backend.delete(self._key(key))
+        except self.backend.errors:
+            logger.warning("Shared cache invalidation failed", exc_info=True)
+
+    def discard_project(self, project_id: int) -> None:
+        try:
+            self.backend.delete_prefix(f"{self.namespace}:{project_id}:")
+        except self.backend.errors:
+            logger.warning("Shared cache invalidation failed", exc_info=True)
+
+    def clear(self) -> None:
+        self.backend.delete_prefix(f"{self.namespace}:")
+
+# Serialized topologies keyed by crud.project_topology_key. Entries of superseded revisions can never be hit
+# again, but crud drops a project's entries on every write so they do not hold on to memory until evicted.
+# In a shared backend they also expire after TOPOLOGY_CACHE_TTL_SECONDS. TOPOLOGY_CACHE_MAX_BYTES=0 disables the cache.
+TOPOLOGY_CACHE_MAX_BYTES = int(os.getenv("TOPOLOGY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+if shared_backend is not None and TOPOLOGY_CACHE_MAX_BYTES > 0:
+    topology_cache = SharedCache(
+        shared_backend, "topology",
+        ttl_seconds=float(os.getenv("TOPOLOGY_CACHE_TTL_SECONDS", "3600")),
+        max_value_bytes=TOPOLOGY_CACHE_MAX_BYTES,
+    )
+else:
+    topology_cache = LRUByteCache(max_bytes=TOPOLOGY_CACHE_MAX_BYTES)
+
+# Analysis results keyed by the topology key plus the options; same invalidation as the topology cache
+analysis_cache = LRUByteCache(max_bytes=int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(16 * 1024 * 1024))))
+
+# Spatial indexes (spatial.GridIndex) keyed by crud.project_topology_key
+spatial_cache = LRUByteCache(
+    max_bytes=int(os.getenv("SPATIAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    sizeof=lambda index: index.nbytes,
+)
+
+# Graph indexes (graph.GraphIndex) keyed by crud.project_topology_key
+graph_cache = LRUByteCache(
+    max_bytes=int(os.getenv("GRAPH_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+    sizeof=lambda index: index.nbytes,
+)
+
+def invalidate_project_topology(project_id: int) -> None:
+    """Drops everything cached from the project's topology."""
+    for derived_cache in (topology_cache, analysis_cache, spatial_cache, graph_cache):
+        derived_cache.discard_project(project_id)
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire ttl_seconds after being set; oldest entries go first beyond max_entries."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+# Authenticated users ({"id", "username"} snapshots) keyed by token subject (username), so protected routes
+# skip the user lookup. The TTL bounds how long a change made outside crud (or, with the memory backend, in
+# another process) can go unnoticed.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+if shared_backend is not None:
+    user_cache = SharedCache(shared_backend, "user", ttl_seconds=USER_CACHE_TTL_SECONDS, json_values=True)
+else:
+    user_cache = TTLCache(ttl_seconds=USER_CACHE_TTL_SECONDS, max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000")))
+
+def invalidate_user(username: str) -> None:
+    user_cache.invalidate(username)
+
+def clear_shared() -> None:
+    """Empties the shared backend, e.g. after the database it caches was created anew."""
+    if shared_backend is not None:
+        shared_backend.clear()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches the (strong) etag."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
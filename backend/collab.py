@@ -0,0 +1,373 @@
+"""
+Real-time collaborative editing of a project's topology over WebSockets.
+
+Clients send small operations (schemas.CollabOperation). Each project has a room that coalesces
+them: drag events only keep the latest position per device, and every COLLAB_TICK_MS the pending
+moves and edits go out to all subscribers as one "batch" message. Persisting is decoupled from the
+broadcast: every COLLAB_PERSIST_MS the accumulated edits are written as a single changeset through
+the write queue, so a drag costs one transaction per interval instead of one per mouse event.
+
+Messages sent to clients:
+    {"type": "hello", "connection_id": ..., "revision": ...}
+    {"type": "batch", "moves": [{"id", "x", "y", "origin"}], "ops": [{..., "origin"}]}
+    {"type": "persisted", "revision": ..., "link_id_map": {client_id: id}}
+    {"type": "error", "detail": ...}
+
+Fan-out goes through a Broker, selected by COLLAB_BROKER:
+    memory  InMemoryBroker, reaches the subscribers of this process only (the default, right for one worker)
+    sqlite  SQLiteBroker, a message table in a local file (COLLAB_BROKER_PATH) that the workers of one host
+            poll every tick; the local stand-in for a broker server
+set_broker() swaps in any other implementation.
+"""
+import abc
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.orm import Session
+
+from . import crud, database, models, schemas, security
+
+logger = logging.getLogger(__name__)
+
+COLLAB_TICK_SECONDS = int(os.getenv("COLLAB_TICK_MS", "30")) / 1000
+COLLAB_PERSIST_SECONDS = int(os.getenv("COLLAB_PERSIST_MS", "1000")) / 1000
+COLLAB_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("COLLAB_SUBSCRIBER_QUEUE_SIZE", "256"))
+COLLAB_BROKER = os.getenv("COLLAB_BROKER", "memory")
+COLLAB_BROKER_PATH = os.getenv("COLLAB_BROKER_PATH", os.path.join(tempfile.gettempdir(), "network-topology-collab.db"))
+
+operation_adapter = TypeAdapter(schemas.CollabOperation)
+
+class Broker(abc.ABC):
+    """Publish/subscribe interface used to fan messages out to the sockets of a project."""
+
+    @abc.abstractmethod
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        """Returns a queue that receives the channel's messages as encoded JSON text."""
+
+    @abc.abstractmethod
+    def unsubscribe(self, channel: str, queue: asyncio.Queue) -> None:
+        """Stops delivering to a queue returned by subscribe."""
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        """Sends a JSON-encodable message to every subscriber of the channel the broker reaches."""
+
+class InMemoryBroker(Broker):
+    """In-process pub/sub with one bounded queue per subscriber."""
+
+    def __init__(self, queue_size: int = COLLAB_SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._channels: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._channels.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue) -> None:
+        subscribers = self._channels.get(channel)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._channels[channel]
+
+    def _deliver(self, channel: str, payload: str) -> None:
+        for queue in list(self._channels.get(channel, ())):
+            if queue.full():
+                # A subscriber that cannot keep up loses its oldest message rather than stalling the room
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        # Messages are encoded once and shared by all subscribers
+        self._deliver(channel, json.dumps(message))
+
+class SQLiteBroker(InMemoryBroker):
+    """
+    Pub/sub between the processes of one host through a message table in a local SQLite file (WAL, so
+    polling readers do not block publishers). Published messages are appended to the table; while this
+    process has subscribers, a task fetches the messages appended since its last poll every poll_seconds
+    and hands them to its local queues. Messages older than retention_seconds are deleted.
+    """
+
+    def __init__(self, path: str, poll_seconds: float = COLLAB_TICK_SECONDS, retention_seconds: float = 60.0,
+                 queue_size: int = COLLAB_SUBSCRIBER_QUEUE_SIZE):
+        super().__init__(queue_size)
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        # One connection used from worker threads, one statement at a time
+        self._connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL,"
+                " payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        self._last_id = 0
+        self._poller: Optional[asyncio.Task] = None
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = super().subscribe(channel)
+        if self._poller is None or self._poller.done():
+            # Deliver the messages published from now on
+            self._last_id = self._execute("SELECT COALESCE(MAX(id), 0) FROM messages")[0][0]
+            self._poller = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue) -> None:
+        super().unsubscribe(channel, queue)
+        if not self._channels and self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        # Delivered to the local subscribers too by the next poll, in the same order as everyone else's
+        await asyncio.to_thread(
+            self._execute, "INSERT INTO messages (channel, payload, created_at) VALUES (?, ?, ?)",
+            (channel, json.dumps(message), time.time()),
+        )
+
+    async def _poll(self) -> None:
+        polls_per_cleanup = max(1, round(self.retention_seconds / self.poll_seconds))
+        for poll in itertools.count(1):
+            try:
+                rows = await asyncio.to_thread(
+                    self._execute, "SELECT id, channel, payload FROM messages WHERE id > ? ORDER BY id", (self._last_id,)
+                )
+                for message_id, channel, payload in rows:
+                    self._deliver(channel, payload)
+                    self._last_id = message_id
+                if poll % polls_per_cleanup == 0:
+                    await asyncio.to_thread(
+                        self._execute, "DELETE FROM messages WHERE created_at < ?", (time.time() - self.retention_seconds,)
+                    )
+            except sqlite3.Error:
+                logger.warning("Collaboration broker poll failed", exc_info=True)
+            await asyncio.sleep(self.poll_seconds)
+
+def _make_broker() -> Broker:
+    if COLLAB_BROKER == "memory":
+        return InMemoryBroker()
+    if COLLAB_BROKER == "sqlite":
+        return SQLiteBroker(COLLAB_BROKER_PATH)
+    raise ValueError(f"Unknown COLLAB_BROKER {COLLAB_BROKER!r}; use memory or sqlite")
+
+broker: Broker = _make_broker()
+
+def set_broker(new_broker: Broker) -> None:
+    global broker
+    broker = new_broker
+
+def project_channel(project_id: int) -> str:
+    return f"project:{project_id}"
+
+class PendingEdits:
+    """One user's edits of a project waiting to be persisted."""
+
+    def __init__(self):
+        self.devices: Dict[int, schemas.DeviceUpdate] = {}
+        self.added_links: List[schemas.LinkChangeCreate] = []
+        self.removed_link_ids: Set[int] = set()
+
+    def device_update(self, device_id: int) -> schemas.DeviceUpdate:
+        update = self.devices.get(device_id)
+        if update is None:
+            update = self.devices[device_id] = schemas.DeviceUpdate(id=device_id)
+        return update
+
+def apply_edits(db: Session, project_id: int, user_id: int, edits: PendingEdits) -> Optional[schemas.TopologyChangesetResult]:
+    """
+    Writes one user's edits as a changeset, without the edits of devices and links that no longer exist
+    (or never did). Returns None when nothing is left to write or the user may not edit the project.
+    """
+    device_ids = crud.existing_row_ids(db, models.Device, project_id, itertools.chain(
+        edits.devices, *((link.source_device_id, link.target_device_id) for link in edits.added_links)
+    ))
+    link_ids = crud.existing_row_ids(db, models.Link, project_id, edits.removed_link_ids)
+    db.rollback() # End the read transaction; the write starts its own with the revision bump
+    changeset = schemas.TopologyChangeset(
+        updated_devices=[update for device_id, update in edits.devices.items() if device_id in device_ids],
+        added_links=[
+            link for link in edits.added_links
+            if link.source_device_id in device_ids and link.target_device_id in device_ids
+        ],
+        removed_link_ids=sorted(link_ids),
+    )
+    if not changeset.updated_devices and not changeset.added_links and not changeset.removed_link_ids:
+        return None
+    return crud.apply_topology_changeset(db, project_id, user_id, changeset)
+
+class ProjectRoom:
+    """Pending edits of one project plus the tick task that broadcasts and persists them."""
+
+    def __init__(self, project_id: int):
+        self.project_id = project_id
+        self.connections = 0
+        # Broadcast state, flushed every tick
+        self.pending_moves: Dict[int, Dict[str, Any]] = {}
+        self.pending_ops: List[Dict[str, Any]] = []
+        # Persist state by the user who made the edits, flushed every persist interval
+        self.pending_edits: Dict[int, PendingEdits] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._persisting: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_broadcast()
+        if self._persisting is not None:
+            await self._persisting
+        await self.persist()
+
+    def submit(self, origin: str, user_id: int, op: Any) -> None:
+        """Queues a validated operation of a user for the next broadcast and persist."""
+        edits = self.pending_edits.get(user_id)
+        if edits is None:
+            edits = self.pending_edits[user_id] = PendingEdits()
+        if isinstance(op, schemas.MoveDeviceOp):
+            # Only the latest position of a device survives until the next tick
+            self.pending_moves[op.id] = {"id": op.id, "x": op.x, "y": op.y, "origin": origin}
+            update = edits.device_update(op.id)
+            update.properties = {**(update.properties or {}), "x_position": op.x, "y_position": op.y}
+            return
+
+        self.pending_ops.append({**op.model_dump(exclude_none=True), "origin": origin})
+        if isinstance(op, schemas.UpdateDeviceOp):
+            update = edits.device_update(op.id)
+            if op.name is not None:
+                update.name = op.name
+            if op.device_type is not None:
+                update.device_type = op.device_type
+            if op.properties:
+                update.properties = {**(update.properties or {}), **op.properties}
+        elif isinstance(op, schemas.AddLinkOp):
+            edits.added_links.append(schemas.LinkChangeCreate(
+                client_id=op.client_id,
+                source_device_id=op.source_device_id,
+                target_device_id=op.target_device_id,
+                source_port=op.source_port,
+                target_port=op.target_port,
+            ))
+        elif isinstance(op, schemas.RemoveLinkOp):
+            edits.removed_link_ids.add(op.id)
+
+    async def flush_broadcast(self) -> None:
+        if not self.pending_moves and not self.pending_ops:
+            return
+        message = {"type": "batch", "moves": list(self.pending_moves.values()), "ops": self.pending_ops}
+        self.pending_moves = {}
+        self.pending_ops = []
+        await broker.publish(project_channel(self.project_id), message)
+
+    async def persist(self) -> None:
+        """Writes the accumulated edits as one changeset per user (last writer wins, no base_revision check)."""
+        pending, self.pending_edits = self.pending_edits, {}
+        for user_id, edits in pending.items():
+            try:
+                result = await database.write_queue.run_async(apply_edits, self.project_id, user_id, edits)
+            except Exception:
+                logger.exception("Could not persist collaborative edits of project %s", self.project_id)
+                await broker.publish(project_channel(self.project_id), {"type": "error", "detail": "Edits could not be saved"})
+                continue
+            if result is not None:
+                await broker.publish(project_channel(self.project_id), {
+                    "type": "persisted", "revision": result.revision, "link_id_map": result.link_id_map,
+                })
+
+    def _persist_in_background(self) -> None:
+        # A slow write must not hold up the broadcasts; the next one waits for it to finish
+        if self._persisting is None or self._persisting.done():
+            self._persisting = asyncio.create_task(self.persist())
+
+    async def _run(self) -> None:
+        ticks_per_persist = max(1, round(COLLAB_PERSIST_SECONDS / COLLAB_TICK_SECONDS))
+        for tick in itertools.count(1):
+            await asyncio.sleep(COLLAB_TICK_SECONDS)
+            await self.flush_broadcast()
+            if tick % ticks_per_persist == 0:
+                self._persist_in_background()
+
+rooms: Dict[int, ProjectRoom] = {}
+_connection_ids = itertools.count(1)
+
+async def _forward(websocket: WebSocket, queue: asyncio.Queue) -> None:
+    while True:
+        await websocket.send_text(await queue.get())
+
+async def serve(websocket: WebSocket, project_id: int, user_id: int, revision: int) -> None:
+    """Runs one accepted collaboration socket until the client disconnects."""
+    connection_id = str(next(_connection_ids))
+    room = rooms.get(project_id)
+    if room is None:
+        room = rooms[project_id] = ProjectRoom(project_id)
+    room.connections += 1
+    room.start()
+    channel = project_channel(project_id)
+    queue = broker.subscribe(channel)
+    forwarder = asyncio.create_task(_forward(websocket, queue))
+    try:
+        await websocket.send_json({"type": "hello", "connection_id": connection_id, "revision": revision})
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+            if message.get("text") is None:
+                # Operations are JSON text frames
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                break
+            try:
+                # Malformed JSON fails validation like a malformed operation does
+                op = operation_adapter.validate_json(message["text"])
+            except ValidationError as exc:
+                await websocket.send_json({"type": "error", "detail": exc.errors(include_url=False)})
+                continue
+            room.submit(connection_id, user_id, op)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        broker.unsubscribe(channel, queue)
+        room.connections -= 1
+        if room.connections == 0 and rooms.get(project_id) is room:
+            del rooms[project_id]
+            await room.stop()
+
+async def authenticate(token: str, project_id: int):
+    """Returns (user, project revision) for a token that may edit the project, or None."""
+    try:
+        token_data = security.decode_access_token(token, ValueError("invalid token"))
+    except ValueError:
+        return None
+    async with database.open_db_runner() as db:
+        user = await security.get_user_cached(token_data.username, db)
+        if user is None:
+            return None
+        version = await db.run(crud.get_project_version, project_id=project_id, user_id=user.id)
+    if version is None:
+        return None
+    return user, version[0]
@@ -0,0 +1,383 @@
+# Columnar binary topology format (".ntopo") for exports and bulk imports.
+# A topology is stored struct-of-arrays: one NumPy column per field instead of one JSON object per row,
+# so repeated keys disappear, device types are dictionary-encoded and coordinates/endpoints are plain
+# float64/int64 arrays. The file layout is
+#
+#     b"NTOPO\x00\x01\x00"   magic + format version
+#     uint64 (little endian)   header length
+#     header                   JSON: codec, row counts, device type dictionary, column directory
+#     padding to 64 bytes
+#     column data              each column starts on a 64-byte boundary
+#
+# Column offsets in the header are relative to the start of the column data. The writer consumes the rows
+# once, batch by batch, appending each batch's slice of every column to that column's temporary file, and
+# then copies the files after the header, so its memory use does not grow with the topology. With codec "none" the
+# reader serves every column as a zero-copy view of a memory-mapped file, so multi-hundred-MB exports are
+# read without loading them; with "zstd" (needs the optional zstandard package) or "zlib" each column is
+# compressed separately and only decompressed when read.
+#
+# String columns are stored as three arrays: "<name>.offsets" (int64, rows + 1), "<name>.data" (UTF-8
+# bytes) and "<name>.null" (uint8, 1 where the value is None). Numeric device properties listed in
+# models.DEVICE_PROPERTY_COLUMNS get float64 columns (NaN when absent); the remaining properties are
+# kept as JSON text in "device_properties", so a round trip preserves every property. Numbers come back
+# as the column's Python type (int for num_ports, float otherwise); values that type cannot represent
+# exactly stay in the JSON text.
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from . import models, serialization
+
+try:
+    import zstandard
+except ImportError: # zstandard is optional
+    zstandard = None
+
+MAGIC = b"NTOPO\x00\x01\x00"
+MEDIA_TYPE = "application/vnd.network-topology"
+ALIGNMENT = 64
+CODECS = ("none", "zlib", "zstd") if zstandard is not None else ("none", "zlib")
+ROW_BATCH_SIZE = 5000
+# Only these dtypes are accepted when reading, so a header cannot make NumPy build object arrays
+ALLOWED_DTYPES = {"<i4", "<i8", "<f8", "|u1"}
+# Largest .ntopo body accepted by the import endpoints (the upload is spooled to disk before it is read)
+MAX_UPLOAD_BYTES = int(os.getenv("NTOPO_MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+
+class FormatError(ValueError):
+    """Raised for files that are not valid .ntopo data."""
+
+def _compressor(codec: str) -> Optional[Any]:
+    # Streaming compressors: a column compressed chunk by chunk decompresses in one call like a single block
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if codec == "zlib":
+        return zlib.compressobj(6)
+    return None
+
+def _decompress(codec: str, data: memoryview, size: int) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    return zlib.decompress(data, bufsize=size)
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+class _ColumnSpool:
+    """A column being written: chunks are compressed as they are appended and spooled to a temporary file."""
+
+    def __init__(self, dtype: str, codec: str):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.length = 0
+        self.file = tempfile.TemporaryFile()
+        self._compressor = _compressor(codec)
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.length += len(data)
+
+    def append(self, values: Any) -> None:
+        array = np.asarray(values, dtype=self.dtype)
+        self.count += array.size
+        data = array.tobytes()
+        self._write(self._compressor.compress(data) if self._compressor is not None else data)
+
+    def finish(self) -> None:
+        if self._compressor is not None:
+            self._write(self._compressor.flush())
+        self.file.seek(0)
+
+class _StringSpool:
+    """The offsets, data and null columns of a string column (see the layout description above)."""
+
+    def __init__(self, name: str, codec: str):
+        self.columns = {
+            f"{name}.offsets": _ColumnSpool("<i8", codec),
+            f"{name}.data": _ColumnSpool("|u1", codec),
+            f"{name}.null": _ColumnSpool("|u1", codec),
+        }
+        self._offsets, self._data, self._null = self.columns.values()
+        self._end = 0
+        self._offsets.append([0])
+
+    def append(self, values: Sequence[Optional[str]]) -> None:
+        encoded = [value.encode() if value is not None else b"" for value in values]
+        ends = np.cumsum([len(value) for value in encoded], dtype="<i8") + self._end
+        if len(ends):
+            self._end = int(ends[-1])
+        self._offsets.append(ends)
+        self._data.append(np.frombuffer(b"".join(encoded), dtype="|u1"))
+        self._null.append(np.fromiter((value is None for value in values), dtype="|u1", count=len(values)))
+
+def write_topology(
+    fileobj: BinaryIO,
+    device_batches: Iterable[Sequence[Sequence[Any]]],
+    link_batches: Iterable[Sequence[Sequence[Any]]],
+    codec: str = "none",
+) -> None:
+    """
+    Writes rows from crud.iter_project_device_rows / crud.iter_project_link_rows in .ntopo format.
+    Raises ValueError for an unknown or unavailable codec.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec {codec!r}; available: {', '.join(CODECS)}")
+
+    casts = models.DEVICE_PROPERTY_COLUMNS
+    names = _StringSpool("device_name", codec)
+    other_properties = _StringSpool("device_properties", codec)
+    source_ports = _StringSpool("link_source_port", codec)
+    target_ports = _StringSpool("link_target_port", codec)
+    columns: Dict[str, _ColumnSpool] = {
+        "device_id": _ColumnSpool("<i8", codec),
+        "device_type": _ColumnSpool("<i4", codec),
+        **{f"device_{key}": _ColumnSpool("<f8", codec) for key in casts},
+        **names.columns,
+        **other_properties.columns,
+        "link_id": _ColumnSpool("<i8", codec),
+        "link_source": _ColumnSpool("<i8", codec),
+        "link_target": _ColumnSpool("<i8", codec),
+        **source_ports.columns,
+        **target_ports.columns,
+    }
+    # Dictionary-encoded device types, in order of first appearance; -1 stands for None
+    device_types: List[str] = []
+    type_codes: Dict[str, int] = {}
+    try:
+        for batch in device_batches:
+            numeric: Dict[str, List[float]] = {key: [] for key in casts}
+            batch_properties: List[Optional[str]] = []
+            codes: List[int] = []
+            for _device_id, _project_id, _name, device_type, properties in batch:
+                if device_type is not None and device_type not in type_codes:
+                    type_codes[device_type] = len(device_types)
+                    device_types.append(device_type)
+                codes.append(type_codes.get(device_type, -1))
+                properties = serialization.loads(properties) if properties else None
+                if not isinstance(properties, dict):
+                    # null (or a non-object) is kept verbatim in the JSON column
+                    batch_properties.append(None if properties is None else serialization.dumps(properties).decode())
+                    for values in numeric.values():
+                        values.append(np.nan)
+                    continue
+                for key, values in numeric.items():
+                    value = properties.get(key)
+                    # Values the column type would not reproduce exactly (4.5 ports, huge ints) stay in the JSON
+                    if isinstance(value, (int, float)) and not isinstance(value, bool) and casts[key](value) == value == float(value):
+                        values.append(value)
+                        del properties[key]
+                    else:
+                        values.append(np.nan)
+                batch_properties.append(serialization.dumps(properties).decode())
+            columns["device_id"].append([row[0] for row in batch])
+            columns["device_type"].append(codes)
+            for key, values in numeric.items():
+                columns[f"device_{key}"].append(values)
+            names.append([row[2] for row in batch])
+            other_properties.append(batch_properties)
+
+        for batch in link_batches:
+            columns["link_id"].append([row[0] for row in batch])
+            columns["link_source"].append([row[2] for row in batch])
+            columns["link_target"].append([row[3] for row in batch])
+            source_ports.append([row[4] for row in batch])
+            target_ports.append([row[5] for row in batch])
+
+        directory: Dict[str, Dict[str, Any]] = {}
+        offset = 0
+        for name, column in columns.items():
+            column.finish()
+            directory[name] = {"dtype": column.dtype.str, "count": column.count, "offset": offset, "length": column.length}
+            offset = _aligned(offset + column.length)
+
+        header = json.dumps({
+            "codec": codec,
+            "devices": columns["device_id"].count,
+            "links": columns["link_id"].count,
+            "device_types": device_types,
+            "columns": directory,
+        }).encode()
+        preamble = MAGIC + struct.pack("<Q", len(header)) + header
+        fileobj.write(preamble + b"\0" * (_aligned(len(preamble)) - len(preamble)))
+        position = 0
+        for column in columns.values():
+            fileobj.write(b"\0" * (_aligned(position) - position))
+            position = _aligned(position)
+            shutil.copyfileobj(column.file, fileobj)
+            position += column.length
+    finally:
+        for column in columns.values():
+            column.file.close()
+
+class TopologyReader:
+    """
+    Memory-mapped reader of a .ntopo file. The whole header is validated on open, so malformed input
+    raises FormatError before any row is consumed.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < len(MAGIC) + 8:
+                raise FormatError("File is too short")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        try:
+            self._read_header(size)
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self, size: int) -> None:
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise FormatError("Not a .ntopo file or unsupported format version")
+        (header_length,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        header_end = len(MAGIC) + 8 + header_length
+        if header_end > size:
+            raise FormatError("Truncated header")
+        try:
+            header = json.loads(bytes(self._map[len(MAGIC) + 8:header_end]))
+            self.codec: str = header["codec"]
+            self.device_count: int = int(header["devices"])
+            self.link_count: int = int(header["links"])
+            self.device_types: List[str] = list(header["device_types"])
+            self.columns: Dict[str, Dict[str, Any]] = dict(header["columns"])
+        except (ValueError, KeyError, TypeError) as exc:
+            raise FormatError(f"Malformed header: {exc}") from exc
+        if self.codec not in CODECS:
+            raise FormatError(f"Unsupported codec {self.codec!r}")
+        if self.device_count < 0 or self.link_count < 0:
+            raise FormatError("Negative row count")
+
+        self._data_start = _aligned(header_end)
+        self._decompressed: Dict[str, np.ndarray] = {}
+        for name, column in self.columns.items():
+            if not isinstance(column, dict) or column.get("dtype") not in ALLOWED_DTYPES:
+                raise FormatError(f"Column {name} has an unsupported dtype")
+            # Booleans are ints to Python but not valid sizes
+            if not all(type(column.get(key)) is int and column[key] >= 0 for key in ("offset", "count", "length")):
+                raise FormatError(f"Column {name} needs non-negative integer offset, count and length")
+            if self._data_start + column["offset"] + column["length"] > size:
+                raise FormatError(f"Column {name} extends past the end of the file")
+            if self.codec == "none" and column["length"] != column["count"] * np.dtype(column["dtype"]).itemsize:
+                raise FormatError(f"Column {name} has an inconsistent length")
+
+        expected = {"device_id": self.device_count, "device_type": self.device_count,
+                    "link_id": self.link_count, "link_source": self.link_count, "link_target": self.link_count}
+        expected.update({f"device_{key}": self.device_count for key in models.DEVICE_PROPERTY_COLUMNS})
+        for name, count in expected.items():
+            if self.columns.get(name, {}).get("count") != count:
+                raise FormatError(f"Column {name} is missing or has the wrong length")
+        for name, count in (("device_name", self.device_count), ("device_properties", self.device_count),
+                            ("link_source_port", self.link_count), ("link_target_port", self.link_count)):
+            offsets = self.column(f"{name}.offsets")
+            if (offsets.size != count + 1 or self.column(f"{name}.null").size != count
+                    or (count and (offsets[0] != 0 or np.any(np.diff(offsets) < 0)
+                                   or offsets[-1] > self.column(f"{name}.data").size))):
+                raise FormatError(f"String column {name} is malformed")
+        codes = self.column("device_type")
+        if codes.size and (codes.min() < -1 or codes.max() >= len(self.device_types)):
+            raise FormatError("Device type code out of range")
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        The named column: a read-only view of the mapped file when the codec is "none", otherwise
+        decompressed on first access and kept for the lifetime of the reader.
+        """
+        try:
+            column = self.columns[name]
+        except KeyError:
+            raise FormatError(f"Missing column {name}") from None
+        dtype = np.dtype(column["dtype"])
+        start = self._data_start + column["offset"]
+        if self.codec == "none":
+            return np.frombuffer(self._map, dtype=dtype, count=column["count"], offset=start)
+        if name in self._decompressed:
+            return self._decompressed[name]
+        raw_size = column["count"] * dtype.itemsize
+        try:
+            data = _decompress(self.codec, memoryview(self._map)[start:start + column["length"]], raw_size)
+        except Exception as exc:
+            raise FormatError(f"Column {name} could not be decompressed: {exc}") from exc
+        if len(data) != raw_size:
+            raise FormatError(f"Column {name} has an inconsistent length")
+        array = self._decompressed[name] = np.frombuffer(data, dtype=dtype)
+        return array
+
+    def _strings(self, name: str, start: int, stop: int) -> List[Optional[str]]:
+        offsets = self.column(f"{name}.offsets")[start:stop + 1].tolist()
+        nulls = self.column(f"{name}.null")[start:stop].tolist()
+        data = self.column(f"{name}.data")
+        try:
+            return [
+                None if nulls[i] else bytes(data[offsets[i]:offsets[i + 1]]).decode()
+                for i in range(stop - start)
+            ]
+        except UnicodeDecodeError as exc:
+            raise FormatError(f"Invalid text in column {name}: {exc}") from exc
+
+    def iter_devices(self, batch_size: int = ROW_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """Device mappings for crud.bulk_import_topology_rows; client_id is the exported device id."""
+        ids = self.column("device_id")
+        codes = self.column("device_type")
+        numeric = {key: (self.column(f"device_{key}"), cast) for key, cast in models.DEVICE_PROPERTY_COLUMNS.items()}
+        for start in range(0, self.device_count, batch_size):
+            stop = min(start + batch_size, self.device_count)
+            names = self._strings("device_name", start, stop)
+            properties_text = self._strings("device_properties", start, stop)
+            values = {key: (column[start:stop].tolist(), cast) for key, (column, cast) in numeric.items()}
+            for i, (device_id, code) in enumerate(zip(ids[start:stop].tolist(), codes[start:stop].tolist())):
+                try:
+                    properties = serialization.loads(properties_text[i]) if properties_text[i] is not None else None
+                except ValueError as exc:
+                    raise FormatError(f"Invalid properties of device {device_id}: {exc}") from exc
+                if isinstance(properties, dict):
+                    for key, (column, cast) in values.items():
+                        if column[i] == column[i]: # Not NaN
+                            properties[key] = cast(column[i])
+                yield {
+                    "client_id": str(device_id),
+                    "name": names[i],
+                    "device_type": self.device_types[code] if code >= 0 else None,
+                    "properties": properties,
+                }
+
+    def iter_links(self, batch_size: int = ROW_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """Link mappings for crud.bulk_import_topology_rows, referencing devices by exported id."""
+        sources = self.column("link_source")
+        targets = self.column("link_target")
+        for start in range(0, self.link_count, batch_size):
+            stop = min(start + batch_size, self.link_count)
+            source_ports = self._strings("link_source_port", start, stop)
+            target_ports = self._strings("link_target_port", start, stop)
+            for i, (source, target) in enumerate(zip(sources[start:stop].tolist(), targets[start:stop].tolist())):
+                yield {
+                    "source_device_client_id": str(source),
+                    "target_device_client_id": str(target),
+                    "source_port": source_ports[i],
+                    "target_port": target_ports[i],
+                }
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass # Column views are still alive; the mapping is released once they are collected
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "TopologyReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
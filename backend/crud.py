@@ -1,24 +1,52 @@
+import base64
+import hashlib
+import logging
+from datetime import datetime
+from sqlalchemy import String, cast, delete, func, insert, or_, select, tuple_, update
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from . import models, schemas
-from .security import get_password_hash
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+from . import cache, history, metrics, models, schemas, security, serialization
+
+logger = logging.getLogger(__name__)
+
+class StaleRevisionError(Exception):
+    """Raised when a topology changeset was computed against an outdated project revision."""
+    def __init__(self, current_revision: int):
+        super().__init__(f"Project topology is at revision {current_revision}")
+        self.current_revision = current_revision
 
 # User CRUD operations
 def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.username == username).first()
 
 def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    hashed_password = get_password_hash(user.password)
+    hashed_password = security.get_password_hash(user.password)
     db_user = models.User(username=user.username, password_hash=hashed_password)
     db.add(db_user)
     db.commit()
+    cache.invalidate_user(db_user.username)
     db.refresh(db_user)
     return db_user
 
+def device_property_columns(properties: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Values for the typed Device columns mirrored from the properties JSON."""
+    columns = {}
+    if not isinstance(properties, Mapping): # Binary imports carry whatever JSON the export held
+        properties = {}
+    for name, kind in models.DEVICE_PROPERTY_COLUMNS.items():
+        value = properties.get(name)
+        try:
+            columns[name] = None if value is None or isinstance(value, bool) else kind(value)
+        except (TypeError, ValueError):
+            columns[name] = None
+    return columns
+
 # Project CRUD operations
 def create_user_project(db: Session, project: schemas.ProjectCreate, user_id: int) -> models.Project:
     db_project = models.Project(**project.model_dump(), user_id=user_id)
     db.add(db_project)
+    db.flush()
+    _bump_listing_version(db, user_id)
     db.commit()
     db.refresh(db_project)
     return db_project
@@ -26,6 +54,55 @@ def create_user_project(db: Session, project: schemas.ProjectCreate, user_id: in
 def get_projects_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Project]:
     return db.query(models.Project).filter(models.Project.user_id == user_id).offset(skip).limit(limit).all()
 
+# Keyset pagination: pages are ordered newest first by (last_modified, id) and the cursor is the key of the
+# last row of the previous page, so every page is an index range read no matter how deep the user scrolled.
+def encode_project_cursor(last_modified: datetime, project_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{last_modified.isoformat()}|{project_id}".encode()).decode()
+
+def decode_project_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        last_modified, project_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(last_modified), int(project_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+def get_projects_page(
+    db: Session,
+    user_id: int,
+    limit: int = 100,
+    after: Optional[Tuple[datetime, int]] = None,
+    with_counts: bool = False,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Returns one page of the user's projects and the cursor of the next page (None on the last page).
+    With with_counts, rows are schemas.ProjectSummary carrying device and link counts computed by
+    correlated COUNT subqueries in the same statement (index-only on devices/links.project_id).
+    """
+    columns = [models.Project]
+    if with_counts:
+        columns += [
+            select(func.count()).where(models.Device.project_id == models.Project.id).correlate(models.Project).scalar_subquery(),
+            select(func.count()).where(models.Link.project_id == models.Project.id).correlate(models.Project).scalar_subquery(),
+        ]
+    stmt = select(*columns).where(models.Project.user_id == user_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(models.Project.last_modified, models.Project.id) < tuple_(*after))
+    stmt = stmt.order_by(models.Project.last_modified.desc(), models.Project.id.desc()).limit(limit + 1)
+    rows = db.execute(stmt).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_project_cursor(last.last_modified, last.id)
+    if not with_counts:
+        return [row[0] for row in rows], next_cursor
+    return [
+        schemas.ProjectSummary.model_validate(project).model_copy(update={"device_count": device_count, "link_count": link_count})
+        for project, device_count, link_count in rows
+    ], next_cursor
+
 def get_project(db: Session, project_id: int, user_id: int) -> Optional[models.Project]:
     return db.query(models.Project).filter(models.Project.id == project_id, models.Project.user_id == user_id).first()
 
@@ -35,6 +112,8 @@ def update_project(db: Session, project_id: int, project_update: schemas.Project
         update_data = project_update.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_project, key, value)
+        db.flush() # Project row before the user row, the order topology writes lock them in
+        _bump_listing_version(db, user_id)
         db.commit()
         db.refresh(db_project)
     return db_project
@@ -42,8 +121,17 @@ def update_project(db: Session, project_id: int, project_update: schemas.Project
 def delete_project(db: Session, project_id: int, user_id: int) -> Optional[models.Project]:
     db_project = get_project(db=db, project_id=project_id, user_id=user_id)
     if db_project:
+        # Remove the graph with two indexed bulk deletes; the ORM cascade would load every device and
+        # then lazy-load its source/target links one device at a time
+        db.execute(delete(models.Link).where(models.Link.project_id == project_id).execution_options(synchronize_session=False))
+        db.execute(delete(models.Device).where(models.Device.project_id == project_id).execution_options(synchronize_session=False))
+        db.execute(delete(models.TopologyRevision).where(models.TopologyRevision.project_id == project_id).execution_options(synchronize_session=False))
+        db.execute(delete(models.Job).where(models.Job.project_id == project_id).execution_options(synchronize_session=False))
         db.delete(db_project)
+        db.flush()
+        _bump_listing_version(db, user_id)
         db.commit()
+        cache.invalidate_project_topology(project_id)
     # Return the project object that was deleted, or None if not found
     # Note: After deletion, accessing attributes of db_project might be problematic
     # if the session is expired or the object is no longer tracked.
@@ -52,9 +140,12 @@ def delete_project(db: Session, project_id: int, user_id: int) -> Optional[model
 
 # Topology CRUD operations
 def update_project_topology(db: Session, project_id: int, user_id: int, topology_data: schemas.TopologyData) -> Optional[models.Project]:
-    db_project = get_project(db=db, project_id=project_id, user_id=user_id)
-    if not db_project:
+    # Bump the revision atomically first; a read-modify-write of Project.revision lets two concurrent
+    # saves (from different worker processes) both claim the same revision
+    revision = _bump_project_revision(db, project_id, user_id)
+    if revision is None:
         return None # Or raise HTTPException
+    db_project = get_project(db=db, project_id=project_id, user_id=user_id)
 
     # Clear existing links and devices for this project
     # synchronize_session=False is recommended for bulk deletes before a commit.
@@ -73,7 +164,8 @@ def update_project_topology(db: Session, project_id: int, user_id: int, topology
             project_id=project_id,
             name=device_data.name,
             device_type=device_data.device_type,
-            properties=device_data.properties
+            properties=device_data.properties,
+            **device_property_columns(device_data.properties)
         )
         db.add(db_device)
         new_devices_for_db.append(db_device) # Keep track for client_id mapping
@@ -102,23 +194,529 @@ def update_project_topology(db: Session, project_id: int, user_id: int, topology
             )
             db.add(db_link)
         else:
-            # Handle error: client_id not found. Log or raise.
-            # For now, we'll skip creating this link.
-            print(f"Warning: Could not resolve client_ids for link: {link_data.source_device_client_id} -> {link_data.target_device_client_id}")
-
+            # client_id not found; skip creating this link
+            logger.warning(
+                "Could not resolve client_ids for link %s -> %s",
+                link_data.source_device_client_id, link_data.target_device_client_id,
+                extra={"project_id": project_id},
+            )
 
+    history.record_checkpoint(db, project_id, revision)
     db.commit()
+    metrics.observe_topology("replace", len(topology_data.devices), len(topology_data.links))
+    cache.invalidate_project_topology(project_id)
     db.refresh(db_project) # Refresh to load the new devices and links relationships
     return db_project
 
-def get_project_topology(db: Session, project_id: int, user_id: int) -> Optional[schemas.TopologyResponse]:
-    db_project = get_project(db=db, project_id=project_id, user_id=user_id)
-    if not db_project:
+def _bump_project_revision(db: Session, project_id: int, user_id: int, base_revision: Optional[int] = None) -> Optional[int]:
+    # Bumping the revision is the first statement of a topology write: the conditional UPDATE both checks
+    # the client's base revision and takes the row/database write lock, so concurrent editors serialize here.
+    stmt = update(models.Project).where(models.Project.id == project_id, models.Project.user_id == user_id)
+    if base_revision is not None:
+        stmt = stmt.where(models.Project.revision == base_revision)
+    result = db.execute(stmt.values(revision=models.Project.revision + 1).execution_options(synchronize_session=False))
+    current_revision = db.execute(
+        select(models.Project.revision).where(models.Project.id == project_id, models.Project.user_id == user_id)
+    ).scalar_one_or_none()
+    if current_revision is None:
         return None
+    if result.rowcount == 0:
+        db.rollback()
+        raise StaleRevisionError(current_revision)
+    _bump_listing_version(db, user_id) # The listing shows last_modified and, in summaries, the counts
+    return current_revision
+
+def _bump_listing_version(db: Session, user_id: int) -> None:
+    db.execute(
+        update(models.User).where(models.User.id == user_id)
+        .values(listing_version=models.User.listing_version + 1).execution_options(synchronize_session=False)
+    )
+
+def apply_topology_changeset(db: Session, project_id: int, user_id: int, changeset: schemas.TopologyChangeset) -> Optional[schemas.TopologyChangesetResult]:
+    """
+    Applies only the rows touched by the changeset instead of rewriting the whole topology.
+    Raises StaleRevisionError if changeset.base_revision is set and no longer current.
+    """
+    revision = _bump_project_revision(db, project_id, user_id, changeset.base_revision)
+    if revision is None:
+        return None
+
+    cascaded_link_ids: List[int] = []
+    if changeset.removed_link_ids:
+        db.execute(
+            delete(models.Link)
+            .where(models.Link.project_id == project_id, models.Link.id.in_(changeset.removed_link_ids))
+            .execution_options(synchronize_session=False)
+        )
+    if changeset.removed_device_ids:
+        # Core deletes bypass the ORM cascade, so drop the links attached to removed devices explicitly
+        cascaded_link_ids = db.execute(
+            delete(models.Link)
+            .where(
+                models.Link.project_id == project_id,
+                or_(models.Link.source_device_id.in_(changeset.removed_device_ids),
+                    models.Link.target_device_id.in_(changeset.removed_device_ids)),
+            )
+            .returning(models.Link.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.execute(
+            delete(models.Device)
+            .where(models.Device.project_id == project_id, models.Device.id.in_(changeset.removed_device_ids))
+            .execution_options(synchronize_session=False)
+        )
+
+    if changeset.updated_devices:
+        # Property patches are merged, so fetch the stored properties of just the devices being updated
+        updated_ids = [device.id for device in changeset.updated_devices]
+        stored_properties = dict(db.execute(
+            select(models.Device.id, models.Device.properties)
+            .where(models.Device.project_id == project_id, models.Device.id.in_(updated_ids))
+        ).all())
+        for device_update in changeset.updated_devices:
+            if device_update.id not in stored_properties:
+                continue # Removed concurrently or not part of this project
+            values = device_update.model_dump(exclude_unset=True, exclude={"id"})
+            if values.get("properties") is not None:
+                values["properties"] = {**(stored_properties[device_update.id] or {}), **values["properties"]}
+                values.update(device_property_columns(values["properties"]))
+            else:
+                values.pop("properties", None) # null means "leave unchanged" under merge semantics
+            if values:
+                db.execute(
+                    update(models.Device)
+                    .where(models.Device.id == device_update.id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+
+    new_devices = [
+        models.Device(project_id=project_id, name=device_data.name, device_type=device_data.device_type,
+                      properties=device_data.properties, **device_property_columns(device_data.properties))
+        for device_data in changeset.added_devices
+    ]
+    db.add_all(new_devices)
+    db.flush()
+    client_to_db_id_map: Dict[str, int] = {
+        device_data.client_id: db_device.id
+        for device_data, db_device in zip(changeset.added_devices, new_devices)
+        if device_data.client_id
+    }
+
+    for link_update in changeset.updated_links:
+        values = link_update.model_dump(exclude_unset=True, exclude={"id"})
+        if values:
+            db.execute(
+                update(models.Link)
+                .where(models.Link.project_id == project_id, models.Link.id == link_update.id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+
+    # Links may point at pre-existing devices by DB id; make sure those ids belong to this project
+    referenced_ids = {
+        device_id
+        for link_data in changeset.added_links
+        for device_id in (link_data.source_device_id, link_data.target_device_id)
+        if device_id is not None
+    }
+    existing_ids = set()
+    if referenced_ids:
+        existing_ids = set(db.execute(
+            select(models.Device.id).where(models.Device.project_id == project_id, models.Device.id.in_(referenced_ids))
+        ).scalars())
+
+    def resolve(device_id: Optional[int], client_id: Optional[str]) -> Optional[int]:
+        if device_id is not None:
+            return device_id if device_id in existing_ids else None
+        return client_to_db_id_map.get(client_id)
+
+    new_links = []
+    new_link_client_ids = []
+    for link_data in changeset.added_links:
+        source_db_id = resolve(link_data.source_device_id, link_data.source_device_client_id)
+        target_db_id = resolve(link_data.target_device_id, link_data.target_device_client_id)
+        if source_db_id is None or target_db_id is None:
+            logger.warning(
+                "Could not resolve endpoints for link %s", link_data.model_dump(exclude_none=True),
+                extra={"project_id": project_id},
+            )
+            continue
+        new_links.append(models.Link(
+            project_id=project_id,
+            source_device_id=source_db_id,
+            target_device_id=target_db_id,
+            source_port=link_data.source_port,
+            target_port=link_data.target_port
+        ))
+        new_link_client_ids.append(link_data.client_id)
+    db.add_all(new_links)
+    db.flush()
+
+    history.record_delta(
+        db, project_id, revision,
+        device_ids=[device.id for device in changeset.updated_devices] + [db_device.id for db_device in new_devices],
+        removed_device_ids=changeset.removed_device_ids,
+        link_ids=[link.id for link in changeset.updated_links] + [db_link.id for db_link in new_links],
+        removed_link_ids=list(changeset.removed_link_ids) + list(cascaded_link_ids),
+    )
+    db.commit()
+    cache.invalidate_project_topology(project_id)
+    return schemas.TopologyChangesetResult(
+        revision=revision,
+        device_id_map=client_to_db_id_map,
+        link_ids=[db_link.id for db_link in new_links],
+        link_id_map={client_id: db_link.id for client_id, db_link in zip(new_link_client_ids, new_links) if client_id},
+    )
+
+# Rows per executemany batch for bulk imports; keeps parameter buffers bounded for very large topologies
+BULK_INSERT_BATCH_SIZE = 5000
+
+def _batched(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def bulk_import_topology_rows(
+    db: Session,
+    project_id: int,
+    user_id: int,
+    devices: Iterable[Mapping[str, Any]],
+    links: Iterable[Mapping[str, Any]],
+) -> Optional[schemas.TopologyImportSummary]:
+    """
+    Replaces the project's topology using batched core INSERTs.
+    `devices` are mappings with client_id, name, device_type and properties; `links` are mappings with
+    source_device_client_id, target_device_client_id, source_port and target_port.
+    """
+    revision = _bump_project_revision(db, project_id, user_id)
+    if revision is None:
+        return None
+
+    db.execute(delete(models.Link).where(models.Link.project_id == project_id).execution_options(synchronize_session=False))
+    db.execute(delete(models.Device).where(models.Device.project_id == project_id).execution_options(synchronize_session=False))
+    devices_created, links_created, links_skipped = _insert_topology_rows(db, project_id, devices, links)
+
+    history.record_checkpoint(db, project_id, revision)
+    db.commit()
+    cache.invalidate_project_topology(project_id)
+    metrics.observe_topology("import", devices_created, links_created)
+    return schemas.TopologyImportSummary(
+        revision=revision,
+        devices_created=devices_created,
+        links_created=links_created,
+        links_skipped=links_skipped,
+    )
+
+def _insert_topology_rows(
+    db: Session,
+    project_id: int,
+    devices: Iterable[Mapping[str, Any]],
+    links: Iterable[Mapping[str, Any]],
+    commit_batches: bool = False,
+) -> Tuple[int, int, int]:
+    """Inserts the rows of bulk_import_topology_rows; returns (devices_created, links_created, links_skipped)."""
+    device_table = models.Device.__table__
+    link_table = models.Link.__table__
+    # RETURNING with sort_by_parameter_order gives ids in the same order as the batch, so the
+    # client_id -> DB id map is built while inserting rather than with a second lookup pass
+    insert_devices = insert(device_table).returning(device_table.c.id, sort_by_parameter_order=True)
+
+    client_to_db_id_map: Dict[str, int] = {}
+    devices_created = 0
+    for batch in _batched(devices, BULK_INSERT_BATCH_SIZE):
+        rows = [
+            {"project_id": project_id, "name": device["name"], "device_type": device["device_type"],
+             "properties": device["properties"], **device_property_columns(device["properties"])}
+            for device in batch
+        ]
+        ids = db.execute(insert_devices, rows).scalars().all()
+        for device, db_id in zip(batch, ids):
+            if device.get("client_id"):
+                client_to_db_id_map[device["client_id"]] = db_id
+        devices_created += len(ids)
+        if commit_batches:
+            db.commit()
+
+    links_created = 0
+    links_skipped = 0
+    for batch in _batched(links, BULK_INSERT_BATCH_SIZE):
+        rows = []
+        for link in batch:
+            source_db_id = client_to_db_id_map.get(link["source_device_client_id"])
+            target_db_id = client_to_db_id_map.get(link["target_device_client_id"])
+            if source_db_id is None or target_db_id is None:
+                links_skipped += 1
+                continue
+            rows.append({
+                "project_id": project_id,
+                "source_device_id": source_db_id,
+                "target_device_id": target_db_id,
+                "source_port": link.get("source_port"),
+                "target_port": link.get("target_port"),
+            })
+        if rows:
+            db.execute(insert(link_table), rows)
+            links_created += len(rows)
+            if commit_batches:
+                db.commit()
+    return devices_created, links_created, links_skipped
+
+# Staged imports, for SQLite, whose single write lock a long import transaction would hold against every other
+# writer (which give up after busy_timeout). The rows are inserted in transactions of BULK_INSERT_BATCH_SIZE
+# rows under a negative staging project id that no query asks for, and a short final transaction swaps them
+# in by rewriting their project id. Device ids are final from the start, so links need no remapping.
+def stage_topology_rows(
+    db: Session, staging_id: int, devices: Iterable[Mapping[str, Any]], links: Iterable[Mapping[str, Any]]
+) -> Tuple[int, int, int]:
+    """Inserts the rows under staging_id (< 0), replacing any left by an earlier attempt; returns the counts."""
+    discard_staged_topology(db, staging_id)
+    return _insert_topology_rows(db, staging_id, devices, links, commit_batches=True)
+
+def publish_staged_topology(
+    db: Session, project_id: int, user_id: int, staging_id: int, devices_created: int, links_created: int, links_skipped: int
+) -> Optional[schemas.TopologyImportSummary]:
+    """Replaces the project's topology with the rows staged under staging_id, as bulk_import_topology_rows does."""
+    revision = _bump_project_revision(db, project_id, user_id)
+    if revision is None:
+        db.rollback()
+        discard_staged_topology(db, staging_id)
+        return None
+    db.execute(delete(models.Link).where(models.Link.project_id == project_id).execution_options(synchronize_session=False))
+    db.execute(delete(models.Device).where(models.Device.project_id == project_id).execution_options(synchronize_session=False))
+    for model in (models.Device, models.Link):
+        db.execute(update(model).where(model.project_id == staging_id).values(project_id=project_id).execution_options(synchronize_session=False))
+    history.record_checkpoint(db, project_id, revision)
+    db.commit()
+    cache.invalidate_project_topology(project_id)
+    metrics.observe_topology("import", devices_created, links_created)
+    return schemas.TopologyImportSummary(
+        revision=revision,
+        devices_created=devices_created,
+        links_created=links_created,
+        links_skipped=links_skipped,
+    )
+
+def discard_staged_topology(db: Session, staging_id: int) -> None:
+    db.execute(delete(models.Link).where(models.Link.project_id == staging_id).execution_options(synchronize_session=False))
+    db.execute(delete(models.Device).where(models.Device.project_id == staging_id).execution_options(synchronize_session=False))
+    db.commit()
+
+def update_device_positions(
+    db: Session,
+    project_id: int,
+    user_id: int,
+    positions: Mapping[int, Tuple[float, float]],
+    base_revision: Optional[int] = None,
+) -> Optional[int]:
+    """
+    Writes computed positions (device id -> (x, y)) into the devices' properties and position columns, with
+    batched bulk UPDATEs by primary key. Returns the new revision, or None if the project is not the user's.
+    Raises StaleRevisionError if base_revision is set and no longer current.
+    """
+    revision = _bump_project_revision(db, project_id, user_id, base_revision)
+    if revision is None:
+        return None
+    stored_properties = db.execute(
+        select(models.Device.id, models.Device.properties).where(models.Device.project_id == project_id)
+    ).all()
+    rows = []
+    for device_id, properties in stored_properties:
+        if device_id not in positions:
+            continue
+        x, y = positions[device_id]
+        properties = {**(properties or {}), "x_position": x, "y_position": y}
+        rows.append({"id": device_id, "properties": properties, "x_position": x, "y_position": y})
+    for batch in _batched(rows, BULK_INSERT_BATCH_SIZE):
+        db.execute(update(models.Device), batch)
+
+    history.record_delta(
+        db, project_id, revision,
+        device_ids=[row["id"] for row in rows], removed_device_ids=[], link_ids=[], removed_link_ids=[],
+    )
+    db.commit()
+    cache.invalidate_project_topology(project_id)
+    return revision
+
+def bulk_import_project_topology(db: Session, project_id: int, user_id: int, topology_data: schemas.TopologyData) -> Optional[schemas.TopologyImportSummary]:
+    return bulk_import_topology_rows(
+        db=db,
+        project_id=project_id,
+        user_id=user_id,
+        devices=(device.model_dump() for device in topology_data.devices),
+        links=(link.model_dump() for link in topology_data.links),
+    )
+
+# Server-side device search over the typed property columns; filters and sort are pushed down into SQL
+DEVICE_SORT_COLUMNS = ("id", "name", "device_type", "num_ports", "total_bandwidth", "throughput_per_port", "estimated_load")
+
+def search_project_devices(
+    db: Session,
+    project_id: int,
+    device_type: Optional[str] = None,
+    min_load: Optional[float] = None,
+    max_load: Optional[float] = None,
+    min_bandwidth: Optional[float] = None,
+    max_bandwidth: Optional[float] = None,
+    min_utilization: Optional[float] = None,
+    max_utilization: Optional[float] = None,
+    sort: str = "id",
+    descending: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+) -> List[models.Device]:
+    query = db.query(models.Device).filter(models.Device.project_id == project_id)
+    if device_type is not None:
+        query = query.filter(models.Device.device_type == device_type)
+    if min_load is not None:
+        query = query.filter(models.Device.estimated_load >= min_load)
+    if max_load is not None:
+        query = query.filter(models.Device.estimated_load <= max_load)
+    if min_bandwidth is not None:
+        query = query.filter(models.Device.total_bandwidth >= min_bandwidth)
+    if max_bandwidth is not None:
+        query = query.filter(models.Device.total_bandwidth <= max_bandwidth)
+    # Utilization is estimated_load / total_bandwidth; compare multiplied out to avoid dividing by zero
+    if min_utilization is not None:
+        query = query.filter(models.Device.total_bandwidth > 0, models.Device.estimated_load >= min_utilization * models.Device.total_bandwidth)
+    if max_utilization is not None:
+        query = query.filter(models.Device.total_bandwidth > 0, models.Device.estimated_load <= max_utilization * models.Device.total_bandwidth)
+    sort_column = getattr(models.Device, sort)
+    order = [sort_column.desc(), models.Device.id.desc()] if descending else [sort_column, models.Device.id]
+    return query.order_by(*order).offset(skip).limit(limit).all()
+
+# Lean topology reads: plain column tuples streamed in batches instead of ORM objects.
+# Properties are read as the stored JSON text so serialization can splice them in without decoding.
+TOPOLOGY_STREAM_BATCH_SIZE = 1000
+TOPOLOGY_READ_ATTEMPTS = 3
+
+def iter_project_device_rows(db: Session, project_id: int, batch_size: int = TOPOLOGY_STREAM_BATCH_SIZE) -> Iterator[Sequence[Any]]:
+    stmt = (
+        select(models.Device.id, models.Device.project_id, models.Device.name, models.Device.device_type,
+               cast(models.Device.properties, String))
+        .where(models.Device.project_id == project_id)
+        .order_by(models.Device.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in db.execute(stmt).partitions():
+        yield partition
+
+def iter_project_link_rows(db: Session, project_id: int, batch_size: int = TOPOLOGY_STREAM_BATCH_SIZE) -> Iterator[Sequence[Any]]:
+    stmt = (
+        select(models.Link.id, models.Link.project_id, models.Link.source_device_id, models.Link.target_device_id,
+               models.Link.source_port, models.Link.target_port)
+        .where(models.Link.project_id == project_id)
+        .order_by(models.Link.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in db.execute(stmt).partitions():
+        yield partition
+
+# Row fetches for a subset of devices (viewport queries). Id lists are sent in chunks to stay below
+# the database's bound-parameter limits.
+ID_CHUNK_SIZE = 500
+
+def iter_device_rows_by_ids(db: Session, project_id: int, device_ids: Sequence[int]) -> Iterator[Sequence[Any]]:
+    for chunk in _batched(device_ids, ID_CHUNK_SIZE):
+        yield db.execute(
+            select(models.Device.id, models.Device.project_id, models.Device.name, models.Device.device_type,
+                   cast(models.Device.properties, String))
+            .where(models.Device.project_id == project_id, models.Device.id.in_(chunk))
+        ).all()
+
+def existing_row_ids(db: Session, model: Any, project_id: int, ids: Iterable[int]) -> Set[int]:
+    """The ids among `ids` that belong to rows of the project in model's table (models.Device or models.Link)."""
+    found: Set[int] = set()
+    for chunk in _batched(sorted(set(ids)), ID_CHUNK_SIZE):
+        found.update(db.execute(select(model.id).where(model.project_id == project_id, model.id.in_(chunk))).scalars())
+    return found
+
+def iter_link_rows_touching(db: Session, project_id: int, device_ids: Sequence[int]) -> Iterator[Sequence[Any]]:
+    """Links with at least one endpoint among device_ids, each yielded once."""
+    seen = set()
+    for chunk in _batched(device_ids, ID_CHUNK_SIZE):
+        rows = db.execute(
+            select(models.Link.id, models.Link.project_id, models.Link.source_device_id, models.Link.target_device_id,
+                   models.Link.source_port, models.Link.target_port)
+            .where(
+                models.Link.project_id == project_id,
+                or_(models.Link.source_device_id.in_(chunk), models.Link.target_device_id.in_(chunk)),
+            )
+        ).all()
+        fresh = [row for row in rows if row[0] not in seen]
+        seen.update(row[0] for row in fresh)
+        yield fresh
+
+# Conditional GET support: cheap version lookups used to build ETags before touching topology rows
+def get_project_version(db: Session, project_id: int, user_id: int) -> Optional[Tuple[int, datetime]]:
+    row = db.execute(
+        select(models.Project.revision, models.Project.last_modified)
+        .where(models.Project.id == project_id, models.Project.user_id == user_id)
+    ).first()
+    return tuple(row) if row else None
+
+def count_project_devices(db: Session, project_id: int) -> int:
+    return db.execute(select(func.count()).where(models.Device.project_id == project_id)).scalar_one()
+
+def project_topology_key(project_id: int, revision: int, last_modified: datetime) -> Tuple[int, int, str]:
+    """
+    Key of everything cached from the project's topology at this version. Revisions alone repeat: SQLite
+    hands a deleted project's id to the next project, and other workers never see the deletion, so
+    last_modified tells the two projects apart.
+    """
+    return (project_id, revision, f"{last_modified.timestamp():.6f}")
+
+def project_topology_etag(project_id: int, revision: int, last_modified: datetime) -> str:
+    return '"t{}-{}-{}"'.format(*project_topology_key(project_id, revision, last_modified))
+
+def _counted_batches(batches: Iterable[Sequence[Any]], sizes: Dict[str, int], key: str) -> Iterator[Sequence[Any]]:
+    for batch in batches:
+        sizes[key] += len(batch)
+        yield batch
+
+def _current_project_version(db: Session, project_id: int) -> Optional[Tuple[int, datetime]]:
+    row = db.execute(select(models.Project.revision, models.Project.last_modified).where(models.Project.id == project_id)).first()
+    return tuple(row) if row else None
+
+def get_project_topology_json(db: Session, project_id: int, version: Tuple[int, datetime]) -> Tuple[Tuple[int, datetime], bytes]:
+    """
+    Serialized TopologyResponse and the (revision, last_modified) it belongs to, starting from the caller's
+    `version`; served from the topology cache when possible.
 
-    # Devices and links are loaded via relationships defined in models.Project
-    # Convert ORM models to Pydantic schemas for the response
-    devices_schema = [schemas.Device.model_validate(device) for device in db_project.devices]
-    links_schema = [schemas.Link.model_validate(link) for link in db_project.links]
+    Devices and links are read by separate statements, and outside an explicit transaction each sees the
+    latest commit, so a write landing in between would mix two revisions. Every write bumps the version,
+    so reading it again afterwards tells whether one did; the rows are then read again at the new version.
+    After TOPOLOGY_READ_ATTEMPTS the last body is returned uncached with the version read before it, which
+    is older than some of its rows, so the next conditional request fetches it again.
+    """
+    for _ in range(TOPOLOGY_READ_ATTEMPTS):
+        key = project_topology_key(project_id, *version)
+        body = cache.topology_cache.get(key)
+        if body is not None:
+            return version, body
+        sizes = {"devices": 0, "links": 0}
+        body = b"".join(serialization.json_chunks(
+            _counted_batches(iter_project_device_rows(db, project_id), sizes, "devices"),
+            _counted_batches(iter_project_link_rows(db, project_id), sizes, "links"),
+        ))
+        metrics.observe_topology("read", sizes["devices"], sizes["links"])
+        current = _current_project_version(db, project_id)
+        if current == version:
+            cache.topology_cache.set(key, body)
+            return version, body
+        if current is None:
+            return version, body # Deleted meanwhile; the caller's next request gets a 404
+        read_version, version = version, current
+    return read_version, body
 
-    return schemas.TopologyResponse(devices=devices_schema, links=links_schema)
+def get_projects_listing_etag(db: Session, user_id: int, *params: Any) -> str:
+    # One primary key read however many projects the user has: every project create/update/delete and every
+    # topology write bumps the user's listing_version in the same transaction
+    version = db.execute(select(models.User.listing_version).where(models.User.id == user_id)).scalar_one_or_none()
+    digest = hashlib.sha1(repr((user_id, version, params)).encode()).hexdigest()
+    return f'"p{digest}"'
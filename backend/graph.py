@@ -0,0 +1,294 @@
+# In-memory graph index for path and reachability queries.
+# Links are stored as an undirected CSR adjacency (every link contributes an arc in each direction, arcs
+# sorted by source, then target, then cost), so a device's neighbours are one contiguous slice. Indexes are
+# cached per project version (crud.project_topology_key) in cache.graph_cache, which evicts least recently used projects.
+#
+# Hop-count queries run a vectorized level-synchronous BFS that stops at the target or the hop limit;
+# capacity-weighted paths use scipy's Dijkstra. Articulation points, bridges and connected components are
+# whole-graph results computed on first use and kept on the index.
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from sqlalchemy.orm import Session
+
+from . import analysis
+
+class UnknownElementError(KeyError):
+    """Raised for device or link ids that are not part of the indexed topology."""
+    def __init__(self, kind: str, ids: List[int]):
+        super().__init__(f"{kind} not found in project: {', '.join(map(str, ids))}")
+        self.kind = kind
+        self.ids = ids
+
+def link_costs(capacity: np.ndarray) -> np.ndarray:
+    """
+    OSPF-style cost: the widest link costs 1 and a link of half its capacity costs 2. Links of unknown
+    capacity cost as much as the slowest known link; without any known capacity every link costs 1.
+    """
+    known = capacity > 0
+    if not np.any(known):
+        return np.ones(len(capacity))
+    reference = capacity[known].max()
+    return np.where(known, reference / np.where(known, capacity, 1.0), reference / capacity[known].min())
+
+class GraphIndex:
+    def __init__(self, device_ids: np.ndarray, link_ids: np.ndarray, link_source: np.ndarray,
+                 link_target: np.ndarray, link_capacity: np.ndarray):
+        # device_ids and link_ids are sorted; link_source/link_target are device positions
+        n = len(device_ids)
+        self.device_ids = device_ids
+        self.link_ids = link_ids
+        self.link_capacity = link_capacity.astype(np.float64)
+        self.link_cost = link_costs(self.link_capacity)
+
+        proper = np.flatnonzero(link_source != link_target) # Self-loops never lie on a path
+        arc_source = np.concatenate([link_source[proper], link_target[proper]])
+        arc_target = np.concatenate([link_target[proper], link_source[proper]])
+        arc_link = np.concatenate([proper, proper])
+        order = np.lexsort((self.link_cost[arc_link], arc_target, arc_source))
+        self.arc_source = arc_source[order]
+        self.indices = arc_target[order]
+        self.arc_link = arc_link[order] # Link position of each arc
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.arc_source, minlength=n), out=self.indptr[1:])
+
+        # Dijkstra sees only the cheapest of parallel links (the first arc of each source/target pair)
+        first = np.ones(len(self.indices), dtype=bool)
+        first[1:] = (self.arc_source[1:] != self.arc_source[:-1]) | (self.indices[1:] != self.indices[:-1])
+        unique_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.arc_source[first], minlength=n), out=unique_indptr[1:])
+        self.cost_matrix = csr_matrix(
+            (self.link_cost[self.arc_link[first]], self.indices[first], unique_indptr), shape=(n, n)
+        )
+
+        self._lock = threading.Lock()
+        self._components: Optional[Tuple[int, np.ndarray]] = None
+        self._critical: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.device_ids, self.link_ids, self.link_capacity, self.link_cost, self.arc_source,
+                  self.indices, self.arc_link, self.indptr, self.cost_matrix.data, self.cost_matrix.indices,
+                  self.cost_matrix.indptr)
+        return sum(array.nbytes for array in arrays)
+
+    def device_positions(self, ids: List[int]) -> np.ndarray:
+        return self._positions(self.device_ids, ids, "Devices")
+
+    def link_positions(self, ids: List[int]) -> np.ndarray:
+        return self._positions(self.link_ids, ids, "Links")
+
+    @staticmethod
+    def _positions(sorted_ids: np.ndarray, ids: List[int], kind: str) -> np.ndarray:
+        wanted = np.asarray(ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, wanted), max(len(sorted_ids) - 1, 0))
+        found = sorted_ids[positions] == wanted if len(sorted_ids) else np.zeros(len(wanted), dtype=bool)
+        if not np.all(found):
+            raise UnknownElementError(kind, wanted[~found].tolist())
+        return positions
+
+    def _arc(self, source: int, target: int) -> int:
+        """Position of the cheapest arc from source to target."""
+        start, end = self.indptr[source], self.indptr[source + 1]
+        return int(start + np.searchsorted(self.indices[start:end], target))
+
+    def _bfs_levels(self, source: int, predecessor: np.ndarray, max_hops: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields (hops, newly reached device positions) level by level, filling in `predecessor`."""
+        visited = np.zeros(len(self.device_ids), dtype=bool)
+        visited[source] = True
+        frontier = np.array([source], dtype=np.int64)
+        hops = 0
+        while len(frontier) and (max_hops is None or hops < max_hops):
+            starts = self.indptr[frontier]
+            counts = self.indptr[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                return
+            # Arc positions of all frontier devices at once: each device's run starts at its indptr entry
+            positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            neighbours = self.indices[positions]
+            parents = np.repeat(frontier, counts)
+            fresh = ~visited[neighbours]
+            neighbours, first = np.unique(neighbours[fresh], return_index=True)
+            predecessor[neighbours] = parents[fresh][first]
+            visited[neighbours] = True
+            hops += 1
+            yield hops, neighbours
+            frontier = neighbours
+
+    def shortest_path(self, source_id: int, target_id: int, weight: str = "hops") -> Dict[str, Any]:
+        """Path between two devices by hop count or by capacity cost (see link_costs)."""
+        source, target = (int(position) for position in self.device_positions([source_id, target_id]))
+        predecessor = np.full(len(self.device_ids), -1, dtype=np.int64)
+        if source != target:
+            if weight == "hops":
+                for _ in self._bfs_levels(source, predecessor):
+                    if predecessor[target] >= 0:
+                        break
+            else:
+                _, scipy_predecessor = dijkstra(self.cost_matrix, indices=source, return_predecessors=True)
+                predecessor = np.where(scipy_predecessor >= 0, scipy_predecessor, -1)
+            if predecessor[target] < 0:
+                return {"found": False, "hops": None, "cost": None, "bottleneck_capacity": None, "device_ids": [], "link_ids": []}
+
+        devices = [target]
+        while devices[-1] != source:
+            devices.append(int(predecessor[devices[-1]]))
+        devices.reverse()
+        links = np.array([self.arc_link[self._arc(a, b)] for a, b in zip(devices, devices[1:])], dtype=np.int64)
+        capacity = self.link_capacity[links]
+        return {
+            "found": True,
+            "hops": len(links),
+            "cost": round(float(self.link_cost[links].sum()), 6),
+            # Narrowest known link along the path; unknown capacities are skipped
+            "bottleneck_capacity": float(capacity[capacity > 0].min()) if np.any(capacity > 0) else None,
+            "device_ids": self.device_ids[devices].tolist(),
+            "link_ids": self.link_ids[links].tolist(),
+        }
+
+    def neighborhood(self, device_id: int, max_hops: int, limit: int) -> Dict[str, Any]:
+        """Devices within max_hops of the device (itself excluded), nearest first."""
+        source = int(self.device_positions([device_id])[0])
+        predecessor = np.full(len(self.device_ids), -1, dtype=np.int64)
+        reached, distances = [], []
+        for hops, level in self._bfs_levels(source, predecessor, max_hops):
+            reached.append(level)
+            distances.append(np.full(len(level), hops, dtype=np.int64))
+        positions = np.concatenate(reached) if reached else np.empty(0, dtype=np.int64)
+        hop_counts = np.concatenate(distances) if distances else np.empty(0, dtype=np.int64)
+        return {
+            "device_count": len(positions),
+            "truncated": len(positions) > limit,
+            "devices": [
+                {"id": device, "hops": hops}
+                for device, hops in zip(self.device_ids[positions[:limit]].tolist(), hop_counts[:limit].tolist())
+            ],
+        }
+
+    def components(self) -> Tuple[int, np.ndarray]:
+        with self._lock:
+            if self._components is None:
+                n = len(self.device_ids)
+                adjacency = coo_matrix((np.ones(len(self.indices)), (self.arc_source, self.indices)), shape=(n, n))
+                self._components = connected_components(adjacency, directed=False)
+            return self._components
+
+    def critical_elements(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of articulation points (devices) and bridges (links)."""
+        with self._lock:
+            if self._critical is None:
+                self._critical = self._find_critical_elements()
+            return self._critical
+
+    def _find_critical_elements(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Iterative Tarjan DFS over the CSR lists. The arc back to the parent is skipped by link, not by
+        # device, so a device pair joined by parallel links is not a bridge.
+        n = len(self.device_ids)
+        indptr, indices, arc_link = self.indptr.tolist(), self.indices.tolist(), self.arc_link.tolist()
+        discovered = [-1] * n
+        low = [0] * n
+        articulation = bytearray(n)
+        bridges: List[int] = []
+        timer = 0
+        for root in range(n):
+            if discovered[root] >= 0 or indptr[root] == indptr[root + 1]:
+                continue
+            discovered[root] = low[root] = timer
+            timer += 1
+            root_children = 0
+            # Frames are [device, link to the parent, next arc position]
+            stack = [[root, -1, indptr[root]]]
+            while stack:
+                frame = stack[-1]
+                node, position = frame[0], frame[2]
+                if position < indptr[node + 1]:
+                    frame[2] = position + 1
+                    link = arc_link[position]
+                    if link == frame[1]:
+                        continue
+                    child = indices[position]
+                    if discovered[child] < 0:
+                        discovered[child] = low[child] = timer
+                        timer += 1
+                        stack.append([child, link, indptr[child]])
+                    elif discovered[child] < low[node]:
+                        low[node] = discovered[child]
+                    continue
+                stack.pop()
+                if not stack:
+                    break
+                parent = stack[-1][0]
+                if low[node] < low[parent]:
+                    low[parent] = low[node]
+                if low[node] > discovered[parent]:
+                    bridges.append(frame[1])
+                if parent == root:
+                    root_children += 1
+                elif low[node] >= discovered[parent]:
+                    articulation[parent] = 1
+            if root_children > 1:
+                articulation[root] = 1
+        return np.flatnonzero(np.frombuffer(bytes(articulation), dtype=np.uint8)), np.sort(np.array(bridges, dtype=np.int64))
+
+    def critical(self, limit: int) -> Dict[str, Any]:
+        articulation, bridges = self.critical_elements()
+        return {
+            "articulation_point_count": len(articulation),
+            "bridge_count": len(bridges),
+            "articulation_point_ids": self.device_ids[articulation[:limit]].tolist(),
+            "bridge_link_ids": self.link_ids[bridges[:limit]].tolist(),
+        }
+
+    def failure_impact(self, device_ids: List[int], link_ids: List[int], limit: int) -> Dict[str, Any]:
+        """
+        Devices cut off when the given devices and links fail. Each connected component touched by a
+        failure may split; its largest remaining part is assumed to keep service, the others are disconnected.
+        """
+        n = len(self.device_ids)
+        failed_devices = self.device_positions(device_ids)
+        failed_links = self.link_positions(link_ids)
+        component_count, labels = self.components()
+
+        failed = np.zeros(n, dtype=bool)
+        failed[failed_devices] = True
+        link_failed = np.zeros(len(self.link_ids), dtype=bool)
+        link_failed[failed_links] = True
+        keep = ~failed[self.arc_source] & ~failed[self.indices] & ~link_failed[self.arc_link]
+        _, labels_after = connected_components(
+            coo_matrix((np.ones(int(keep.sum())), (self.arc_source[keep], self.indices[keep])), shape=(n, n)), directed=False
+        )
+
+        # Components before the failure that contain a failed device or an endpoint of a failed link
+        touched_links = np.flatnonzero(link_failed[self.arc_link])
+        touched = np.zeros(component_count, dtype=bool)
+        touched[labels[failed_devices]] = True
+        touched[labels[self.arc_source[touched_links]]] = True
+        affected = np.flatnonzero(touched[labels] & ~failed)
+
+        # Group the surviving devices by (component before, component after) and keep the largest part of each
+        keys = labels[affected].astype(np.int64) * n + labels_after[affected]
+        parts, inverse, sizes = np.unique(keys, return_inverse=True, return_counts=True)
+        part_component = parts // n
+        order = np.lexsort((-sizes, part_component))
+        _, first = np.unique(part_component[order], return_index=True)
+        surviving_part = np.zeros(len(parts), dtype=bool)
+        surviving_part[order[first]] = True
+        disconnected = affected[~surviving_part[inverse]]
+
+        return {
+            "failed_device_ids": self.device_ids[np.unique(failed_devices)].tolist(),
+            "failed_link_ids": self.link_ids[np.unique(failed_links)].tolist(),
+            "partition_count": int(len(parts) - len(first)), # Parts split off from the touched components
+            "disconnected_device_count": len(disconnected),
+            "truncated": len(disconnected) > limit,
+            "disconnected_device_ids": self.device_ids[disconnected[:limit]].tolist(),
+        }
+
+def build_graph_index(db: Session, project_id: int) -> GraphIndex:
+    """Index of the project's links, with capacities as in the capacity analysis (analysis.link_capacities)."""
+    arrays = analysis.load_topology_arrays(db, project_id)
+    return GraphIndex(arrays.device_ids, arrays.link_ids, arrays.link_source, arrays.link_target, analysis.link_capacities(arrays))
@@ -0,0 +1,195 @@
+# Topology revision history.
+# Every topology write appends one TopologyRevision entry in the same transaction: full replaces store a
+# "checkpoint" (the whole topology), incremental changesets store a "delta" holding only the rows they
+# touched. A checkpoint is also written instead of a delta when the project has none yet or the last one is
+# REVISION_CHECKPOINT_INTERVAL revisions old, so rebuilding any revision replays at most that many deltas.
+#
+# Payloads are zlib-compressed JSON with rows as positional lists:
+#     device: [id, name, device_type, properties]
+#     link:   [id, source_device_id, target_device_id, source_port, target_port]
+#     {"devices": [...], "links": [...], "removed_devices": [ids], "removed_links": [ids]}
+# A checkpoint is a delta applied to an empty topology (without the removed_* keys).
+import os
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import models, serialization
+
+REVISION_CHECKPOINT_INTERVAL = int(os.getenv("REVISION_CHECKPOINT_INTERVAL", "50"))
+REVISION_COMPRESSION_LEVEL = int(os.getenv("REVISION_COMPRESSION_LEVEL", "6"))
+ID_CHUNK_SIZE = 500
+
+# id -> row list, as stored in the payloads
+TopologyState = Tuple[Dict[int, List[Any]], Dict[int, List[Any]]]
+
+def _chunks(ids: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
+
+def _device_row(row: Sequence[Any]) -> List[Any]:
+    device_id, name, device_type, properties = row
+    return [device_id, name, device_type, serialization.loads(properties) if properties else None]
+
+def _device_rows(db: Session, project_id: int, device_ids: Optional[Iterable[int]] = None) -> List[List[Any]]:
+    # Properties are selected as JSON text and decoded with serialization.loads (orjson when available),
+    # which is several times faster than the JSON column type's stdlib decoding on large checkpoints
+    stmt = (
+        select(models.Device.id, models.Device.name, models.Device.device_type, cast(models.Device.properties, String))
+        .where(models.Device.project_id == project_id)
+    )
+    if device_ids is None:
+        return [_device_row(row) for row in db.execute(stmt)]
+    rows = []
+    for chunk in _chunks(sorted(set(device_ids))):
+        rows.extend(_device_row(row) for row in db.execute(stmt.where(models.Device.id.in_(chunk))))
+    return rows
+
+def _link_rows(db: Session, project_id: int, link_ids: Optional[Iterable[int]] = None) -> List[List[Any]]:
+    stmt = (
+        select(models.Link.id, models.Link.source_device_id, models.Link.target_device_id,
+               models.Link.source_port, models.Link.target_port)
+        .where(models.Link.project_id == project_id)
+    )
+    if link_ids is None:
+        return [list(row) for row in db.execute(stmt)]
+    rows = []
+    for chunk in _chunks(sorted(set(link_ids))):
+        rows.extend(list(row) for row in db.execute(stmt.where(models.Link.id.in_(chunk))))
+    return rows
+
+def _add_entry(db: Session, project_id: int, revision: int, kind: str, payload: Dict[str, Any]) -> None:
+    db.add(models.TopologyRevision(
+        project_id=project_id,
+        revision=revision,
+        kind=kind,
+        payload=zlib.compress(serialization.dumps(payload), REVISION_COMPRESSION_LEVEL),
+    ))
+
+def record_checkpoint(db: Session, project_id: int, revision: int) -> None:
+    """Stores the project's current topology as the checkpoint of `revision`. Does not commit."""
+    db.flush() # Pending ORM rows of the write must be visible to the SELECTs below
+    _add_entry(db, project_id, revision, "checkpoint", {
+        "devices": _device_rows(db, project_id),
+        "links": _link_rows(db, project_id),
+    })
+
+def record_delta(
+    db: Session,
+    project_id: int,
+    revision: int,
+    device_ids: Iterable[int],
+    removed_device_ids: Iterable[int],
+    link_ids: Iterable[int],
+    removed_link_ids: Iterable[int],
+) -> None:
+    """
+    Stores the rows a changeset touched (their state after the write) as the delta of `revision`,
+    or a checkpoint when one is due. Does not commit.
+    """
+    last_checkpoint = db.execute(
+        select(func.max(models.TopologyRevision.revision))
+        .where(models.TopologyRevision.project_id == project_id, models.TopologyRevision.kind == "checkpoint")
+    ).scalar()
+    if last_checkpoint is None or revision - last_checkpoint >= REVISION_CHECKPOINT_INTERVAL:
+        record_checkpoint(db, project_id, revision)
+        return
+    db.flush()
+    _add_entry(db, project_id, revision, "delta", {
+        "devices": _device_rows(db, project_id, device_ids),
+        "links": _link_rows(db, project_id, link_ids),
+        "removed_devices": sorted(set(removed_device_ids)),
+        "removed_links": sorted(set(removed_link_ids)),
+    })
+
+def list_revisions(db: Session, project_id: int, before: Optional[int] = None, limit: int = 100) -> List[Tuple[int, str, Any, int]]:
+    """(revision, kind, created_at, payload size) of the newest entries, newest first."""
+    stmt = (
+        select(models.TopologyRevision.revision, models.TopologyRevision.kind, models.TopologyRevision.created_at,
+               func.length(models.TopologyRevision.payload))
+        .where(models.TopologyRevision.project_id == project_id)
+        .order_by(models.TopologyRevision.revision.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        stmt = stmt.where(models.TopologyRevision.revision < before)
+    return [tuple(row) for row in db.execute(stmt)]
+
+def load_topology_at(db: Session, project_id: int, revision: int) -> Optional[TopologyState]:
+    """
+    Rebuilds the topology as of `revision` from the nearest checkpoint at or before it plus the deltas
+    after it. Returns None when the revision predates the recorded history.
+    """
+    checkpoint = db.execute(
+        select(func.max(models.TopologyRevision.revision))
+        .where(
+            models.TopologyRevision.project_id == project_id,
+            models.TopologyRevision.kind == "checkpoint",
+            models.TopologyRevision.revision <= revision,
+        )
+    ).scalar()
+    if checkpoint is None:
+        return None
+    payloads = db.execute(
+        select(models.TopologyRevision.payload)
+        .where(
+            models.TopologyRevision.project_id == project_id,
+            models.TopologyRevision.revision >= checkpoint,
+            models.TopologyRevision.revision <= revision,
+        )
+        .order_by(models.TopologyRevision.revision)
+    ).scalars()
+
+    devices: Dict[int, List[Any]] = {}
+    links: Dict[int, List[Any]] = {}
+    for blob in payloads:
+        payload = serialization.loads(zlib.decompress(blob))
+        for device_id in payload.get("removed_devices", ()):
+            devices.pop(device_id, None)
+        for link_id in payload.get("removed_links", ()):
+            links.pop(link_id, None)
+        devices.update((row[0], row) for row in payload["devices"])
+        links.update((row[0], row) for row in payload["links"])
+    return devices, links
+
+def device_dict(project_id: int, row: List[Any]) -> Dict[str, Any]:
+    device_id, name, device_type, properties = row
+    return {"id": device_id, "project_id": project_id, "name": name, "device_type": device_type, "properties": properties}
+
+def link_dict(project_id: int, row: List[Any]) -> Dict[str, Any]:
+    link_id, source_device_id, target_device_id, source_port, target_port = row
+    return {"id": link_id, "project_id": project_id, "source_device_id": source_device_id,
+            "target_device_id": target_device_id, "source_port": source_port, "target_port": target_port}
+
+def topology_dict(project_id: int, state: TopologyState) -> Dict[str, Any]:
+    """TopologyResponse-shaped document of a rebuilt topology, ordered by id like the live endpoint."""
+    devices, links = state
+    return {
+        "devices": [device_dict(project_id, devices[key]) for key in sorted(devices)],
+        "links": [link_dict(project_id, links[key]) for key in sorted(links)],
+    }
+
+def diff_states(project_id: int, old: TopologyState, new: TopologyState) -> Dict[str, Any]:
+    """TopologyDiff-shaped document describing how to get from `old` to `new`."""
+    def diff(old_rows: Dict[int, List[Any]], new_rows: Dict[int, List[Any]], to_dict):
+        added = [to_dict(project_id, new_rows[key]) for key in sorted(new_rows.keys() - old_rows.keys())]
+        removed = sorted(old_rows.keys() - new_rows.keys())
+        changed = [
+            to_dict(project_id, new_rows[key])
+            for key in sorted(old_rows.keys() & new_rows.keys())
+            if old_rows[key] != new_rows[key]
+        ]
+        return added, removed, changed
+
+    added_devices, removed_devices, changed_devices = diff(old[0], new[0], device_dict)
+    added_links, removed_links, changed_links = diff(old[1], new[1], link_dict)
+    return {
+        "added_devices": added_devices,
+        "removed_device_ids": removed_devices,
+        "changed_devices": changed_devices,
+        "added_links": added_links,
+        "removed_link_ids": removed_links,
+        "changed_links": changed_links,
+    }
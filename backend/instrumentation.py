@@ -0,0 +1,254 @@
+# Request instrumentation: metrics middleware, SQL timing, structured logging and an opt-in profiler.
+#
+# InstrumentationMiddleware wraps every HTTP request. It records latency, status, body sizes, SQL statement
+# count, DB time and serialization time per route template into metrics.REGISTRY and writes one structured
+# access log line per request. Requests that run more than SQL_STATEMENT_WARN_THRESHOLD statements are
+# logged as warnings, so N+1 regressions show up without waiting for dashboards.
+#
+# Appending ?profile=1 to a request, authenticated as one of ADMIN_USERNAMES, returns a sampling profile
+# of the request instead of its response. The sampler walks the stacks of all threads, so work done in
+# the thread pool or on the write queue is included. Other requests running at the same time show up too.
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from time import perf_counter
+from typing import Any, Dict, Iterable, Tuple
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import metrics
+
+access_logger = logging.getLogger("backend.access")
+
+SQL_STATEMENT_WARN_THRESHOLD = int(os.getenv("SQL_STATEMENT_WARN_THRESHOLD", "50"))
+ADMIN_USERNAMES = frozenset(name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip())
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "1")) / 1000
+PROFILE_REPORT_LINES = 40
+
+# SQL timing
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("statement_start", []).append(perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info["statement_start"].pop()
+    metrics.record_statement(statement.lstrip()[:6].upper(), perf_counter() - started)
+
+def instrument_engine(engine: Engine) -> None:
+    """Times every statement of the engine (for an AsyncEngine pass its sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+# Structured logging
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message plus any `extra` fields."""
+
+    _standard = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in self._standard)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging() -> None:
+    """LOG_FORMAT=json (default) or text; LOG_LEVEL sets the level of the backend loggers."""
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    backend_logger = logging.getLogger("backend")
+    backend_logger.handlers[:] = [handler]
+    backend_logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+    backend_logger.propagate = False
+
+# Sampling profiler
+
+# Leaf frames of threads that are waiting rather than working (idle pool threads, the event loop's select)
+_IDLE_MODULES = ("threading.py", "queue.py", "selectors.py", os.path.join("concurrent", "futures", "thread.py"))
+
+class SamplingProfiler:
+    """Samples the Python stacks of all other threads every `interval` seconds."""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._started = perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = perf_counter() - self._started
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident or frame.f_code.co_filename.endswith(_IDLE_MODULES):
+                    continue
+                self.samples += 1
+                self.self_counts[self._label(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    label = self._label(frame)
+                    if label not in seen: # Count recursive functions once per sample
+                        seen.add(label)
+                        self.total_counts[label] += 1
+                    frame = frame.f_back
+
+    @staticmethod
+    def _label(frame) -> Tuple[str, str, int]:
+        code = frame.f_code
+        return code.co_name, code.co_filename, code.co_firstlineno
+
+    def report(self, lines: int = PROFILE_REPORT_LINES) -> str:
+        def table(counts: Counter) -> Iterable[str]:
+            for (name, filename, line), count in counts.most_common(lines):
+                yield f"{100 * count / max(self.samples, 1):6.1f}%  {count:7d}  {name}  ({filename}:{line})"
+
+        return "\n".join([
+            f"Sampled {self.samples} busy thread stacks in {self.duration * 1000:.1f} ms "
+            f"(interval {self.interval * 1000:g} ms)",
+            "",
+            "Self time:",
+            *table(self.self_counts),
+            "",
+            "Total time (including callees):",
+            *table(self.total_counts),
+            "",
+        ])
+
+def _profile_requested(scope: Dict[str, Any]) -> bool:
+    if b"profile=" not in scope.get("query_string", b""):
+        return False
+    if parse_qs(scope["query_string"].decode()).get("profile") != ["1"]:
+        return False
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode()
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    from . import security # Imported lazily: security pulls in crud, which depends on this module's siblings
+    try:
+        username = security.decode_access_token(token, ValueError("invalid token")).username
+    except ValueError:
+        return False
+    return username in ADMIN_USERNAMES
+
+# Middleware
+
+def _route_label(scope: Dict[str, Any]) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class InstrumentationMiddleware:
+    """Pure ASGI middleware, so it adds no task or body buffering to streamed responses."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if _profile_requested(scope):
+            await self._profile(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode() or uuid.uuid4().hex
+        request_size = int(headers.get(b"content-length", b"0") or 0)
+        stats, token = metrics.start_request()
+        started = perf_counter()
+        status_code = 500
+        response_size = 0
+
+        async def send_instrumented(message: Dict[str, Any]) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode())]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_instrumented)
+        finally:
+            duration = perf_counter() - started
+            metrics.end_request(token)
+            self._record(scope, request_id, status_code, duration, request_size, response_size, stats)
+
+    @staticmethod
+    def _record(scope: Dict[str, Any], request_id: str, status_code: int, duration: float,
+                request_size: int, response_size: int, stats: metrics.RequestStats) -> None:
+        method, route = scope["method"], _route_label(scope)
+        metrics.HTTP_REQUESTS.inc(method=method, route=route, status=str(status_code))
+        metrics.HTTP_REQUEST_DURATION.observe(duration, method=method, route=route)
+        metrics.HTTP_REQUEST_SIZE.observe(request_size, method=method, route=route)
+        metrics.HTTP_RESPONSE_SIZE.observe(response_size, method=method, route=route)
+        metrics.REQUEST_DB_STATEMENTS.observe(stats.db_statements, method=method, route=route)
+        metrics.REQUEST_DB_TIME.observe(stats.db_seconds, method=method, route=route)
+        metrics.REQUEST_SERIALIZATION_TIME.observe(stats.serialization_seconds, method=method, route=route)
+
+        fields = {
+            "request_id": request_id,
+            "method": method,
+            "route": route,
+            "path": scope["path"],
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "db_statements": stats.db_statements,
+            "db_ms": round(stats.db_seconds * 1000, 2),
+            "serialization_ms": round(stats.serialization_seconds * 1000, 2),
+            "request_bytes": request_size,
+            "response_bytes": response_size,
+        }
+        if stats.db_statements > SQL_STATEMENT_WARN_THRESHOLD:
+            access_logger.warning("%s %s ran %d SQL statements", method, route, stats.db_statements, extra=fields)
+        else:
+            access_logger.info("%s %s %d", method, route, status_code, extra=fields)
+
+    async def _profile(self, scope, receive, send) -> None:
+        status_code = 500
+
+        async def discard(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        with SamplingProfiler() as profiler:
+            await self.app(scope, receive, discard)
+        body = profiler.report().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profiled-status", str(status_code).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
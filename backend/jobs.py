@@ -0,0 +1,384 @@
+# Background jobs for long-running topology operations (analysis runs, binary exports and imports, layouts).
+# Jobs are rows of the jobs table, so they outlive the web process: POST endpoints insert a queued row and
+# hand its id to a process pool, the worker process claims the row, runs the handler with its own database
+# session and stores the result or error. The pool uses the "spawn" start method and the work happens in
+# separate interpreters, so CPU-heavy jobs never hold the web process's GIL.
+#
+# Live progress goes through a multiprocessing manager dict rather than the table: an import holds the
+# database write lock for its whole transaction (SQLite), so progress rows written from another connection
+# would block on it. The table keeps the coarse state (queued/running/finished) and the final progress.
+#
+# Each user may have at most JOB_MAX_ACTIVE_PER_USER queued or running jobs; further submissions are
+# rejected (429). On startup, queued and running jobs whose dispatching web process is gone are requeued.
+#
+# Files in JOB_STORAGE_DIR are swept on startup and then at most every JOB_SWEEP_INTERVAL_SECONDS when jobs
+# are submitted: export results JOB_RESULT_RETENTION_SECONDS after they were written, and uploads no queued
+# or running import needs (left by crashed workers or web processes) once they are JOB_UPLOAD_GRACE_SECONDS old.
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from . import analysis, columnar, crud, database, layout, models, schemas
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", "2"))
+JOB_STORAGE_DIR = os.getenv("JOB_STORAGE_DIR", os.path.join(tempfile.gettempdir(), "network-topology-jobs"))
+JOB_RESULT_RETENTION_SECONDS = float(os.getenv("JOB_RESULT_RETENTION_SECONDS", str(24 * 3600)))
+JOB_UPLOAD_GRACE_SECONDS = float(os.getenv("JOB_UPLOAD_GRACE_SECONDS", "3600"))
+JOB_SWEEP_INTERVAL_SECONDS = float(os.getenv("JOB_SWEEP_INTERVAL_SECONDS", "3600"))
+ACTIVE_STATUSES = ("queued", "running")
+# Identifies this web process in Job.dispatcher, to tell orphaned jobs from ones another worker is running
+DISPATCHER = f"{socket.gethostname()}:{os.getpid()}"
+
+ProgressReporter = Callable[[float, Optional[str]], None]
+
+class JobLimitError(Exception):
+    """Raised when a user already has the maximum number of active jobs."""
+    def __init__(self, active: int):
+        super().__init__(f"{active} jobs are already queued or running")
+        self.active = active
+
+class JobError(Exception):
+    """Expected failure of a job; the message is stored as the job's error."""
+
+def storage_path(name: str) -> str:
+    os.makedirs(JOB_STORAGE_DIR, exist_ok=True)
+    return os.path.join(JOB_STORAGE_DIR, name)
+
+def remove_file(name: str) -> None:
+    try:
+        os.unlink(storage_path(name))
+    except FileNotFoundError:
+        pass # Already removed, e.g. by another process's sweep
+
+def export_filename(job_id: int) -> str:
+    return f"job-{job_id}.ntopo"
+
+def job_files(job: models.Job) -> List[str]:
+    """Names of the files in JOB_STORAGE_DIR that belong to the job."""
+    if job.kind == "export":
+        return [export_filename(job.id)]
+    if job.kind == "import" and job.params:
+        return [job.params["upload"]]
+    return []
+
+# Job CRUD operations (web process)
+def create_job(db: Session, user_id: int, project_id: Optional[int], kind: str, params: Dict[str, Any],
+               max_active: int = JOB_MAX_ACTIVE_PER_USER) -> models.Job:
+    # Runs on the write queue, so the count and the insert cannot interleave with another submission
+    active = db.execute(
+        select(func.count()).select_from(models.Job)
+        .where(models.Job.user_id == user_id, models.Job.status.in_(ACTIVE_STATUSES))
+    ).scalar_one()
+    if active >= max_active:
+        raise JobLimitError(active)
+    db_job = models.Job(user_id=user_id, project_id=project_id, kind=kind, status="queued", progress=0.0,
+                        params=params, dispatcher=DISPATCHER)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_job(db: Session, job_id: int, user_id: int) -> Optional[models.Job]:
+    return db.execute(select(models.Job).where(models.Job.id == job_id, models.Job.user_id == user_id)).scalar_one_or_none()
+
+def get_jobs_by_user(db: Session, user_id: int, limit: int = 100) -> List[models.Job]:
+    return list(db.execute(
+        select(models.Job).where(models.Job.user_id == user_id).order_by(models.Job.id.desc()).limit(limit)
+    ).scalars())
+
+def _finish(db: Session, job_id: int, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+    values: Dict[str, Any] = {"status": status, "result": result, "error": error, "finished_at": datetime.utcnow(), "message": None}
+    if status == "succeeded":
+        values["progress"] = 1.0
+    db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+    db.commit()
+
+def _fail_crashed(db: Session, job_id: int) -> None:
+    _finish(db, job_id, "failed", error="Worker process crashed")
+    job = db.get(models.Job, job_id)
+    if job is not None:
+        for name in job_files(job): # The handler's own cleanup did not run
+            remove_file(name)
+        if job.kind == "import" and database.IS_SQLITE:
+            crud.discard_staged_topology(db, -job.id)
+
+def _dispatcher_alive(dispatcher: Optional[str]) -> bool:
+    if not dispatcher:
+        return False
+    host, _, pid = dispatcher.rpartition(":")
+    if host != socket.gethostname():
+        return True # Cannot be checked from here; leave it to its own host
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def requeue_orphaned_jobs(db: Session) -> List[int]:
+    """Takes over active jobs whose web process is gone; returns their ids."""
+    orphaned = [
+        job_id
+        for job_id, dispatcher in db.execute(
+            select(models.Job.id, models.Job.dispatcher).where(models.Job.status.in_(ACTIVE_STATUSES))
+        )
+        if dispatcher != DISPATCHER and not _dispatcher_alive(dispatcher)
+    ]
+    if orphaned:
+        db.execute(
+            update(models.Job)
+            .where(models.Job.id.in_(orphaned))
+            .values(status="queued", progress=0.0, message="Requeued after restart", started_at=None, dispatcher=DISPATCHER)
+        )
+        db.commit()
+    return orphaned
+
+def sweep_job_files(db: Session, now: Optional[float] = None) -> List[str]:
+    """Deletes the expired and orphaned files of JOB_STORAGE_DIR (see the top of the module); returns their names."""
+    now = time.time() if now is None else now
+    try:
+        names = os.listdir(JOB_STORAGE_DIR)
+    except FileNotFoundError:
+        return []
+    active = db.scalars(select(models.Job).where(models.Job.status.in_(ACTIVE_STATUSES)))
+    needed = {name for job in active for name in job_files(job)}
+
+    removed = []
+    for name in names:
+        if name in needed:
+            continue
+        if name.startswith("job-"):
+            max_age = JOB_RESULT_RETENTION_SECONDS
+        elif name.startswith("upload-"):
+            max_age = JOB_UPLOAD_GRACE_SECONDS # Younger ones may still be streaming in ahead of their job
+        else:
+            continue
+        try:
+            expired = os.path.getmtime(os.path.join(JOB_STORAGE_DIR, name)) < now - max_age
+        except FileNotFoundError:
+            continue
+        if expired:
+            remove_file(name)
+            removed.append(name)
+    return removed
+
+# Job handlers (worker processes)
+def _counted(rows: Iterable[Any], total: int, report: ProgressReporter, start: float, span: float, message: str) -> Iterator[Any]:
+    for count, row in enumerate(rows, 1):
+        if count % 5000 == 0:
+            report(start + span * count / max(total, 1), message)
+        yield row
+
+def _run_analysis(db: Session, job: models.Job, report: ProgressReporter) -> Dict[str, Any]:
+    version = crud.get_project_version(db, project_id=job.project_id, user_id=job.user_id)
+    if version is None:
+        raise JobError("Project not found")
+    report(0.1, "Loading topology")
+    arrays = analysis.load_topology_arrays(db, job.project_id)
+    report(0.5, "Analyzing")
+    return {"revision": version[0], **analysis.analyze(arrays, **job.params)}
+
+def _run_export(db: Session, job: models.Job, report: ProgressReporter) -> Dict[str, Any]:
+    version = crud.get_project_version(db, project_id=job.project_id, user_id=job.user_id)
+    if version is None:
+        raise JobError("Project not found")
+    report(0.1, "Writing export")
+    filename = export_filename(job.id)
+    try:
+        with open(storage_path(filename), "wb") as export:
+            columnar.write_topology(
+                export,
+                crud.iter_project_device_rows(db, job.project_id),
+                crud.iter_project_link_rows(db, job.project_id),
+                codec=job.params.get("codec", "none"),
+            )
+    except BaseException:
+        remove_file(filename)
+        raise
+    return {"revision": version[0], "filename": filename, "size": os.path.getsize(storage_path(filename))}
+
+def _import_rows(db: Session, job: models.Job, devices: Iterable[Any], links: Iterable[Any]) -> Optional[schemas.TopologyImportSummary]:
+    if not database.IS_SQLITE:
+        # Other databases lock only the rows involved, so the import stays a single transaction
+        return crud.bulk_import_topology_rows(db, job.project_id, job.user_id, devices, links)
+    # The job process has no access to the web processes' write queues; committing in batches and swapping
+    # the rows in at the end keeps the database write lock free for their writes (see crud.stage_topology_rows)
+    staging_id = -job.id
+    try:
+        counts = crud.stage_topology_rows(db, staging_id, devices, links)
+        return crud.publish_staged_topology(db, job.project_id, job.user_id, staging_id, *counts)
+    except BaseException:
+        db.rollback()
+        crud.discard_staged_topology(db, staging_id)
+        raise
+
+def _run_import(db: Session, job: models.Job, report: ProgressReporter) -> Dict[str, Any]:
+    try:
+        with columnar.TopologyReader(storage_path(job.params["upload"])) as reader:
+            total = reader.device_count + reader.link_count
+            device_share = reader.device_count / max(total, 1)
+            summary = _import_rows(
+                db,
+                job,
+                devices=_counted(reader.iter_devices(), reader.device_count, report, 0.0, device_share * 0.9, "Importing devices"),
+                links=_counted(reader.iter_links(), reader.link_count, report, device_share * 0.9, (1 - device_share) * 0.9, "Importing links"),
+            )
+    except columnar.FormatError as exc:
+        raise JobError(str(exc)) from exc
+    finally:
+        remove_file(job.params["upload"])
+    if summary is None:
+        raise JobError("Project not found")
+    return summary.model_dump()
+
+def _run_layout(db: Session, job: models.Job, report: ProgressReporter) -> Dict[str, Any]:
+    version = crud.get_project_version(db, project_id=job.project_id, user_id=job.user_id)
+    if version is None:
+        raise JobError("Project not found")
+    # Without a base revision the layout applies to the topology it was computed from
+    base_revision = job.params.get("base_revision")
+    base_revision = version[0] if base_revision is None else base_revision
+    report(0.0, "Computing layout")
+    device_count, positions, seconds = layout.layout_project(
+        db, job.project_id, job.params, lambda fraction: report(0.9 * fraction, "Computing layout")
+    )
+    report(0.9, "Writing positions")
+    try:
+        revision = crud.update_device_positions(db, job.project_id, job.user_id, positions, base_revision)
+    except crud.StaleRevisionError as exc:
+        raise JobError(f"Topology was modified during the layout; current revision is {exc.current_revision}") from exc
+    if revision is None:
+        raise JobError("Project not found")
+    return schemas.LayoutResult(
+        revision=revision, algorithm=job.params["algorithm"], device_count=device_count,
+        moved_device_count=len(positions), seconds=round(seconds, 3),
+    ).model_dump()
+
+HANDLERS: Dict[str, Callable[[Session, models.Job, ProgressReporter], Dict[str, Any]]] = {
+    "analysis": _run_analysis,
+    "export": _run_export,
+    "import": _run_import,
+    "layout": _run_layout,
+}
+
+def run_job(job_id: int, progress: Any) -> None:
+    """Entry point in the worker process. `progress` is the manager dict shared with the web process."""
+    def report(fraction: float, message: Optional[str] = None) -> None:
+        progress[job_id] = (min(max(fraction, 0.0), 1.0), message)
+
+    with database.SessionLocal() as db:
+        # Claim the job; another web process may have requeued and dispatched it as well
+        claimed = db.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.status == "queued")
+            .values(status="running", started_at=datetime.utcnow(), message="Starting")
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return
+        job = db.get(models.Job, job_id)
+        try:
+            result = HANDLERS[job.kind](db, job, report)
+        except JobError as exc:
+            db.rollback()
+            _finish(db, job_id, "failed", error=str(exc))
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Job %s failed", job_id)
+            _finish(db, job_id, "failed", error=f"Internal error: {type(exc).__name__}")
+        else:
+            _finish(db, job_id, "succeeded", result=result)
+        finally:
+            progress.pop(job_id, None)
+
+class JobManager:
+    """Dispatches job ids to the worker process pool; both are created on first use."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._sync_manager = None
+        self._progress = None
+        self._last_sweep = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context("spawn")
+                if self._sync_manager is None:
+                    self._sync_manager = context.Manager()
+                    self._progress = self._sync_manager.dict()
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def submit(self, job_id: int) -> None:
+        executor = self._pool()
+        future = executor.submit(run_job, job_id, self._progress)
+        future.add_done_callback(lambda done: self._on_done(job_id, executor, done))
+        self.sweep(force=False)
+
+    def sweep(self, force: bool = True) -> None:
+        """Deletes expired and orphaned job files; unless forced, at most every JOB_SWEEP_INTERVAL_SECONDS."""
+        with self._lock:
+            if not force and time.monotonic() - self._last_sweep < JOB_SWEEP_INTERVAL_SECONDS:
+                return
+            self._last_sweep = time.monotonic()
+        try:
+            with database.SessionLocal() as db:
+                removed = sweep_job_files(db)
+        except Exception:
+            logger.exception("Could not sweep job files")
+            return
+        if removed:
+            logger.info("Removed %s expired or orphaned job files", len(removed))
+
+    def _on_done(self, job_id: int, executor: ProcessPoolExecutor, future: Future) -> None:
+        # run_job records its own outcome; this only catches workers that died mid-job
+        if future.cancelled() or future.exception() is None:
+            return
+        logger.error("Worker process for job %s failed: %r", job_id, future.exception())
+        if isinstance(future.exception(), BrokenProcessPool):
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None # The next submission starts a fresh pool
+        database.write_queue.run(_fail_crashed, job_id)
+
+    def progress(self, job_id: int) -> Optional[Tuple[float, Optional[str]]]:
+        if self._progress is None:
+            return None
+        return self._progress.get(job_id)
+
+    def recover(self) -> None:
+        """Requeues and dispatches the jobs left behind by web processes that are no longer running."""
+        for job_id in database.write_queue.run(requeue_orphaned_jobs):
+            self.submit(job_id)
+        self.sweep()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                # Running jobs are abandoned and picked up again by recover() on the next start
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._sync_manager is not None:
+                self._sync_manager.shutdown()
+                self._sync_manager = None
+                self._progress = None
+
+manager = JobManager(JOB_WORKERS)
@@ -0,0 +1,339 @@
+# Server-side automatic layout.
+# "force" is Fruchterman-Reingold started from PivotMDS. The initial layout gets the global shape right
+# in a few BFS passes, so the force iterations only need to settle it locally. Repulsion is limited to
+# REPULSION_RADIUS, as in FR's grid variant. Devices are binned into square cells and the cell counts are
+# convolved (FFT) with the repulsion kernel, which costs O(n + G^2 log G) per iteration instead of O(n^2).
+# Devices that share a cell repel each other exactly. Attraction along links is exact.
+# "hierarchical" places devices in layers by device_type, with firewalls and routers on top and hosts at
+# the bottom. It orders each layer by the barycenter of its neighbours to reduce crossings.
+#
+# Both keep pinned devices where they are. Incremental runs start from the stored positions (devices
+# without one start next to their positioned neighbours) and move devices less, so small edits to a
+# laid-out topology do not reshuffle it.
+import math
+import os
+import time
+from dataclasses import dataclass
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.fft import irfft2, next_fast_len, rfft2
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import shortest_path
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Larger projects are laid out by a background job rather than within the request
+LAYOUT_SYNC_MAX_DEVICES = int(os.getenv("LAYOUT_SYNC_MAX_DEVICES", "5000"))
+REPULSION_RADIUS = 5.0 # In units of spacing; beyond it devices no longer repel (Fruchterman-Reingold's grid variant)
+MAX_GRID_SIDE = 1024
+MAX_CELL_PARTNERS = 16
+PIVOT_COUNT = 50
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+# Layer of each device type in hierarchical layouts; other types go to a layer below these
+TYPE_LAYERS = {"Firewall": 0, "Router": 1, "Switch": 2, "Server": 3, "PC": 3}
+BARYCENTER_SWEEPS = 4
+
+ProgressCallback = Callable[[float], None]
+
+@dataclass
+class LayoutGraph:
+    device_ids: np.ndarray # Sorted DB ids; positions in this array index everything else
+    device_types: List[Optional[str]]
+    x: np.ndarray # NaN where the device has no stored position
+    y: np.ndarray
+    link_source: np.ndarray # Device positions, not DB ids
+    link_target: np.ndarray
+
+    @property
+    def positions(self) -> np.ndarray:
+        return np.column_stack([self.x, self.y])
+
+def load_layout_graph(db: Session, project_id: int) -> LayoutGraph:
+    device_rows = db.execute(
+        select(models.Device.id, models.Device.device_type, models.Device.x_position, models.Device.y_position)
+        .where(models.Device.project_id == project_id)
+        .order_by(models.Device.id)
+    ).all()
+    device_ids = np.fromiter((row[0] for row in device_rows), dtype=np.int64, count=len(device_rows))
+    x = np.fromiter((np.nan if row[2] is None else row[2] for row in device_rows), dtype=np.float64, count=len(device_rows))
+    y = np.fromiter((np.nan if row[3] is None else row[3] for row in device_rows), dtype=np.float64, count=len(device_rows))
+
+    link_rows = db.execute(
+        select(models.Link.source_device_id, models.Link.target_device_id).where(models.Link.project_id == project_id)
+    ).all()
+    links = np.fromiter(chain.from_iterable(link_rows), dtype=np.int64, count=2 * len(link_rows)).reshape(-1, 2)
+    source = np.minimum(np.searchsorted(device_ids, links[:, 0]), max(len(device_ids) - 1, 0))
+    target = np.minimum(np.searchsorted(device_ids, links[:, 1]), max(len(device_ids) - 1, 0))
+    # Drop links whose endpoints are not devices of this project, and self-loops
+    valid = (device_ids[source] == links[:, 0]) & (device_ids[target] == links[:, 1]) & (source != target) if len(device_ids) else np.zeros(len(links), dtype=bool)
+    return LayoutGraph(device_ids, [row[1] for row in device_rows], x, y, source[valid], target[valid])
+
+def _scatter_add(index: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    # bincount returns integers when there is nothing to add
+    return np.column_stack([np.bincount(index, weights=values[:, 0], minlength=n),
+                            np.bincount(index, weights=values[:, 1], minlength=n)]).astype(np.float64, copy=False)
+
+def initial_positions(graph: LayoutGraph, spacing: float, incremental: bool, rng: np.random.Generator) -> np.ndarray:
+    """Stored positions (incremental) or PivotMDS; devices without a position start next to their placed neighbours."""
+    n = len(graph.device_ids)
+    side = spacing * math.sqrt(max(n, 1))
+    positions = graph.positions if incremental else np.full((n, 2), np.nan)
+    placed = ~np.isnan(positions).any(axis=1)
+    if not placed.any():
+        return pivot_mds(graph, spacing, rng) if n > 2 else rng.uniform(0, side, size=(n, 2))
+    # A few rounds of "average of placed neighbours", then random spots around the placed devices
+    source, target = graph.link_source, graph.link_target
+    for _ in range(8):
+        if placed.all():
+            break
+        usable = placed[source] & ~placed[target], placed[target] & ~placed[source]
+        receivers = np.concatenate([target[usable[0]], source[usable[1]]])
+        if not len(receivers):
+            break
+        senders = np.concatenate([source[usable[0]], target[usable[1]]])
+        sums = _scatter_add(receivers, positions[senders], n)
+        counts = np.bincount(receivers, minlength=n)
+        newly = counts > 0
+        positions[newly] = sums[newly] / counts[newly, None] + rng.normal(0, spacing / 2, size=(int(newly.sum()), 2))
+        placed |= newly
+    low, high = positions[placed].min(axis=0), positions[placed].max(axis=0)
+    positions[~placed] = rng.uniform(low - spacing, high + spacing, size=(int((~placed).sum()), 2))
+    return positions
+
+def pivot_mds(graph: LayoutGraph, spacing: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    PivotMDS (Brandes & Pich): classical MDS on the hop distances to a few far-apart pivot devices, which
+    gives a global layout with link lengths near `spacing` in a handful of BFS passes and one small SVD.
+    """
+    n = len(graph.device_ids)
+    adjacency = coo_matrix((np.ones(len(graph.link_source)), (graph.link_source, graph.link_target)), shape=(n, n)).tocsr()
+    pivot_count = min(PIVOT_COUNT, n)
+    distances = np.empty((pivot_count, n))
+    nearest = np.full(n, np.inf)
+    pivot = int(rng.integers(n))
+    for i in range(pivot_count):
+        distances[i] = shortest_path(adjacency, directed=False, unweighted=True, indices=pivot)
+        np.minimum(nearest, distances[i], out=nearest)
+        # Next pivot: the device farthest from all pivots so far (unreachable ones first)
+        pivot = int(np.argmax(nearest))
+    finite = np.isfinite(distances)
+    # Other components are treated as a little farther away than anything reachable
+    distances[~finite] = (distances[finite].max() if finite.any() else 0) + 2
+    squared = distances.T ** 2
+    centered = -0.5 * (squared - squared.mean(axis=0) - squared.mean(axis=1)[:, None] + squared.mean())
+    _, singular_values, components = np.linalg.svd(centered, full_matrices=False)
+    dimensions = min(2, len(singular_values))
+    positions = np.zeros((n, 2))
+    positions[:, :dimensions] = centered @ components[:dimensions].T / np.sqrt(np.maximum(singular_values[:dimensions], 1e-12))
+    # MDS keeps hop distances only up to scale; scale so that the mean link is `spacing` long
+    lengths = np.sqrt(((positions[graph.link_source] - positions[graph.link_target]) ** 2).sum(axis=1))
+    mean_length = float(lengths.mean()) if len(lengths) else 0.0
+    positions *= spacing / mean_length if mean_length > 0 else spacing
+    # Leaves start on their only neighbour (pivot leaves would otherwise stay far out) and are fanned out around it
+    degree = np.bincount(np.concatenate([graph.link_source, graph.link_target]), minlength=n)
+    for ends, other_ends in ((graph.link_source, graph.link_target), (graph.link_target, graph.link_source)):
+        leaf = degree[ends] == 1
+        positions[ends[leaf]] = positions[other_ends[leaf]]
+    positions = spread_coincident(positions, spacing)
+    # Small-diameter graphs (random, hub-heavy) still come out crowded: give the devices at least the area of
+    # a disc holding n devices `spacing` apart, whose median distance from the centre is spacing * sqrt(n / 2 pi)
+    median_radius = float(np.median(np.sqrt(((positions - positions.mean(axis=0)) ** 2).sum(axis=1))))
+    if median_radius > 0:
+        positions *= max(1.0, spacing * math.sqrt(n / (2 * math.pi)) / median_radius)
+    return positions
+
+def spread_coincident(positions: np.ndarray, spacing: float) -> np.ndarray:
+    """
+    Devices with the same hop profile (the leaves of a star, the hosts of one switch) get the same MDS
+    position. Each such group is fanned out on a golden-angle spiral, a disc with devices about `spacing` apart.
+    """
+    cell = np.round(positions / (spacing / 2)).astype(np.int64)
+    _, group, sizes = np.unique(cell, axis=0, return_inverse=True, return_counts=True)
+    group = group.ravel()
+    order = np.argsort(group, kind="stable")
+    rank = np.empty(len(positions))
+    rank[order] = np.arange(len(positions)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    radius = 0.55 * spacing * np.sqrt(rank)
+    angle = rank * GOLDEN_ANGLE
+    return positions + np.column_stack([radius * np.cos(angle), radius * np.sin(angle)])
+
+def _pair_runs(first: np.ndarray, counts: np.ndarray, owners: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """All (owner, first + j) for j < count, vectorized: the CSR expansion of per-owner runs."""
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(owners, counts), np.repeat(first, counts) + offsets
+
+def _convolve(image: np.ndarray, *kernels: np.ndarray) -> List[np.ndarray]:
+    """Same-size 2-D convolutions of the image with odd-sized, centred kernels of one shape, via FFT."""
+    rows, columns = image.shape
+    reach_y, reach_x = kernels[0].shape[0] // 2, kernels[0].shape[1] // 2
+    shape = (next_fast_len(rows + 2 * reach_y, real=True), next_fast_len(columns + 2 * reach_x, real=True))
+    image_spectrum = rfft2(image, shape)
+    return [irfft2(image_spectrum * rfft2(kernel, shape), shape)[reach_y:reach_y + rows, reach_x:reach_x + columns]
+            for kernel in kernels]
+
+def _grid_repulsion(positions: np.ndarray, spacing: float) -> np.ndarray:
+    """
+    FR repulsion spacing^2 / distance from every device within REPULSION_RADIUS * spacing. Devices are
+    counted into square cells; the repulsion of other cells comes from convolving the counts with the
+    kernel (FFT), devices sharing a cell repel each other exactly, each with at most MAX_CELL_PARTNERS others.
+    """
+    n = len(positions)
+    # The grid spans all but a few outliers (the far-flung leaves of a hub), which share its border cells
+    low, high = np.percentile(positions, [0.5, 99.5], axis=0)
+    low, high = low - REPULSION_RADIUS * spacing, high + REPULSION_RADIUS * spacing
+    cell_size = max(spacing, float((high - low).max()) / MAX_GRID_SIDE)
+    columns, rows = (((high - low) // cell_size).astype(np.int64) + 1).tolist()
+    cell = np.clip(((positions - low) // cell_size).astype(np.int64), 0, [columns - 1, rows - 1])
+    key = cell[:, 1] * columns + cell[:, 0]
+    density = np.bincount(key, minlength=rows * columns).reshape(rows, columns).astype(np.float64)
+
+    reach = max(1, int(REPULSION_RADIUS * spacing / cell_size))
+    offsets = np.arange(-reach, reach + 1) * cell_size
+    kernel_x, kernel_y = np.meshgrid(offsets, offsets)
+    distance2 = kernel_x ** 2 + kernel_y ** 2
+    strength = np.divide(spacing * spacing, distance2, out=np.zeros_like(distance2), where=distance2 > 0)
+    strength[distance2 > (REPULSION_RADIUS * spacing) ** 2] = 0
+    field_x, field_y = _convolve(density, kernel_x * strength, kernel_y * strength)
+    displacement = np.column_stack([field_x[cell[:, 1], cell[:, 0]], field_y[cell[:, 1], cell[:, 0]]])
+
+    # Same cell: each device with the next devices of its cell
+    order = np.argsort(key, kind="stable")
+    _, cell_start, cell_count = np.unique(key[order], return_index=True, return_counts=True)
+    slot = np.arange(n)
+    cell_end = np.repeat(cell_start + cell_count, cell_count)
+    owners, partners = _pair_runs(slot + 1, np.minimum(cell_end - slot - 1, MAX_CELL_PARTNERS), slot)
+    a, b = order[owners], order[partners]
+    delta = positions[a] - positions[b]
+    push = delta * (spacing * spacing / np.maximum((delta * delta).sum(axis=1), 1e-4 * spacing * spacing))[:, None]
+    return displacement + _scatter_add(a, push, n) - _scatter_add(b, push, n)
+
+def force_directed_layout(graph: LayoutGraph, pinned: np.ndarray, iterations: int = 100, spacing: float = 100.0,
+                          incremental: bool = False, seed: int = 0, progress: Optional[ProgressCallback] = None) -> np.ndarray:
+    """Positions (n x 2) with links about `spacing` long; rows of pinned devices are their stored positions."""
+    n = len(graph.device_ids)
+    rng = np.random.default_rng(seed)
+    positions = initial_positions(graph, spacing, incremental or bool(pinned.any()), rng)
+    if n < 2:
+        return positions
+    positions[pinned] = graph.positions[pinned]
+    movable = ~pinned
+    source, target = graph.link_source, graph.link_target
+    # Links of hubs pull less, or local repulsion could not keep the hub's many neighbours apart
+    degree = np.bincount(np.concatenate([source, target]), minlength=n)
+    mean_degree = max(2 * len(source) / n, 1.0)
+    link_weight = np.minimum(1.0, mean_degree / np.maximum(degree[source], degree[target]))
+
+    # Incremental runs start cool so the existing picture is kept; cooling ends at a small fraction of spacing
+    start_temperature = spacing * (0.2 if incremental else 2.0)
+    cooling = (0.02 * spacing / start_temperature) ** (1 / max(iterations - 1, 1))
+    temperature = start_temperature
+    for iteration in range(iterations):
+        displacement = _grid_repulsion(positions, spacing)
+        delta = positions[target] - positions[source]
+        distance = np.sqrt((delta * delta).sum(axis=1))
+        pull = delta * (distance / spacing * link_weight)[:, None] # FR attraction distance^2 / spacing along the link
+        displacement += _scatter_add(source, pull, n) - _scatter_add(target, pull, n)
+
+        length = np.sqrt((displacement * displacement).sum(axis=1))
+        step = np.minimum(length, temperature) / np.maximum(length, 1e-9)
+        positions[movable] += displacement[movable] * step[movable, None]
+        temperature *= cooling
+        if progress is not None and iteration % 10 == 9:
+            progress((iteration + 1) / iterations)
+    return positions
+
+def _layer_of(device_type: Optional[str]) -> int:
+    return TYPE_LAYERS.get(device_type, max(TYPE_LAYERS.values()) + 1)
+
+def hierarchical_layout(graph: LayoutGraph, pinned: np.ndarray, spacing: float = 100.0, incremental: bool = False,
+                        progress: Optional[ProgressCallback] = None) -> np.ndarray:
+    """Layers by device type, top to bottom; wide layers wrap into several rows."""
+    n = len(graph.device_ids)
+    if n == 0:
+        return np.empty((0, 2))
+    layers = np.fromiter((_layer_of(device_type) for device_type in graph.device_types), dtype=np.int64, count=n)
+    used_layers = np.unique(layers)
+
+    # Order within a layer: stored x for incremental runs, otherwise id order; then barycenter sweeps
+    order_key = np.where(np.isnan(graph.x), np.arange(n), graph.x) if incremental else np.arange(n, dtype=np.float64)
+    rank = np.empty(n)
+    def rerank(values: np.ndarray) -> None:
+        for layer in used_layers:
+            members = np.flatnonzero(layers == layer)
+            rank[members[np.argsort(values[members], kind="stable")]] = np.linspace(0, 1, len(members)) if len(members) > 1 else 0.5
+    rerank(order_key)
+
+    source, target = graph.link_source, graph.link_target
+    sweep_layers = list(used_layers[1:]) + list(used_layers[-2::-1])
+    for sweep in range(BARYCENTER_SWEEPS):
+        for position, layer in enumerate(sweep_layers):
+            downward = position < len(used_layers) - 1
+            neighbour_layer = used_layers[np.searchsorted(used_layers, layer) + (-1 if downward else 1)]
+            # Links between this layer and the neighbouring one, from this layer's side
+            forward = (layers[source] == layer) & (layers[target] == neighbour_layer)
+            backward = (layers[target] == layer) & (layers[source] == neighbour_layer)
+            members = np.concatenate([source[forward], target[backward]])
+            others = np.concatenate([target[forward], source[backward]])
+            sums = np.bincount(members, weights=rank[others], minlength=n)
+            counts = np.bincount(members, minlength=n)
+            barycenter = np.where(counts > 0, sums / np.maximum(counts, 1), rank)
+            in_layer = np.flatnonzero(layers == layer)
+            ordered = in_layer[np.argsort(barycenter[in_layer], kind="stable")]
+            rank[ordered] = np.linspace(0, 1, len(ordered)) if len(ordered) > 1 else 0.5
+        if progress is not None:
+            progress((sweep + 1) / BARYCENTER_SWEEPS)
+
+    # Wrap each layer into rows of at most `width` devices, centred on x = 0
+    width = max(8, int(math.ceil(2 * math.sqrt(n))))
+    positions = np.empty((n, 2))
+    y = 0.0
+    for layer in used_layers:
+        members = np.flatnonzero(layers == layer)
+        members = members[np.argsort(rank[members], kind="stable")]
+        slot = np.arange(len(members))
+        row, column = slot // width, slot % width
+        row_length = np.minimum(len(members) - row * width, width)
+        positions[members, 0] = (column - (row_length - 1) / 2) * spacing
+        positions[members, 1] = y + row * spacing
+        y += (row.max() + 1) * spacing + 2 * spacing # Gap between layers
+    if pinned.any():
+        positions[pinned] = graph.positions[pinned]
+    return positions
+
+def compute_layout(graph: LayoutGraph, algorithm: str, pinned_device_ids: List[int], iterations: int, spacing: float,
+                   incremental: bool, seed: int, progress: Optional[ProgressCallback] = None) -> np.ndarray:
+    """Positions for every device of the graph. Pinned devices without a stored position are laid out normally."""
+    pinned = np.zeros(len(graph.device_ids), dtype=bool)
+    if pinned_device_ids and len(graph.device_ids):
+        wanted = np.asarray(pinned_device_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(graph.device_ids, wanted), len(graph.device_ids) - 1)
+        pinned[positions[graph.device_ids[positions] == wanted]] = True
+    pinned &= ~np.isnan(graph.positions).any(axis=1)
+    if algorithm == "hierarchical":
+        return hierarchical_layout(graph, pinned, spacing, incremental, progress)
+    return force_directed_layout(graph, pinned, iterations, spacing, incremental, seed, progress)
+
+def layout_project(db: Session, project_id: int, options: Dict[str, Any],
+                   progress: Optional[ProgressCallback] = None) -> Tuple[int, Dict[int, Tuple[float, float]], float]:
+    """
+    Computes a layout of the project with the LayoutRequest fields in `options`. Returns the device count,
+    the new positions of the devices that moved (device id -> (x, y)) and the seconds spent.
+    """
+    start = time.perf_counter()
+    graph = load_layout_graph(db, project_id)
+    positions = compute_layout(
+        graph, options["algorithm"], options["pinned_device_ids"], options["iterations"], options["spacing"],
+        options["incremental"], options["seed"], progress,
+    )
+    positions = np.round(positions, 2)
+    moved = (positions != graph.positions).any(axis=1) # NaN (never placed) compares unequal as well
+    moved_positions = {
+        device_id: (x, y)
+        for device_id, x, y in zip(graph.device_ids[moved].tolist(), positions[moved, 0].tolist(), positions[moved, 1].tolist())
+    }
+    return len(graph.device_ids), moved_positions, time.perf_counter() - start
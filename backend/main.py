@@ -1,19 +1,61 @@
-from fastapi import FastAPI
-from .database import Base, engine
-from . import models # Import all models to ensure they are registered with Base
+import os
+from contextlib import asynccontextmanager
 
-from .routers import auth as auth_router, projects as projects_router, topology as topology_router # Import routers
+from fastapi import FastAPI, Query, WebSocket, status
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from .database import async_engine, engine
+from . import collab, instrumentation, jobs, metrics, models # Import all models to ensure they are registered with Base
+from .migrations import prepare_database
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from .routers import auth as auth_router, projects as projects_router, topology as topology_router, analysis as analysis_router, history as history_router, jobs as jobs_router, graph as graph_router, layout as layout_router # Import routers
 
-app = FastAPI()
+instrumentation.configure_logging()
+instrumentation.instrument_engine(engine)
+if async_engine is not None:
+    instrumentation.instrument_engine(async_engine.sync_engine)
+
+# Create the tables of a new database and migrate older ones on startup. Set DB_AUTO_MIGRATE=0 when a
+# deployment runs `python -m backend.migrations` once before starting its workers.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_AUTO_MIGRATE:
+        await run_in_threadpool(prepare_database, engine)
+    # Resume background jobs interrupted by the previous shutdown or crash
+    await run_in_threadpool(jobs.manager.recover)
+    yield
+    jobs.manager.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
 
 # Include routers
 app.include_router(auth_router.router)
 app.include_router(projects_router.router)
 app.include_router(topology_router.router)
+app.include_router(analysis_router.router)
+app.include_router(graph_router.router)
+app.include_router(layout_router.router)
+app.include_router(history_router.router)
+app.include_router(jobs_router.router)
 
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.websocket("/ws/projects/{project_id}")
+async def project_collaboration(websocket: WebSocket, project_id: int, token: str = Query(...)):
+    # Browsers cannot set an Authorization header on WebSocket requests, so the token comes as a query parameter
+    session = await collab.authenticate(token, project_id)
+    if session is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    user, revision = session
+    await websocket.accept()
+    await collab.serve(websocket, project_id, user.id, revision)
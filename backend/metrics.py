@@ -0,0 +1,176 @@
+# Prometheus metrics and per-request statistics.
+# A small in-process registry of counters and histograms rendered in the Prometheus text exposition format
+# (served on /metrics by main.py). Each process has its own registry; with several uvicorn workers every
+# scrape sees one worker, which Prometheus aggregates like any other multi-instance target.
+#
+# RequestStats accumulates what a single HTTP request spent (SQL statements, DB time, serialization time);
+# it lives in a context variable so engine events and serializers running in worker threads of the request
+# (run_in_threadpool copies the context, and so does the write queue) add to the right request.
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+TOPOLOGY_BUCKETS = (10, 100, 1e3, 1e4, 1e5, 1e6)
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _escape(value: str) -> str:
+    return _escape_help(value).replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {_escape_help(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values)
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: observation count per bucket (the last slot is +Inf), then the sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status code.", ("method", "route", "status")))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route")))
+HTTP_RESPONSE_SIZE = REGISTRY.register(Histogram(
+    "http_response_size_bytes", "HTTP response body size.", ("method", "route"), SIZE_BUCKETS))
+HTTP_REQUEST_SIZE = REGISTRY.register(Histogram(
+    "http_request_size_bytes", "HTTP request body size (Content-Length).", ("method", "route"), SIZE_BUCKETS))
+REQUEST_DB_STATEMENTS = REGISTRY.register(Histogram(
+    "http_request_db_statements", "SQL statements executed per request; growth with data size means N+1 queries.",
+    ("method", "route"), COUNT_BUCKETS))
+REQUEST_DB_TIME = REGISTRY.register(Histogram(
+    "http_request_db_seconds", "Total SQL execution time per request.", ("method", "route")))
+REQUEST_SERIALIZATION_TIME = REGISTRY.register(Histogram(
+    "http_request_serialization_seconds", "Time spent encoding response payloads per request.", ("method", "route")))
+DB_STATEMENT_DURATION = REGISTRY.register(Histogram(
+    "db_statement_duration_seconds", "Duration of individual SQL statements.", ("operation",)))
+TOPOLOGY_DEVICES = REGISTRY.register(Histogram(
+    "topology_devices", "Devices per topology read or written.", ("operation",), TOPOLOGY_BUCKETS))
+TOPOLOGY_LINKS = REGISTRY.register(Histogram(
+    "topology_links", "Links per topology read or written.", ("operation",), TOPOLOGY_BUCKETS))
+
+@dataclass
+class RequestStats:
+    db_statements: int = 0
+    db_seconds: float = 0.0
+    serialization_seconds: float = 0.0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def start_request() -> Tuple[RequestStats, object]:
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+def end_request(token: object) -> None:
+    _request_stats.reset(token)
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+def record_statement(operation: str, seconds: float) -> None:
+    DB_STATEMENT_DURATION.observe(seconds, operation=operation)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_statements += 1
+        stats.db_seconds += seconds
+
+class serialization_timer:
+    """Adds the time spent in the block to the current request's serialization time."""
+
+    def __enter__(self) -> "serialization_timer":
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.serialization_seconds += perf_counter() - self._start
+
+def observe_topology(operation: str, devices: int, links: int) -> None:
+    TOPOLOGY_DEVICES.observe(devices, operation=operation)
+    TOPOLOGY_LINKS.observe(links, operation=operation)
@@ -0,0 +1,219 @@
+# Schema migrations for databases created before a model change.
+# Base.metadata.create_all only creates missing tables, so columns and indexes added to existing tables
+# are applied here. Each migration runs once, in order, and is recorded in the schema_migrations table;
+# steps are written to be no-ops on fresh databases where create_all already built the current schema.
+#
+# prepare_database does both once per deployment rather than once per worker: the app runs it on startup
+# (DB_AUTO_MIGRATE=0 turns that off), or it runs as a one-shot step before the workers start:
+#   python -m backend.migrations
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+try:
+    import fcntl
+except ImportError: # Not on Windows; SQLite's own write lock then keeps concurrent migrations apart
+    fcntl = None
+
+from sqlalchemy import JSON, Column, DateTime, ForeignKeyConstraint, MetaData, String, Table, bindparam, column, inspect, select, table, text, update
+from sqlalchemy.engine import Connection, Engine
+
+from . import cache, models # noqa: F401 - models registers the model tables on Base
+from .database import Base
+
+_migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+def _add_column(conn: Connection, table: str, column_ddl: str) -> None:
+    column_name = column_ddl.split()[0]
+    if column_name not in {column["name"] for column in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column_ddl}"))
+
+def _create_indexes(conn: Connection, *names: str) -> None:
+    # Index definitions live on the models; look them up by name so a migration keeps creating exactly the
+    # indexes it was written for even after later model changes add more
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+def _0001_project_revision(conn: Connection) -> None:
+    _add_column(conn, "projects", "revision INTEGER NOT NULL DEFAULT 0")
+
+def _0002_foreign_key_indexes(conn: Connection) -> None:
+    _create_indexes(
+        conn,
+        "ix_projects_user_id_last_modified",
+        "ix_devices_project_id",
+        "ix_links_project_id",
+        "ix_links_source_device_id",
+        "ix_links_target_device_id",
+    )
+
+# Frozen copy of the typed device columns as of 0003; later changes to models.DEVICE_PROPERTY_COLUMNS or to
+# crud's conversion must not change what this migration writes into databases that have not run it yet
+_0003_DEVICE_PROPERTY_COLUMNS = {
+    "num_ports": (int, "INTEGER"),
+    "total_bandwidth": (float, "FLOAT"),
+    "throughput_per_port": (float, "FLOAT"),
+    "estimated_load": (float, "FLOAT"),
+    "x_position": (float, "FLOAT"),
+    "y_position": (float, "FLOAT"),
+}
+
+def _0003_property_values(properties) -> Dict[str, Any]:
+    values = {}
+    for name, (kind, _) in _0003_DEVICE_PROPERTY_COLUMNS.items():
+        value = (properties or {}).get(name)
+        try:
+            values[name] = None if value is None or isinstance(value, bool) else kind(value)
+        except (TypeError, ValueError):
+            values[name] = None
+    return values
+
+def _0003_device_property_columns(conn: Connection) -> None:
+    for name, (_, sql_type) in _0003_DEVICE_PROPERTY_COLUMNS.items():
+        _add_column(conn, "devices", f"{name} {sql_type}")
+
+    # Backfill the typed columns from the JSON in id-ordered batches (portable across backends)
+    devices = table("devices", column("id"), column("properties", JSON), *(column(name) for name in _0003_DEVICE_PROPERTY_COLUMNS))
+    backfill = (
+        update(devices)
+        .where(devices.c.id == bindparam("device_id"))
+        .values({name: bindparam(name) for name in _0003_DEVICE_PROPERTY_COLUMNS})
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(devices.c.id, devices.c.properties).where(devices.c.id > last_id).order_by(devices.c.id).limit(5000)
+        ).all()
+        if not rows:
+            break
+        conn.execute(backfill, [{"device_id": device_id, **_0003_property_values(properties)} for device_id, properties in rows])
+        last_id = rows[-1][0]
+
+    _create_indexes(
+        conn,
+        "ix_devices_project_id_device_type",
+        "ix_devices_project_id_estimated_load",
+        "ix_devices_project_id_total_bandwidth",
+    )
+
+def _rebuild_with_autoincrement(conn: Connection, name: str) -> None:
+    # SQLite cannot add AUTOINCREMENT to an existing table, so this follows its documented rebuild: create the
+    # new table, copy the rows with their ids, drop the old table, rename the new one and recreate the indexes.
+    # Copying the ids seeds sqlite_sequence with the current maximum. The definition is reflected from the
+    # database rather than taken from the models so the rebuild keeps exactly the columns the table has.
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    metadata = MetaData()
+    old = Table(name, metadata, autoload_with=conn)
+    foreign_keys = [
+        ForeignKeyConstraint([element.parent.name for element in constraint.elements],
+                             [element.target_fullname for element in constraint.elements])
+        for constraint in old.foreign_key_constraints
+    ]
+    rebuilt = Table(f"_{name}_rebuild", metadata, *(column._copy() for column in old.columns), *foreign_keys,
+                    sqlite_autoincrement=True)
+    conn.execute(text("PRAGMA defer_foreign_keys = ON")) # Other tables reference this one while it is swapped
+    rebuilt.create(conn)
+    columns = ", ".join(conn.dialect.identifier_preparer.quote(column.name) for column in old.columns)
+    conn.execute(text(f"INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    conn.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {name}"))
+    for index in old.indexes:
+        index.create(conn)
+
+def _0004_autoincrement_device_and_link_ids(conn: Connection) -> None:
+    # Clients key changesets on device and link ids, so an id must not come back after its row was removed.
+    # Other backends never reuse sequence values; create_all already builds new SQLite tables this way.
+    if conn.dialect.name != "sqlite":
+        return
+    for name in ("devices", "links"):
+        _rebuild_with_autoincrement(conn, name)
+
+def _0005_user_listing_version(conn: Connection) -> None:
+    _add_column(conn, "users", "listing_version INTEGER NOT NULL DEFAULT 0")
+
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_project_revision", _0001_project_revision),
+    ("0002_foreign_key_indexes", _0002_foreign_key_indexes),
+    ("0003_device_property_columns", _0003_device_property_columns),
+    ("0004_autoincrement_device_and_link_ids", _0004_autoincrement_device_and_link_ids),
+    ("0005_user_listing_version", _0005_user_listing_version),
+]
+
+def run_migrations(engine: Engine) -> List[str]:
+    """Applies pending migrations and returns the versions that were applied."""
+    applied_now = []
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        applied = set(conn.execute(schema_migrations.select().with_only_columns(schema_migrations.c.version)).scalars())
+        for version, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.utcnow()))
+            applied_now.append(version)
+    return applied_now
+
+# Arbitrary application-wide key for pg_advisory_lock
+_POSTGRES_LOCK_KEY = 0x6e746f706f
+
+@contextmanager
+def _migration_lock(engine: Engine) -> Iterator[None]:
+    """Exclusive across processes: an advisory lock on PostgreSQL, a lock file next to a SQLite database file."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _POSTGRES_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _POSTGRES_LOCK_KEY})
+        return
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or fcntl is None or not database or database == ":memory:":
+        yield
+        return
+    with open(os.path.abspath(database) + ".migrate.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _schema_current(engine: Engine) -> bool:
+    """True if every model table exists and every migration is recorded."""
+    tables = set(inspect(engine).get_table_names())
+    if schema_migrations.name not in tables or not set(Base.metadata.tables) <= tables:
+        return False
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    return all(version in applied for version, _ in MIGRATIONS)
+
+def prepare_database(engine: Engine) -> List[str]:
+    """
+    Creates missing tables and applies pending migrations; returns the versions applied. Workers starting
+    together queue on the migration lock, and all but the first find the schema current and do nothing.
+    """
+    if _schema_current(engine):
+        return [] # Common case, no lock needed
+    with _migration_lock(engine):
+        if _schema_current(engine):
+            return []
+        Base.metadata.create_all(bind=engine)
+        applied = run_migrations(engine)
+        # A shared cache may hold entries of a previous database with the same ids and revisions
+        cache.clear_shared()
+        return applied
+
+if __name__ == "__main__":
+    from .database import engine
+    applied = prepare_database(engine)
+    print(f"Applied migrations: {', '.join(applied)}" if applied else "Schema is up to date")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -9,30 +9,59 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     password_hash = Column(String)
+    listing_version = Column(Integer, nullable=False, default=0)  # Bumped by every change to the user's projects; keys the listing ETag
 
     projects = relationship("Project", back_populates="owner")
 
 class Project(Base):
     __tablename__ = "projects"
+    # Serves get_projects_by_user and get_projects_page (filter on user_id, ordered by recency)
+    __table_args__ = (Index("ix_projects_user_id_last_modified", "user_id", "last_modified"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     project_name = Column(String, index=True)
     description = Column(String, nullable=True)
     last_modified = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    revision = Column(Integer, nullable=False, default=0)  # Bumped on every topology write; used for optimistic concurrency
 
     owner = relationship("User", back_populates="projects")
     devices = relationship("Device", back_populates="project", cascade="all, delete-orphan")
     links = relationship("Link", back_populates="project", cascade="all, delete-orphan")
+    revisions = relationship("TopologyRevision", back_populates="project", cascade="all, delete-orphan")
+
+# Well-known numeric device properties that are also stored in typed columns so they can be filtered,
+# sorted and aggregated in SQL. `properties` keeps the full JSON (including these) as sent by the client.
+DEVICE_PROPERTY_COLUMNS = {
+    "num_ports": int,
+    "total_bandwidth": float,
+    "throughput_per_port": float,
+    "estimated_load": float,
+    "x_position": float,
+    "y_position": float,
+}
 
 class Device(Base):
     __tablename__ = "devices"
+    __table_args__ = (
+        Index("ix_devices_project_id_device_type", "project_id", "device_type"),
+        Index("ix_devices_project_id_estimated_load", "project_id", "estimated_load"),
+        Index("ix_devices_project_id_total_bandwidth", "project_id", "total_bandwidth"),
+        {"sqlite_autoincrement": True},  # Never reuse ids of removed rows; clients key changesets on them
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     device_type = Column(String)  # E.g., "Router", "Switch", "PC", "Server", "Firewall"
     name = Column(String)
     properties = Column(JSON)  # Stores bandwidth, ports, throughput_per_port, estimated_load, x_position, y_position
+    # Typed copies of DEVICE_PROPERTY_COLUMNS, kept in sync by crud; None when missing or not numeric
+    num_ports = Column(Integer, nullable=True)
+    total_bandwidth = Column(Float, nullable=True)
+    throughput_per_port = Column(Float, nullable=True)
+    estimated_load = Column(Float, nullable=True)
+    x_position = Column(Float, nullable=True)
+    y_position = Column(Float, nullable=True)
 
     project = relationship("Project", back_populates="devices")
     # Relationships for links originating from this device
@@ -42,14 +71,49 @@ class Device(Base):
 
 class Link(Base):
     __tablename__ = "links"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
-    source_device_id = Column(Integer, ForeignKey("devices.id"))
-    target_device_id = Column(Integer, ForeignKey("devices.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
+    source_device_id = Column(Integer, ForeignKey("devices.id"), index=True)
+    target_device_id = Column(Integer, ForeignKey("devices.id"), index=True)
     source_port = Column(String, nullable=True)  # Name/ID of the port on the source device
     target_port = Column(String, nullable=True)  # Name/ID of the port on the target device
 
     project = relationship("Project", back_populates="links")
     source_device = relationship("Device", foreign_keys=[source_device_id], back_populates="source_links")
     target_device = relationship("Device", foreign_keys=[target_device_id], back_populates="target_links")
+
+class TopologyRevision(Base):
+    """One entry of a project's topology history, see history.py."""
+    __tablename__ = "topology_revisions"
+    __table_args__ = (Index("ix_topology_revisions_project_id_revision", "project_id", "revision", unique=True),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    revision = Column(Integer, nullable=False)  # Project.revision this entry brings the topology to
+    kind = Column(String, nullable=False)  # "checkpoint" (full topology) or "delta" (changes since the previous entry)
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    project = relationship("Project", back_populates="revisions")
+
+class Job(Base):
+    """A long-running operation executed by the job process pool, see jobs.py."""
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_user_id_status", "user_id", "status"), Index("ix_jobs_status", "status"))
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    kind = Column(String, nullable=False)  # "analysis", "export" or "import"
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded or failed
+    progress = Column(Float, nullable=False, default=0.0)  # 0..1
+    message = Column(String, nullable=True)  # Current step, for display
+    params = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    dispatcher = Column(String, nullable=True)  # "host:pid" of the web process that queued it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
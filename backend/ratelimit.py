@@ -0,0 +1,81 @@
+# Per-user token-bucket rate limiting of the expensive endpoints (whole-topology reads and writes, changesets,
+# imports, exports, layouts, analyses and graph queries). Background jobs are bounded by the active job cap
+# instead (see jobs.py). Each user's bucket holds up to RATE_LIMIT_BURST tokens and refills at
+# RATE_LIMIT_PER_MINUTE tokens a minute. A request takes one token, or is rejected with 429 and a Retry-After
+# of the time until the next token. The buckets live in the shared cache backend when one is configured
+# (cache.CACHE_BACKEND), so the limit holds across worker processes, and in process memory otherwise.
+# Limiting is off unless RATE_LIMIT_PER_MINUTE is set (e.g. 120 with a burst of 30); 0 turns it off again.
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Tuple
+
+from fastapi import Depends, HTTPException, status
+
+from . import cache, models
+from .security import get_current_user
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "30"))
+
+class MemoryTokenBuckets:
+    """In-process buckets; the least recently used ones are dropped beyond max_entries (they would be full by then)."""
+    errors: Tuple[type, ...] = ()
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take_token(self, key: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+class RateLimiter:
+    def __init__(self, name: str, per_minute: float, burst: float, buckets: Any):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1.0)
+        self.buckets = buckets
+
+    def acquire(self, subject: str) -> float:
+        """Takes a token for the subject; returns 0 if it got one, else the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        try:
+            return self.buckets.take_token(f"ratelimit:{self.name}:{subject}", self.rate, self.burst)
+        except self.buckets.errors:
+            # Better to serve without a limit than to fail requests while the cache server is unavailable
+            logger.warning("Rate limiter backend failed", exc_info=True)
+            return 0.0
+
+topology_limiter = RateLimiter(
+    "topology", RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST,
+    cache.shared_backend if cache.shared_backend is not None else MemoryTokenBuckets(),
+)
+
+def check_topology_limit(user: models.User) -> None:
+    """Takes one of the user's tokens, or raises 429. For routes that only charge some responses."""
+    wait = topology_limiter.acquire(str(user.id))
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded; retry in {wait:.1f}s",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+def limit_topology_requests(current_user: models.User = Depends(get_current_user)) -> None:
+    """Route dependency; the user comes from FastAPI's per-request dependency cache, so it is not looked up twice."""
+    check_topology_limit(current_user)
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session
+
+from .. import analysis, cache, crud, models, ratelimit, schemas, serialization
+from ..security import get_current_user
+from .auth import get_db # Assuming get_db can be imported from auth router
+
+router = APIRouter(
+    prefix="/projects/{project_id}/analysis",
+    tags=["analysis"]
+)
+
+@router.get("/", response_model=schemas.TopologyAnalysis, dependencies=[Depends(ratelimit.limit_topology_requests)])
+def analyze_project_topology(
+    project_id: int,
+    max_components: int = Query(100, ge=0, le=10000),
+    max_items: int = Query(1000, ge=0, le=100000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Sync route on purpose: the NumPy/SciPy work runs in the thread pool, not on the event loop
+    version = crud.get_project_version(db=db, project_id=project_id, user_id=current_user.id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    revision = version[0]
+    key = (*crud.project_topology_key(project_id, *version), max_components, max_items)
+    body = cache.analysis_cache.get(key)
+    if body is None:
+        result = analysis.analyze(analysis.load_topology_arrays(db, project_id), max_components=max_components, max_items=max_items)
+        body = serialization.dumps({"revision": revision, **result})
+        cache.analysis_cache.set(key, body)
+    return Response(content=body, media_type="application/json")
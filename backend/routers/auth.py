@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
@@ -6,32 +7,26 @@ from datetime import timedelta
 from .. import database, schemas, crud, models # Added models for response_model
 from .. import security # Import the security module
 from ..security import ACCESS_TOKEN_EXPIRE_MINUTES # Import specific config
+from ..database import get_db # Re-exported for the other routers
 
 router = APIRouter(
     prefix="/auth",
     tags=["authentication"]
 )
 
-# Dependency to get DB session
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/register", response_model=schemas.User)
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
-    created_user = crud.create_user(db=db, user=user)
+    created_user = database.write_queue.run(crud.create_user, user=user)
     return created_user
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.password_hash):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: database.DatabaseRunner = Depends(database.get_db_runner)):
+    user = await db.run(crud.get_user_by_username, username=form_data.username)
+    # bcrypt is deliberately slow; verify in the thread pool instead of blocking the event loop
+    if not user or not await run_in_threadpool(security.verify_password, form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
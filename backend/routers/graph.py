@@ -0,0 +1,89 @@
+from typing import List, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session
+
+from .. import cache, crud, graph, models, ratelimit, schemas, serialization
+from ..security import get_current_user
+from .auth import get_db # Assuming get_db can be imported from auth router
+
+router = APIRouter(
+    prefix="/projects/{project_id}/graph",
+    tags=["graph"],
+    dependencies=[Depends(ratelimit.limit_topology_requests)] # Index builds and whole-graph queries
+)
+
+def _graph_index(db: Session, project_id: int, user_id: int) -> Tuple[int, graph.GraphIndex]:
+    version = crud.get_project_version(db=db, project_id=project_id, user_id=user_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    key = crud.project_topology_key(project_id, *version)
+    index = cache.graph_cache.get(key)
+    if index is None:
+        index = graph.build_graph_index(db, project_id)
+        cache.graph_cache.set(key, index)
+    return version[0], index
+
+def _query(query, *args):
+    try:
+        return query(*args)
+    except graph.UnknownElementError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=exc.args[0])
+
+def _json(revision: int, result: dict) -> Response:
+    return Response(content=serialization.dumps({"revision": revision, **result}), media_type="application/json")
+
+# Sync routes on purpose: index builds and whole-graph queries run in the thread pool
+
+@router.get("/path", response_model=schemas.GraphPath)
+def shortest_path(
+    project_id: int,
+    source: int = Query(..., description="Source device id"),
+    target: int = Query(..., description="Target device id"),
+    weight: str = Query("hops", pattern="^(hops|capacity)$", description="Fewest hops, or lowest cost favouring high-capacity links"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    revision, index = _graph_index(db, project_id, current_user.id)
+    result = _query(index.shortest_path, source, target, weight)
+    return _json(revision, {"source_device_id": source, "target_device_id": target, "weight": weight, **result})
+
+@router.get("/neighborhood", response_model=schemas.GraphNeighborhood)
+def device_neighborhood(
+    project_id: int,
+    device_id: int,
+    hops: int = Query(1, ge=1, le=64),
+    limit: int = Query(10000, ge=1, le=1000000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    revision, index = _graph_index(db, project_id, current_user.id)
+    result = _query(index.neighborhood, device_id, hops, limit)
+    return _json(revision, {"device_id": device_id, "max_hops": hops, **result})
+
+@router.get("/critical", response_model=schemas.GraphCriticalElements)
+def critical_elements(
+    project_id: int,
+    limit: int = Query(10000, ge=0, le=1000000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    revision, index = _graph_index(db, project_id, current_user.id)
+    return _json(revision, index.critical(limit))
+
+@router.get("/failure", response_model=schemas.GraphFailureImpact)
+def failure_impact(
+    project_id: int,
+    device_ids: List[int] = Query([], description="Devices assumed to fail"),
+    link_ids: List[int] = Query([], description="Links assumed to fail"),
+    limit: int = Query(10000, ge=0, le=1000000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if not device_ids and not link_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Give at least one device_ids or link_ids value")
+    revision, index = _graph_index(db, project_id, current_user.id)
+    return _json(revision, _query(index.failure_impact, device_ids, link_ids, limit))
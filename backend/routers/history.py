@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from .. import crud, history, models, schemas, serialization
+from ..history import TopologyState
+from ..security import get_current_user
+from .auth import get_db # Assuming get_db can be imported from auth router
+
+router = APIRouter(
+    prefix="/projects/{project_id}/revisions",
+    tags=["history"]
+)
+
+def _require_project(db: Session, project_id: int, user_id: int) -> int:
+    version = crud.get_project_version(db=db, project_id=project_id, user_id=user_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    return version[0]
+
+def _load_revision(db: Session, project_id: int, revision: int, current_revision: int) -> TopologyState:
+    state = history.load_topology_at(db, project_id, revision) if 0 < revision <= current_revision else None
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Revision {revision} is not in the project's history"
+        )
+    return state
+
+# Sync routes on purpose: rebuilding a revision decompresses and replays payloads in the thread pool
+
+@router.get("/", response_model=List[schemas.TopologyRevisionInfo])
+def list_topology_revisions(
+    project_id: int,
+    before: Optional[int] = Query(None, description="Only list revisions older than this one (for paging)"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    _require_project(db, project_id, current_user.id)
+    return [
+        schemas.TopologyRevisionInfo(revision=revision, kind=kind, created_at=created_at, size=size)
+        for revision, kind, created_at, size in history.list_revisions(db, project_id, before=before, limit=limit)
+    ]
+
+@router.get("/diff", response_model=schemas.TopologyDiff)
+def diff_topology_revisions(
+    project_id: int,
+    from_revision: int = Query(...),
+    to_revision: int = Query(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    current_revision = _require_project(db, project_id, current_user.id)
+    old = _load_revision(db, project_id, from_revision, current_revision)
+    new = _load_revision(db, project_id, to_revision, current_revision)
+    body = serialization.dumps({
+        "from_revision": from_revision,
+        "to_revision": to_revision,
+        **history.diff_states(project_id, old, new),
+    })
+    return Response(content=body, media_type="application/json")
+
+@router.get("/{revision}", response_model=schemas.TopologyResponse)
+def read_topology_at_revision(
+    project_id: int,
+    revision: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    current_revision = _require_project(db, project_id, current_user.id)
+    state = _load_revision(db, project_id, revision, current_revision)
+    return Response(content=serialization.dumps(history.topology_dict(project_id, state)), media_type="application/json")
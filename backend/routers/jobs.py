@@ -0,0 +1,159 @@
+import os
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from .. import columnar, crud, database, jobs, models, schemas
+from ..security import get_current_user
+from ..database import DatabaseRunner, get_db_runner
+from .auth import get_db # Assuming get_db can be imported from auth router
+from .topology import spool_upload
+
+router = APIRouter(tags=["jobs"])
+
+def _require_project(db: Session, project_id: int, user_id: int) -> None:
+    if crud.get_project_version(db=db, project_id=project_id, user_id=user_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+
+def submit_job(response: Response, user_id: int, project_id: int, kind: str, params: Dict[str, Any]) -> schemas.Job:
+    try:
+        db_job = database.write_queue.run(
+            jobs.create_job, user_id=user_id, project_id=project_id, kind=kind, params=params
+        )
+    except jobs.JobLimitError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many active jobs ({exc.active}); wait for one to finish",
+            headers={"Retry-After": "5"},
+        )
+    jobs.manager.submit(db_job.id)
+    response.headers["Location"] = f"/jobs/{db_job.id}"
+    return schemas.Job.model_validate(db_job)
+
+@router.post("/projects/{project_id}/jobs/analysis", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def submit_analysis_job(
+    project_id: int,
+    response: Response,
+    max_components: int = Query(100, ge=0, le=10000),
+    max_items: int = Query(1000, ge=0, le=100000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Runs the capacity analysis of GET /projects/{project_id}/analysis/ as a background job."""
+    _require_project(db, project_id, current_user.id)
+    return submit_job(response, current_user.id, project_id, "analysis",
+                      {"max_components": max_components, "max_items": max_items})
+
+@router.post("/projects/{project_id}/jobs/export", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def submit_export_job(
+    project_id: int,
+    response: Response,
+    codec: str = Query("none", description="Column compression: none, zlib or zstd (if installed)"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Writes a .ntopo export (see GET /projects/{project_id}/topology/export) as a background job."""
+    if codec not in columnar.CODECS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported codec; available: {', '.join(columnar.CODECS)}"
+        )
+    _require_project(db, project_id, current_user.id)
+    return submit_job(response, current_user.id, project_id, "export", {"codec": codec})
+
+@router.post("/projects/{project_id}/jobs/layout", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def submit_layout_job(
+    project_id: int,
+    options: schemas.LayoutRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Runs POST /projects/{project_id}/layout/ as a background job, whatever the project's size."""
+    _require_project(db, project_id, current_user.id)
+    return submit_job(response, current_user.id, project_id, "layout", options.model_dump())
+
+@router.post("/projects/{project_id}/jobs/import", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+async def submit_import_job(
+    project_id: int,
+    request: Request,
+    response: Response,
+    db: DatabaseRunner = Depends(get_db_runner),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Replaces the topology from a .ntopo body (see POST /projects/{project_id}/topology/import/binary) as a background job."""
+    if await db.run(crud.get_project_version, project_id=project_id, user_id=current_user.id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    upload = f"upload-{uuid.uuid4().hex}.ntopo"
+    path = jobs.storage_path(upload)
+    try:
+        with open(path, "wb") as spool:
+            await spool_upload(request, spool)
+        # Reject malformed files now rather than in a failed job
+        try:
+            columnar.TopologyReader(path).close()
+        except columnar.FormatError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        return await run_in_threadpool(submit_job, response, current_user.id, project_id, "import", {"upload": upload})
+    except BaseException:
+        jobs.remove_file(upload)
+        raise
+
+@router.get("/jobs/", response_model=List[schemas.Job])
+def read_jobs(
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return [_with_live_progress(db_job) for db_job in jobs.get_jobs_by_user(db, user_id=current_user.id, limit=limit)]
+
+def _get_job_or_404(db: Session, job_id: int, user_id: int) -> models.Job:
+    db_job = jobs.get_job(db, job_id=job_id, user_id=user_id)
+    if db_job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return db_job
+
+def _with_live_progress(db_job: models.Job) -> schemas.Job:
+    job = schemas.Job.model_validate(db_job)
+    if job.status == "running":
+        live = jobs.manager.progress(job.id)
+        if live is not None:
+            job.progress, job.message = live
+    return job
+
+@router.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return _with_live_progress(_get_job_or_404(db, job_id, current_user.id))
+
+@router.get("/jobs/{job_id}/result")
+def read_job_result(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """The job's result: a .ntopo file for exports, JSON otherwise. 409 until the job has succeeded."""
+    db_job = _get_job_or_404(db, job_id, current_user.id)
+    if db_job.status == "failed":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job failed: {db_job.error}")
+    if db_job.status != "succeeded":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {db_job.status}")
+    if db_job.kind == "export":
+        path = jobs.storage_path(db_job.result["filename"])
+        if not os.path.exists(path):
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail="Export file is no longer available")
+        return FileResponse(path, media_type=columnar.MEDIA_TYPE, filename=f"project-{db_job.project_id}.ntopo")
+    return db_job.result
@@ -0,0 +1,62 @@
+from typing import Union
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.orm import Session
+
+from .. import crud, database, layout, models, ratelimit, schemas
+from ..security import get_current_user
+from .auth import get_db # Assuming get_db can be imported from auth router
+from .jobs import submit_job
+
+router = APIRouter(
+    prefix="/projects/{project_id}/layout",
+    tags=["layout"]
+)
+
+@router.post("/", response_model=Union[schemas.LayoutResult, schemas.Job], dependencies=[Depends(ratelimit.limit_topology_requests)])
+def layout_project(
+    project_id: int,
+    options: schemas.LayoutRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Computes device positions server-side and writes them back in one bulk update.
+    Projects of up to LAYOUT_SYNC_MAX_DEVICES devices are laid out within the request (200, LayoutResult);
+    larger ones are handed to a background job (202, Job; see POST /projects/{project_id}/jobs/layout).
+    """
+    version = crud.get_project_version(db=db, project_id=project_id, user_id=current_user.id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    if crud.count_project_devices(db, project_id) > layout.LAYOUT_SYNC_MAX_DEVICES:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return submit_job(response, current_user.id, project_id, "layout", options.model_dump())
+
+    device_count, positions, seconds = layout.layout_project(db, project_id, options.model_dump())
+    try:
+        revision = database.write_queue.run(
+            crud.update_device_positions,
+            project_id=project_id,
+            user_id=current_user.id,
+            positions=positions,
+            # Without a base revision the layout applies to the topology it was computed from
+            base_revision=version[0] if options.base_revision is None else options.base_revision,
+        )
+    except crud.StaleRevisionError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Topology was modified concurrently; current revision is {exc.current_revision}"
+        )
+    if revision is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    return schemas.LayoutResult(
+        revision=revision, algorithm=options.algorithm, device_count=device_count,
+        moved_device_count=len(positions), seconds=round(seconds, 3),
+    )
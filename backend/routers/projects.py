@@ -1,9 +1,10 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
-from .. import database, schemas, models, crud # Adjusted for direct imports from package root
+from .. import cache, database, schemas, models, crud # Adjusted for direct imports from package root
 from ..security import get_current_user
+from ..database import DatabaseRunner, get_db_runner
 from .auth import get_db # Assuming get_db can be imported from auth router
 
 router = APIRouter(
@@ -14,28 +15,49 @@ router = APIRouter(
 @router.post("/", response_model=schemas.Project, status_code=status.HTTP_201_CREATED)
 def create_project(
     project: schemas.ProjectCreate,
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    return crud.create_user_project(db=db, project=project, user_id=current_user.id)
+    return database.write_queue.run(crud.create_user_project, project=project, user_id=current_user.id)
 
-@router.get("/", response_model=List[schemas.Project])
-def read_projects(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+@router.get("/", response_model=List[schemas.ProjectSummary])
+async def read_projects(
+    response: Response,
+    skip: int = 0, # Deprecated offset paging; use the X-Next-Cursor value as `cursor` instead
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    db: DatabaseRunner = Depends(get_db_runner),
     current_user: models.User = Depends(get_current_user)
 ):
-    projects = crud.get_projects_by_user(db=db, user_id=current_user.id, skip=skip, limit=limit)
+    after = None
+    if cursor:
+        try:
+            after = crud.decode_project_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    etag = await db.run(crud.get_projects_listing_etag, current_user.id, skip, limit, cursor, summary)
+    if cache.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if skip:
+        return await db.run(crud.get_projects_by_user, user_id=current_user.id, skip=skip, limit=limit)
+    projects, next_cursor = await db.run(
+        crud.get_projects_page, user_id=current_user.id, limit=limit, after=after, with_counts=summary
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return projects
 
 @router.get("/{project_id}", response_model=schemas.Project)
-def read_project(
+async def read_project(
     project_id: int,
-    db: Session = Depends(get_db),
+    db: DatabaseRunner = Depends(get_db_runner),
     current_user: models.User = Depends(get_current_user)
 ):
-    db_project = crud.get_project(db=db, project_id=project_id, user_id=current_user.id)
+    db_project = await db.run(crud.get_project, project_id=project_id, user_id=current_user.id)
     if db_project is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     return db_project
@@ -44,10 +66,9 @@ def read_project(
 def update_existing_project(
     project_id: int,
     project_update: schemas.ProjectCreate,
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    updated_project = crud.update_project(db=db, project_id=project_id, project_update=project_update, user_id=current_user.id)
+    updated_project = database.write_queue.run(crud.update_project, project_id=project_id, project_update=project_update, user_id=current_user.id)
     if updated_project is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found or not owned by user")
     return updated_project
@@ -55,10 +76,9 @@ def update_existing_project(
 @router.delete("/{project_id}", response_model=schemas.Project) # Or return a status code like 204 No Content
 def delete_existing_project(
     project_id: int,
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    deleted_project = crud.delete_project(db=db, project_id=project_id, user_id=current_user.id)
+    deleted_project = database.write_queue.run(crud.delete_project, project_id=project_id, user_id=current_user.id)
     if deleted_project is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found or not owned by user")
     return deleted_project
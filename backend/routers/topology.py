@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import os
+import tempfile
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-from typing import List # For response models if needed, though Project and TopologyResponse are single objects
+from typing import BinaryIO, List, Optional # For response models if needed, though Project and TopologyResponse are single objects
 
-from .. import database, schemas, models, crud
+from .. import cache, columnar, database, schemas, models, crud, ratelimit, serialization, spatial
 from ..security import get_current_user
+from ..database import DatabaseRunner, get_db_runner
 from .auth import get_db # Assuming get_db can be imported from auth router
 
 router = APIRouter(
@@ -11,15 +18,30 @@ router = APIRouter(
     tags=["topology"]
 )
 
-@router.put("/", response_model=schemas.Project) # Returns the whole project, including updated topology
+async def spool_upload(request: Request, spool: BinaryIO) -> None:
+    """Copies a .ntopo request body to `spool`; 413 once it exceeds columnar.MAX_UPLOAD_BYTES."""
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Upload exceeds {columnar.MAX_UPLOAD_BYTES} bytes"
+    )
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > columnar.MAX_UPLOAD_BYTES:
+        raise too_large # Before reading any of it
+    received = 0
+    async for chunk in request.stream(): # Chunked bodies carry no length up front
+        received += len(chunk)
+        if received > columnar.MAX_UPLOAD_BYTES:
+            raise too_large
+        spool.write(chunk)
+
+@router.put("/", response_model=schemas.Project, dependencies=[Depends(ratelimit.limit_topology_requests)]) # Returns the whole project, including updated topology
 def update_topology_for_project(
     project_id: int,
     topology_data: schemas.TopologyData,
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    updated_project = crud.update_project_topology(
-        db=db,
+    updated_project = database.write_queue.run(
+        crud.update_project_topology,
         project_id=project_id,
         user_id=current_user.id,
         topology_data=topology_data
@@ -31,21 +53,257 @@ def update_topology_for_project(
         )
     return updated_project
 
+@router.post("/import", response_model=schemas.TopologyImportSummary, dependencies=[Depends(ratelimit.limit_topology_requests)])
+def import_topology_for_project(
+    project_id: int,
+    topology_data: schemas.TopologyData,
+    current_user: models.User = Depends(get_current_user)
+):
+    # Full replace for inventory imports and restores; uses batched inserts and skips reloading the ORM graph
+    summary = database.write_queue.run(
+        crud.bulk_import_project_topology,
+        project_id=project_id,
+        user_id=current_user.id,
+        topology_data=topology_data
+    )
+    if summary is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    return summary
+
+@router.post("/import/binary", response_model=schemas.TopologyImportSummary, dependencies=[Depends(ratelimit.limit_topology_requests)])
+async def import_binary_topology_for_project(
+    project_id: int,
+    request: Request,
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Full replace from a .ntopo body (see columnar.py), as produced by GET /export. The upload is
+    spooled to a temporary file and memory-mapped, then streamed into the bulk import in batches.
+    """
+    spool = tempfile.NamedTemporaryFile(suffix=".ntopo", delete=False)
+    try:
+        with spool:
+            await spool_upload(request, spool)
+        try:
+            reader = columnar.TopologyReader(spool.name)
+        except columnar.FormatError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        with reader:
+            try:
+                summary = await database.write_queue.run_async(
+                    crud.bulk_import_topology_rows,
+                    project_id=project_id,
+                    user_id=current_user.id,
+                    devices=reader.iter_devices(),
+                    links=reader.iter_links()
+                )
+            except columnar.FormatError as exc:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    finally:
+        os.unlink(spool.name)
+    if summary is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    return summary
+
+@router.patch("/", response_model=schemas.TopologyChangesetResult, dependencies=[Depends(ratelimit.limit_topology_requests)])
+def apply_topology_changes_for_project(
+    project_id: int,
+    changeset: schemas.TopologyChangeset,
+    current_user: models.User = Depends(get_current_user)
+):
+    try:
+        result = database.write_queue.run(
+            crud.apply_topology_changeset,
+            project_id=project_id,
+            user_id=current_user.id,
+            changeset=changeset
+        )
+    except crud.StaleRevisionError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Topology was modified concurrently; current revision is {exc.current_revision}"
+        )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    return result
+
 @router.get("/", response_model=schemas.TopologyResponse)
-def get_topology_for_project(
+async def get_topology_for_project(
+    project_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: DatabaseRunner = Depends(get_db_runner),
+    current_user: models.User = Depends(get_current_user)
+):
+    version = await db.run(crud.get_project_version, project_id=project_id, user_id=current_user.id)
+    if version is None:
+        # This implies the project itself wasn't found or not owned.
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user, or topology data is unavailable"
+        )
+    etag = crud.project_topology_etag(project_id, *version)
+    if cache.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    # Revalidation is cheap, so only full responses are charged; shared buckets are updated off the event loop
+    await run_in_threadpool(ratelimit.check_topology_limit, current_user)
+    # The body may belong to a newer version than the one checked above if a write landed in between
+    version, body = await db.run(crud.get_project_topology_json, project_id=project_id, version=version)
+    headers = {"ETag": crud.project_topology_etag(project_id, *version), "Cache-Control": "no-cache"}
+    # Already-serialized bytes bypass response_model validation; the declared model documents the shape
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/devices", response_model=List[schemas.Device])
+def search_devices_for_project(
     project_id: int,
+    device_type: Optional[str] = None,
+    min_load: Optional[float] = None,
+    max_load: Optional[float] = None,
+    min_bandwidth: Optional[float] = None,
+    max_bandwidth: Optional[float] = None,
+    min_utilization: Optional[float] = Query(None, description="Lower bound on estimated_load / total_bandwidth"),
+    max_utilization: Optional[float] = Query(None, description="Upper bound on estimated_load / total_bandwidth"),
+    sort: str = Query("id", pattern="^(" + "|".join(crud.DEVICE_SORT_COLUMNS) + ")$"),
+    descending: bool = False,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    topology = crud.get_project_topology(
+    if crud.get_project_version(db=db, project_id=project_id, user_id=current_user.id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    return crud.search_project_devices(
         db=db,
         project_id=project_id,
-        user_id=current_user.id
+        device_type=device_type,
+        min_load=min_load,
+        max_load=max_load,
+        min_bandwidth=min_bandwidth,
+        max_bandwidth=max_bandwidth,
+        min_utilization=min_utilization,
+        max_utilization=max_utilization,
+        sort=sort,
+        descending=descending,
+        skip=skip,
+        limit=limit
     )
-    if topology is None:
-        # This implies the project itself wasn't found or not owned.
+
+# Below this zoom level links are too small to be legible, so viewport queries return devices only
+VIEWPORT_LINK_MIN_ZOOM = 0.25
+
+@router.get("/viewport", response_model=schemas.TopologyResponse)
+def get_topology_viewport_for_project(
+    project_id: int,
+    min_x: float = Query(..., allow_inf_nan=False),
+    min_y: float = Query(..., allow_inf_nan=False),
+    max_x: float = Query(..., allow_inf_nan=False),
+    max_y: float = Query(..., allow_inf_nan=False),
+    zoom: Optional[float] = Query(None, gt=0, allow_inf_nan=False),
+    limit: int = Query(10000, ge=1, le=100000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Devices whose position lies in the bounding box plus the links touching them.
+    At most `limit` devices are returned; X-Viewport-Truncated is set when the box holds more.
+    """
+    version = crud.get_project_version(db=db, project_id=project_id, user_id=current_user.id)
+    if version is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found or not owned by user, or topology data is unavailable"
+            detail="Project not found or not owned by user"
+        )
+    key = crud.project_topology_key(project_id, *version)
+    index = cache.spatial_cache.get(key)
+    if index is None:
+        index = spatial.build_grid_index(db, project_id)
+        cache.spatial_cache.set(key, index)
+
+    device_ids = index.query(min_x, min_y, max_x, max_y)
+    headers = {"X-Viewport-Truncated": "true" if len(device_ids) > limit else "false"}
+    device_ids = sorted(device_ids[:limit].tolist())
+    include_links = zoom is None or zoom >= VIEWPORT_LINK_MIN_ZOOM
+    body = b"".join(serialization.json_chunks(
+        crud.iter_device_rows_by_ids(db, project_id, device_ids),
+        crud.iter_link_rows_touching(db, project_id, device_ids) if include_links else [],
+    ))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+@router.get("/stream", dependencies=[Depends(ratelimit.limit_topology_requests)])
+def stream_topology_for_project(
+    project_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if crud.get_project(db=db, project_id=project_id, user_id=current_user.id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
         )
-    return topology
+
+    # The body is produced after the request's dependencies have been torn down,
+    # so the generator owns its own session for the lifetime of the stream.
+    def body():
+        stream_db = database.SessionLocal()
+        try:
+            chunks = serialization.ndjson_chunks if format == "ndjson" else serialization.json_chunks
+            yield from chunks(
+                crud.iter_project_device_rows(stream_db, project_id),
+                crud.iter_project_link_rows(stream_db, project_id),
+            )
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[format])
+
+@router.get("/export", dependencies=[Depends(ratelimit.limit_topology_requests)])
+def export_topology_for_project(
+    project_id: int,
+    codec: str = Query("none", description="Column compression: none, zlib or zstd (if installed)"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Columnar binary export (.ntopo, see columnar.py); import it again with POST /import/binary."""
+    if codec not in columnar.CODECS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported codec; available: {', '.join(columnar.CODECS)}"
+        )
+    if crud.get_project_version(db=db, project_id=project_id, user_id=current_user.id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found or not owned by user"
+        )
+    # Written to a temporary file rather than memory so large exports are sent from disk
+    export = tempfile.NamedTemporaryFile(suffix=".ntopo", delete=False)
+    try:
+        with export:
+            columnar.write_topology(
+                export,
+                crud.iter_project_device_rows(db, project_id),
+                crud.iter_project_link_rows(db, project_id),
+                codec=codec,
+            )
+    except Exception:
+        os.unlink(export.name)
+        raise
+    return FileResponse(
+        export.name,
+        media_type=columnar.MEDIA_TYPE,
+        filename=f"project-{project_id}.ntopo",
+        background=BackgroundTask(os.unlink, export.name),
+    )
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any # Added List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Annotated, Optional, List, Dict, Any, Literal, Union # Added List, Dict, Any
 from datetime import datetime
 
 # User Schemas
@@ -33,10 +33,16 @@ class Project(ProjectBase):
     id: int
     user_id: int
     last_modified: datetime
+    revision: int = 0
     # devices: List['Device'] = [] # Forward reference for relationships if needed directly in Project schema
     # links: List['Link'] = []   # Forward reference
     model_config = {'from_attributes': True}
 
+class ProjectSummary(Project):
+    # Only filled in when the listing is requested with summary=true
+    device_count: Optional[int] = None
+    link_count: Optional[int] = None
+
 # Device Schemas
 class DeviceBase(BaseModel):
     device_type: str
@@ -46,6 +52,12 @@ class DeviceBase(BaseModel):
 class DeviceCreate(DeviceBase):
     client_id: Optional[str] = None # Temporary client-side ID
 
+class DeviceUpdate(BaseModel):
+    id: int
+    name: Optional[str] = None
+    device_type: Optional[str] = None
+    properties: Optional[Dict[str, Any]] = None # Merged into the stored properties, not replaced
+
 class Device(DeviceBase):
     id: int
     project_id: int
@@ -61,6 +73,19 @@ class LinkCreate(LinkBase):
     source_device_client_id: str # Refers to DeviceCreate.client_id
     target_device_client_id: str # Refers to DeviceCreate.client_id
 
+class LinkChangeCreate(LinkBase):
+    client_id: Optional[str] = None # Temporary client-side ID, echoed back in link_id_map
+    # Endpoints reference either an existing device by DB id or a device added in the same changeset by client_id
+    source_device_id: Optional[int] = None
+    target_device_id: Optional[int] = None
+    source_device_client_id: Optional[str] = None
+    target_device_client_id: Optional[str] = None
+
+class LinkUpdate(BaseModel):
+    id: int
+    source_port: Optional[str] = None
+    target_port: Optional[str] = None
+
 class Link(LinkBase):
     id: int
     project_id: int
@@ -77,5 +102,175 @@ class TopologyResponse(BaseModel): # For retrieving an entire topology to client
     devices: List[Device]
     links: List[Link]
 
+class TopologyChangeset(BaseModel): # Incremental edit applied on top of the stored topology
+    base_revision: Optional[int] = None # Revision the client edited; the save is rejected if the project moved on
+    added_devices: List[DeviceCreate] = []
+    updated_devices: List[DeviceUpdate] = []
+    removed_device_ids: List[int] = []
+    added_links: List[LinkChangeCreate] = []
+    updated_links: List[LinkUpdate] = []
+    removed_link_ids: List[int] = []
+
+class TopologyChangesetResult(BaseModel):
+    revision: int
+    device_id_map: Dict[str, int] = {} # client_id -> DB id of the added devices
+    link_ids: List[int] = [] # DB ids of the added links that could be resolved, in request order
+    link_id_map: Dict[str, int] = {} # client_id -> DB id of the added links that carried one
+
+class TopologyImportSummary(BaseModel): # Returned by bulk imports instead of the refreshed project graph
+    revision: int
+    devices_created: int
+    links_created: int
+    links_skipped: int # Links whose client_ids did not resolve to an imported device
+
+# History Schemas
+class TopologyRevisionInfo(BaseModel):
+    revision: int
+    kind: str # "checkpoint" or "delta"
+    created_at: Optional[datetime] = None
+    size: int # Compressed payload size in bytes
+
+class TopologyDiff(BaseModel): # Changes that turn the topology at from_revision into the one at to_revision
+    from_revision: int
+    to_revision: int
+    added_devices: List[Device] = []
+    removed_device_ids: List[int] = []
+    changed_devices: List[Device] = []
+    added_links: List[Link] = []
+    removed_link_ids: List[int] = []
+    changed_links: List[Link] = []
+
+# Job Schemas
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str # queued, running, succeeded or failed
+    progress: float
+    message: Optional[str] = None
+    project_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    model_config = {'from_attributes': True}
+
+# Analysis Schemas
+class DeviceAnalysis(BaseModel):
+    id: int
+    utilization: Optional[float] = None # estimated_load / total_bandwidth; None when bandwidth is unknown
+    degree: int
+    excess_links: int # Links beyond num_ports
+    port_utilization: Optional[float] = None # Per-link share of the load / throughput_per_port
+    oversubscribed: bool
+
+class LinkAnalysis(BaseModel):
+    id: int
+    load: float
+    capacity: Optional[float] = None # Slower endpoint's throughput_per_port; None when either is unknown
+    utilization: Optional[float] = None
+
+class ComponentAnalysis(BaseModel):
+    component: int
+    device_count: int
+    bottleneck_link_id: Optional[int] = None
+    bottleneck_capacity: Optional[float] = None
+
+class TopologyAnalysis(BaseModel):
+    revision: int
+    device_count: int
+    link_count: int
+    component_count: int
+    max_utilization: Optional[float] = None
+    overloaded_device_count: int
+    oversubscribed_device_count: int
+    overloaded_link_count: int
+    devices: List[DeviceAnalysis] # Overloaded or over-subscribed devices, worst first
+    links: List[LinkAnalysis] # Overloaded links, worst first
+    components: List[ComponentAnalysis] # Largest components first
+
 # If using Pydantic v1, you might need this for forward references in Project schema
 # Project.update_forward_refs()
+
+# Collaboration Schemas (operations sent over the project WebSocket)
+class MoveDeviceOp(BaseModel):
+    op: Literal["move"]
+    id: int
+    x: float
+    y: float
+
+class UpdateDeviceOp(BaseModel):
+    op: Literal["update"]
+    id: int
+    name: Optional[str] = None
+    device_type: Optional[str] = None
+    properties: Optional[Dict[str, Any]] = None # Merged into the stored properties, like DeviceUpdate
+
+class AddLinkOp(LinkBase):
+    op: Literal["add_link"]
+    client_id: str # Echoed back with the DB id once the link is persisted
+    source_device_id: int
+    target_device_id: int
+
+class RemoveLinkOp(BaseModel):
+    op: Literal["remove_link"]
+    id: int
+
+CollabOperation = Annotated[Union[MoveDeviceOp, UpdateDeviceOp, AddLinkOp, RemoveLinkOp], Field(discriminator="op")]
+
+# Graph Query Schemas
+class GraphPath(BaseModel):
+    revision: int
+    source_device_id: int
+    target_device_id: int
+    weight: str
+    found: bool
+    hops: Optional[int] = None
+    cost: Optional[float] = None # Sum of link costs; the widest link costs 1
+    bottleneck_capacity: Optional[float] = None # Narrowest known link capacity on the path
+    device_ids: List[int] # Source to target
+    link_ids: List[int]
+
+class GraphNeighbor(BaseModel):
+    id: int
+    hops: int
+
+class GraphNeighborhood(BaseModel):
+    revision: int
+    device_id: int
+    max_hops: int
+    device_count: int
+    truncated: bool
+    devices: List[GraphNeighbor] # Nearest first
+
+class GraphCriticalElements(BaseModel):
+    revision: int
+    articulation_point_count: int
+    bridge_count: int
+    articulation_point_ids: List[int] # Devices whose failure splits their component
+    bridge_link_ids: List[int] # Links whose failure splits their component
+
+class GraphFailureImpact(BaseModel):
+    revision: int
+    failed_device_ids: List[int]
+    failed_link_ids: List[int]
+    partition_count: int
+    disconnected_device_count: int
+    truncated: bool
+    disconnected_device_ids: List[int]
+
+# Layout Schemas
+class LayoutRequest(BaseModel):
+    algorithm: Literal["force", "hierarchical"] = "force"
+    incremental: bool = False # Start from the stored positions and move devices less
+    pinned_device_ids: List[int] = [] # Devices that keep their stored position
+    iterations: int = Field(100, ge=1, le=1000) # Force-directed only
+    spacing: float = Field(100.0, gt=0) # Target distance between linked devices
+    seed: int = 0
+    base_revision: Optional[int] = None # Revision the client laid out; the write is rejected if the project moved on
+
+class LayoutResult(BaseModel):
+    revision: int
+    algorithm: str
+    device_count: int
+    moved_device_count: int
+    seconds: float # Time spent computing positions, without the write
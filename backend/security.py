@@ -5,10 +5,9 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
 
 # Assuming these can be imported directly. If not, adjust path or structure.
-from . import crud, models, schemas, database # Added database import
+from . import cache, crud, models, schemas, database # Added database import
 
 # Configuration
 SECRET_KEY = "your-super-secret-key-please-change-in-prod" # Replace with a strong key in production
@@ -22,14 +21,10 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Database session provider for security functions
-# This helps avoid circular dependencies if routers also import from security.py
-def get_db_for_security():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Database session provider for security functions.
+# Same callable as the routers' get_db (get_current_user reaches it through get_db_runner),
+# so a request opens one session shared with its route.
+get_db_for_security = database.get_db
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed password."""
@@ -62,7 +57,7 @@ def decode_access_token(token: str, credentials_exception) -> schemas.TokenData:
         raise credentials_exception
     return token_data
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db_for_security)) -> models.User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: database.DatabaseRunner = Depends(database.get_db_runner)) -> models.User:
     """
     Decodes token, validates user, and returns the current user model.
     To be used as a dependency in protected routes.
@@ -73,7 +68,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     token_data = decode_access_token(token, credentials_exception)
-    user = crud.get_user_by_username(db, username=token_data.username)
+    user = await get_user_cached(token_data.username, db)
     if user is None:
         raise credentials_exception
     return user
+
+async def get_user_cached(username: str, db: database.DatabaseRunner) -> Optional[models.User]:
+    """Returns a detached snapshot of the user, served from the user cache when possible."""
+    snapshot = cache.user_cache.get(username)
+    if snapshot is None:
+        db_user = await db.run(crud.get_user_by_username, username=username)
+        if db_user is None:
+            return None
+        # Cache plain fields rather than the instance bound to this request's session; they can be shared
+        # with other worker processes
+        snapshot = {"id": db_user.id, "username": db_user.username}
+        cache.user_cache.set(username, snapshot)
+    return models.User(**snapshot)
@@ -0,0 +1,77 @@
+# Lean JSON encoding for topology reads.
+# Rows come straight from core SELECTs (no ORM objects, no Pydantic models) and device properties are
+# spliced in as the raw JSON text stored in the database, so they are never decoded and re-encoded.
+# orjson is used when installed; set TOPOLOGY_JSON_ENCODER=json to force the stdlib encoder.
+import json
+import os
+from typing import Any, Iterable, Iterator, Sequence
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError: # orjson is optional
+    orjson = None
+
+USE_ORJSON = orjson is not None and os.getenv("TOPOLOGY_JSON_ENCODER", "orjson") == "orjson"
+
+def _dumps(obj: Any) -> bytes:
+    if USE_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def dumps(obj: Any) -> bytes:
+    with metrics.serialization_timer():
+        return _dumps(obj)
+
+def loads(data: bytes) -> Any:
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def device_json(row: Sequence[Any]) -> bytes:
+    """Encodes a (id, project_id, name, device_type, properties_json_text) row."""
+    device_id, project_id, name, device_type, properties = row
+    head = _dumps({"id": device_id, "project_id": project_id, "name": name, "device_type": device_type})
+    return head[:-1] + b',"properties":' + (properties.encode() if properties else b"null") + b"}"
+
+def link_json(row: Sequence[Any]) -> bytes:
+    """Encodes a (id, project_id, source_device_id, target_device_id, source_port, target_port) row."""
+    link_id, project_id, source_device_id, target_device_id, source_port, target_port = row
+    return _dumps({
+        "id": link_id,
+        "project_id": project_id,
+        "source_device_id": source_device_id,
+        "target_device_id": target_device_id,
+        "source_port": source_port,
+        "target_port": target_port,
+    })
+
+def ndjson_chunks(device_batches: Iterable[Sequence[Sequence[Any]]], link_batches: Iterable[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    """One {"device": {...}} or {"link": {...}} object per line, one chunk per row batch."""
+    # Only the encoding is timed; fetching the next batch happens outside the timer
+    for batch in device_batches:
+        with metrics.serialization_timer():
+            chunk = b"".join(b'{"device":' + device_json(row) + b"}\n" for row in batch)
+        yield chunk
+    for batch in link_batches:
+        with metrics.serialization_timer():
+            chunk = b"".join(b'{"link":' + link_json(row) + b"}\n" for row in batch)
+        yield chunk
+
+def json_chunks(device_batches: Iterable[Sequence[Sequence[Any]]], link_batches: Iterable[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    """A TopologyResponse-shaped document emitted incrementally, one chunk per row batch."""
+    def array(batches: Iterable[Sequence[Sequence[Any]]], encode) -> Iterator[bytes]:
+        separator = b""
+        for batch in batches:
+            if batch:
+                with metrics.serialization_timer():
+                    chunk = separator + b",".join(encode(row) for row in batch)
+                yield chunk
+                separator = b","
+
+    yield b'{"devices":['
+    yield from array(device_batches, device_json)
+    yield b'],"links":['
+    yield from array(link_batches, link_json)
+    yield b"]}"
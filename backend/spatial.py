@@ -0,0 +1,66 @@
+# In-memory spatial index for viewport queries.
+# Devices are bucketed into a uniform grid sized for a few devices per cell and stored cell-sorted
+# (CSR style), so a bounding-box query touches only the cells it overlaps: one contiguous slice per grid row.
+import math
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+TARGET_DEVICES_PER_CELL = 16
+
+class GridIndex:
+    def __init__(self, ids: np.ndarray, xs: np.ndarray, ys: np.ndarray):
+        finite = np.isfinite(xs) & np.isfinite(ys) # An infinite coordinate would make the grid infinitely wide
+        ids, xs, ys = ids[finite], xs[finite], ys[finite]
+        self.min_x = float(xs.min()) if len(xs) else 0.0
+        self.min_y = float(ys.min()) if len(ys) else 0.0
+        width = (float(xs.max()) - self.min_x) if len(xs) else 0.0
+        height = (float(ys.max()) - self.min_y) if len(ys) else 0.0
+        cells_per_side = max(1, int(math.sqrt(len(ids) / TARGET_DEVICES_PER_CELL)))
+        self.cell_size = max(width, height, 1.0) / cells_per_side
+        self.columns = cells_per_side + 1
+
+        cell_x, cell_y = self._cell(xs, self.min_x), self._cell(ys, self.min_y)
+        keys = cell_y * self.columns + cell_x
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.ids = ids[order]
+        self.xs = xs[order]
+        self.ys = ys[order]
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.ids.nbytes + self.xs.nbytes + self.ys.nbytes
+
+    def _cell(self, values: np.ndarray, origin: float) -> np.ndarray:
+        # Clipped before the cast: far-out query bounds would overflow int64
+        return np.clip((values - origin) // self.cell_size, 0, self.columns - 1).astype(np.int64)
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> np.ndarray:
+        """DB ids of the devices inside the box (inclusive), in no particular order."""
+        if len(self.ids) == 0 or min_x > max_x or min_y > max_y:
+            return np.empty(0, dtype=np.int64)
+        x0, x1 = self._cell(np.array([min_x, max_x]), self.min_x)
+        y0, y1 = self._cell(np.array([min_y, max_y]), self.min_y)
+        rows = np.arange(y0, y1 + 1) * self.columns
+        starts = np.searchsorted(self.keys, rows + x0, side="left")
+        ends = np.searchsorted(self.keys, rows + x1, side="right")
+        candidates = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)]) if len(rows) else []
+        candidates = np.asarray(candidates, dtype=np.int64)
+        xs, ys = self.xs[candidates], self.ys[candidates]
+        inside = (xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y)
+        return self.ids[candidates[inside]]
+
+def build_grid_index(db: Session, project_id: int) -> GridIndex:
+    """Index of the project's positioned devices; devices without x/y are not part of any viewport."""
+    rows = db.execute(
+        select(models.Device.id, models.Device.x_position, models.Device.y_position)
+        .where(models.Device.project_id == project_id, models.Device.x_position.is_not(None), models.Device.y_position.is_not(None))
+    ).all()
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    xs = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    ys = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    return GridIndex(ids, xs, ys)
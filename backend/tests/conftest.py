@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+# Keep the module-level engine and caches away from the working directory and any shared cache;
+# the tests build their own databases through the fixtures below
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'network_topology.db')}")
+os.environ["CACHE_BACKEND"] = "memory"
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import cache, models
+from backend.migrations import prepare_database
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Project ids and revisions repeat across the per-test databases, so cached entries must not leak
+    yield
+    for process_cache in (cache.topology_cache, cache.analysis_cache, cache.spatial_cache, cache.graph_cache, cache.user_cache):
+        process_cache.clear()
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    prepare_database(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def SessionLocal(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def db(SessionLocal):
+    with SessionLocal() as session:
+        yield session
+
+@pytest.fixture
+def project(db):
+    """(project_id, user_id) of an empty project."""
+    user = models.User(username="alice", password_hash="x")
+    db.add(user)
+    db.flush()
+    project = models.Project(project_name="lab", user_id=user.id)
+    db.add(project)
+    db.commit()
+    return project.id, user.id
+
+@pytest.fixture
+def client():
+    """Client of the application, on the module-level database configured above."""
+    from backend.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def login(client):
+    """login() registers a fresh user and returns the Authorization header of their token."""
+    def login(username=None, password="secret"):
+        username = username or f"user-{uuid.uuid4().hex}"
+        client.post("/auth/register", json={"username": username, "password": password}).raise_for_status()
+        token = client.post("/auth/token", data={"username": username, "password": password}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return login
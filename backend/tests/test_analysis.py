@@ -0,0 +1,43 @@
+import json
+
+import numpy as np
+
+from backend import analysis, graph
+
+def _arrays(throughput, load, links):
+    n = len(throughput)
+    links = np.array(links, dtype=np.int64).reshape(-1, 2)
+    return analysis.TopologyArrays(
+        device_ids=np.arange(1, n + 1),
+        num_ports=np.zeros(n),
+        total_bandwidth=np.zeros(n),
+        throughput_per_port=np.array(throughput, dtype=np.float64),
+        estimated_load=np.array(load, dtype=np.float64),
+        link_ids=np.arange(1, len(links) + 1),
+        link_source=links[:, 0],
+        link_target=links[:, 1],
+    )
+
+def test_links_of_unknown_capacity_are_not_flagged():
+    # Device 2 has no throughput_per_port (coalesced to 0 when loaded), device 4 an explicit 0
+    arrays = _arrays(throughput=[10, 0, 10, 0], load=[40, 40, 40, 40], links=[(0, 1), (0, 2), (2, 3)])
+    capacity = analysis.link_capacities(arrays)
+    assert np.isnan(capacity[0]) and np.isnan(capacity[2])
+    assert capacity[1] == 10
+
+    result = analysis.analyze(arrays)
+    assert [link["id"] for link in result["links"]] == [2]
+    assert result["links"][0]["capacity"] == 10
+    assert result["overloaded_link_count"] == 1
+    json.dumps(result, allow_nan=False)
+
+def test_component_bottleneck_ignores_unknown_capacities():
+    arrays = _arrays(throughput=[10, 5, 0], load=[0, 0, 0], links=[(0, 1), (1, 2)])
+    (component,) = analysis.analyze(arrays)["components"]
+    assert (component["bottleneck_link_id"], component["bottleneck_capacity"]) == (1, 5.0)
+
+def test_graph_paths_cost_unknown_capacity_as_the_slowest_link():
+    arrays = _arrays(throughput=[10, 10, 5, 0], load=[0] * 4, links=[(0, 1), (1, 2), (2, 3)])
+    index = graph.GraphIndex(arrays.device_ids, arrays.link_ids, arrays.link_source, arrays.link_target,
+                             analysis.link_capacities(arrays))
+    assert index.link_cost.tolist() == [1.0, 2.0, 2.0]
@@ -0,0 +1,71 @@
+import time
+import uuid
+
+import pytest
+from sqlalchemy import delete, update
+
+from backend import cache, database, models
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.monotonic()
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return time.time()
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+def _me(client, headers):
+    return client.get("/auth/users/me", headers=headers)
+
+def _change_user(name, **values):
+    """Changes the user directly in the database, as an admin script or another process would."""
+    with database.SessionLocal() as db:
+        stmt = models.User.username == name
+        db.execute(update(models.User).where(stmt).values(**values) if values else delete(models.User).where(stmt))
+        db.commit()
+
+@pytest.mark.parametrize("change", ["delete", "rename"])
+def test_removed_usernames_stop_authenticating(client, login, clock, change):
+    username = f"user-{uuid.uuid4().hex}"
+    headers = login(username)
+    assert _me(client, headers).json()["username"] == username # Now cached
+
+    if change == "delete":
+        _change_user(username)
+    else:
+        _change_user(username, username=f"{username}-renamed")
+    # Unseen by this process until the cached entry expires
+    clock.now += cache.USER_CACHE_TTL_SECONDS / 2
+    assert _me(client, headers).status_code == 200
+    clock.now += cache.USER_CACHE_TTL_SECONDS
+    assert _me(client, headers).status_code == 401
+
+def test_invalidation_takes_effect_immediately(client, login, clock):
+    username = f"user-{uuid.uuid4().hex}"
+    headers = login(username)
+    assert _me(client, headers).status_code == 200
+    _change_user(username)
+    cache.invalidate_user(username)
+    assert _me(client, headers).status_code == 401
+
+def test_reregistered_username_is_not_served_the_old_users_id(client, login, clock):
+    username = f"user-{uuid.uuid4().hex}"
+    old_id = _me(client, login(username)).json()["id"]
+    login() # Holds the highest id, so the name cannot get its old id back
+    _change_user(username)
+
+    # Registering goes through crud, which drops the cached entry of the name
+    new_headers = login(username)
+    new_user = _me(client, new_headers).json()
+    assert new_user["id"] != old_id
+    project = client.post("/projects/", json={"project_name": "mine"}, headers=new_headers).json()
+    with database.SessionLocal() as db:
+        assert db.get(models.Project, project["id"]).user_id == new_user["id"]
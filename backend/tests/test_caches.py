@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from backend import cache, crud, schemas
+
+def _chain(names):
+    return {
+        "devices": [{"client_id": name, "name": name, "device_type": "Switch", "properties": {"x_position": 0, "y_position": 0}}
+                    for name in names],
+        "links": [{"source_device_client_id": a, "target_device_client_id": b} for a, b in zip(names, names[1:])],
+    }
+
+@pytest.mark.parametrize("path, params", [
+    ("graph/critical", {}),
+    ("analysis/", {}),
+    ("topology/viewport", {"min_x": -1, "min_y": -1, "max_x": 1, "max_y": 1}),
+    ("topology/", {}),
+])
+def test_recreated_project_id_does_not_hit_the_deleted_projects_entries(client, login, monkeypatch, path, params):
+    alice, bob = login(), login()
+    deleted_id = client.post("/projects/", json={"project_name": "old"}, headers=alice).json()["id"]
+    client.put(f"/projects/{deleted_id}/topology/", json=_chain(["a", "b", "c"]), headers=alice).raise_for_status()
+    stale = client.get(f"/projects/{deleted_id}/{path}", params=params, headers=alice)
+    assert stale.status_code == 200
+
+    # Deleted through another worker, whose invalidation this process never sees
+    monkeypatch.setattr(cache, "invalidate_project_topology", lambda project_id: None)
+    client.delete(f"/projects/{deleted_id}", headers=alice).raise_for_status()
+    # SQLite hands the highest id out again; the new project reaches the same revision
+    assert client.post("/projects/", json={"project_name": "new"}, headers=bob).json()["id"] == deleted_id
+    client.put(f"/projects/{deleted_id}/topology/", json=_chain(["x", "y"]), headers=bob).raise_for_status()
+
+    served = client.get(f"/projects/{deleted_id}/{path}", params=params, headers=bob)
+    for process_cache in (cache.topology_cache, cache.analysis_cache, cache.spatial_cache, cache.graph_cache):
+        process_cache.clear()
+    fresh = client.get(f"/projects/{deleted_id}/{path}", params=params, headers=bob)
+    assert served.status_code == fresh.status_code == 200
+    assert served.content == fresh.content != stale.content
+
+def test_conditional_reads_and_invalidation_after_writes(client, login):
+    headers = login()
+    project_id = client.post("/projects/", json={"project_name": "lab"}, headers=headers).json()["id"]
+    client.put(f"/projects/{project_id}/topology/", json=_chain(["a", "b"]), headers=headers).raise_for_status()
+    first = client.get(f"/projects/{project_id}/topology/", headers=headers)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    revalidated = client.get(f"/projects/{project_id}/topology/", headers={**headers, "If-None-Match": etag})
+    assert (revalidated.status_code, revalidated.content, revalidated.headers["ETag"]) == (304, b"", etag)
+    assert client.get(f"/projects/{project_id}/topology/", headers={**headers, "If-None-Match": '"other", ' + etag}).status_code == 304
+
+    device_id = first.json()["devices"][0]["id"]
+    client.patch(f"/projects/{project_id}/topology/", json={"updated_devices": [{"id": device_id, "name": "renamed"}]},
+                 headers=headers).raise_for_status()
+    changed = client.get(f"/projects/{project_id}/topology/", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert [device["name"] for device in changed.json()["devices"]] == ["renamed", "b"]
+
+    client.put(f"/projects/{project_id}/topology/", json=_chain(["x"]), headers=headers).raise_for_status()
+    replaced = client.get(f"/projects/{project_id}/topology/", headers={**headers, "If-None-Match": changed.headers["ETag"]})
+    assert [device["name"] for device in replaced.json()["devices"]] == ["x"]
+
+def test_write_between_device_and_link_reads_is_not_cached_under_the_old_version(db, SessionLocal, project, monkeypatch):
+    project_id, user_id = project
+    crud.update_project_topology(db, project_id, user_id, schemas.TopologyData(**_chain(["a", "b", "c"])))
+    old_version = crud.get_project_version(db, project_id, user_id)
+    device_ids = [row[0] for batch in crud.iter_project_device_rows(db, project_id) for row in batch]
+
+    read_links = crud.iter_project_link_rows
+    def read_links_after_a_write(session, project_id):
+        if crud.get_project_version(session, project_id, user_id) == old_version:
+            with SessionLocal() as writer: # Commits after the devices were read
+                crud.apply_topology_changeset(writer, project_id, user_id, schemas.TopologyChangeset(removed_device_ids=device_ids[:1]))
+        return read_links(session, project_id)
+    monkeypatch.setattr(crud, "iter_project_link_rows", read_links_after_a_write)
+
+    version, body = crud.get_project_topology_json(db, project_id, old_version)
+
+    new_version = crud.get_project_version(db, project_id, user_id)
+    assert version == new_version != old_version
+    topology = json.loads(body)
+    assert [device["name"] for device in topology["devices"]] == ["b", "c"]
+    assert len(topology["links"]) == 1
+    assert cache.topology_cache.get(crud.project_topology_key(project_id, *old_version)) is None
+    assert cache.topology_cache.get(crud.project_topology_key(project_id, *new_version)) == body
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from backend import crud, models, schemas
+
+def _changeset(**fields) -> schemas.TopologyChangeset:
+    return schemas.TopologyChangeset(**fields)
+
+def _topology(db, project_id, user_id):
+    _, body = crud.get_project_topology_json(db, project_id, crud.get_project_version(db, project_id, user_id))
+    return json.loads(body)
+
+@pytest.fixture
+def seeded(db, project):
+    """A project holding r1 - r2 - r3 (routers linked in a chain), at revision 1."""
+    project_id, user_id = project
+    result = crud.apply_topology_changeset(db, project_id, user_id, _changeset(
+        added_devices=[
+            {"client_id": f"c{i}", "name": f"r{i}", "device_type": "Router", "properties": {"num_ports": 4, "x_position": i}}
+            for i in range(1, 4)
+        ],
+        added_links=[
+            {"client_id": "l1", "source_device_client_id": "c1", "target_device_client_id": "c2"},
+            {"client_id": "l2", "source_device_client_id": "c2", "target_device_client_id": "c3", "source_port": "eth1"},
+        ],
+    ))
+    return project_id, user_id, result
+
+def test_added_rows_get_ids_for_their_client_ids(db, seeded):
+    project_id, user_id, result = seeded
+    assert result.revision == 1
+    assert set(result.device_id_map) == {"c1", "c2", "c3"}
+    assert list(result.link_id_map) == ["l1", "l2"]
+    assert result.link_ids == [result.link_id_map["l1"], result.link_id_map["l2"]]
+
+    topology = _topology(db, project_id, user_id)
+    assert {device["name"] for device in topology["devices"]} == {"r1", "r2", "r3"}
+    link = next(link for link in topology["links"] if link["id"] == result.link_id_map["l2"])
+    assert (link["source_device_id"], link["target_device_id"], link["source_port"]) == (
+        result.device_id_map["c2"], result.device_id_map["c3"], "eth1")
+
+def test_property_updates_merge_and_sync_typed_columns(db, seeded):
+    project_id, user_id, result = seeded
+    device_id = result.device_id_map["c1"]
+    crud.apply_topology_changeset(db, project_id, user_id, _changeset(
+        updated_devices=[{"id": device_id, "properties": {"estimated_load": 2.5}}],
+    ))
+    device = db.get(models.Device, device_id)
+    db.refresh(device)
+    assert device.properties == {"num_ports": 4, "x_position": 1, "estimated_load": 2.5}
+    assert (device.num_ports, device.estimated_load) == (4, 2.5)
+
+    # A null properties patch leaves them unchanged
+    crud.apply_topology_changeset(db, project_id, user_id, _changeset(updated_devices=[{"id": device_id, "name": "core"}]))
+    db.refresh(device)
+    assert device.name == "core"
+    assert device.properties["estimated_load"] == 2.5
+
+def test_removing_a_device_removes_its_links(db, seeded):
+    project_id, user_id, result = seeded
+    crud.apply_topology_changeset(db, project_id, user_id, _changeset(removed_device_ids=[result.device_id_map["c2"]]))
+    topology = _topology(db, project_id, user_id)
+    assert {device["name"] for device in topology["devices"]} == {"r1", "r3"}
+    assert topology["links"] == []
+
+def test_links_to_devices_of_other_projects_are_skipped(db, seeded):
+    project_id, user_id, result = seeded
+    other = models.Project(project_name="other", user_id=user_id)
+    db.add(other)
+    db.commit()
+    foreign = crud.apply_topology_changeset(db, other.id, user_id, _changeset(
+        added_devices=[{"client_id": "x", "name": "x", "device_type": "PC", "properties": {}}],
+    )).device_id_map["x"]
+
+    outcome = crud.apply_topology_changeset(db, project_id, user_id, _changeset(added_links=[
+        {"source_device_id": result.device_id_map["c1"], "target_device_id": foreign},
+        {"source_device_id": result.device_id_map["c1"], "target_device_id": result.device_id_map["c3"]},
+    ]))
+    assert len(outcome.link_ids) == 1
+    assert len(_topology(db, project_id, user_id)["links"]) == 3
+
+def test_stale_base_revision_is_rejected_without_changes(db, seeded):
+    project_id, user_id, result = seeded
+    crud.apply_topology_changeset(db, project_id, user_id, _changeset(
+        base_revision=1, updated_devices=[{"id": result.device_id_map["c1"], "name": "first"}],
+    ))
+    with pytest.raises(crud.StaleRevisionError) as error:
+        crud.apply_topology_changeset(db, project_id, user_id, _changeset(
+            base_revision=1, updated_devices=[{"id": result.device_id_map["c1"], "name": "second"}],
+        ))
+    assert error.value.current_revision == 2
+    assert crud.get_project_version(db, project_id, user_id)[0] == 2
+    assert db.get(models.Device, result.device_id_map["c1"]).name == "first"
+
+    # Rebased on the current revision the save goes through
+    assert crud.apply_topology_changeset(db, project_id, user_id, _changeset(
+        base_revision=2, updated_devices=[{"id": result.device_id_map["c1"], "name": "second"}],
+    )).revision == 3
+
+def test_other_users_project_is_not_found(db, seeded):
+    project_id, user_id, _ = seeded
+    assert crud.apply_topology_changeset(db, project_id, user_id + 1, _changeset()) is None
+    assert crud.get_project_version(db, project_id, user_id)[0] == 1
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from backend import collab, crud, models, schemas
+
+def test_broker_interface_is_abstract():
+    with pytest.raises(TypeError):
+        collab.Broker()
+
+def test_slow_subscribers_lose_their_oldest_messages():
+    async def scenario():
+        broker = collab.InMemoryBroker(queue_size=2)
+        queue = broker.subscribe("project:1")
+        for sequence in range(3):
+            await broker.publish("project:1", {"sequence": sequence})
+        await broker.publish("project:2", {"sequence": 99})
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert asyncio.run(scenario()) == ['{"sequence": 1}', '{"sequence": 2}']
+
+def test_sqlite_broker_fans_out_between_brokers_sharing_a_file(tmp_path):
+    path = str(tmp_path / "collab.db")
+
+    async def scenario():
+        # Two brokers on one file stand in for two worker processes
+        first = collab.SQLiteBroker(path, poll_seconds=0.01)
+        second = collab.SQLiteBroker(path, poll_seconds=0.01)
+        await first.publish("project:1", {"sequence": 0}) # Before anyone subscribed: not delivered
+        first_queue = first.subscribe("project:1")
+        second_queue = second.subscribe("project:1")
+        other_queue = second.subscribe("project:2")
+        await first.publish("project:1", {"sequence": 1})
+        await second.publish("project:1", {"sequence": 2})
+        received = [
+            [await asyncio.wait_for(queue.get(), 1) for _ in range(2)]
+            for queue in (first_queue, second_queue)
+        ]
+        for broker, queue, channel in ((first, first_queue, "project:1"), (second, second_queue, "project:1"), (second, other_queue, "project:2")):
+            broker.unsubscribe(channel, queue)
+        return received, other_queue.empty()
+
+    received, other_empty = asyncio.run(scenario())
+    assert received == [['{"sequence": 1}', '{"sequence": 2}']] * 2
+    assert other_empty
+
+@pytest.fixture
+def collab_client():
+    app = FastAPI()
+
+    @app.websocket("/ws")
+    async def socket(websocket: WebSocket):
+        await websocket.accept()
+        await collab.serve(websocket, project_id=1, user_id=1, revision=0)
+
+    with TestClient(app) as client:
+        yield client
+
+def test_malformed_frames_are_answered_not_fatal(collab_client):
+    with collab_client.websocket_connect("/ws") as socket:
+        assert socket.receive_json()["type"] == "hello"
+        socket.send_text("not json{")
+        assert socket.receive_json()["detail"][0]["type"] == "json_invalid"
+        socket.send_json({"op": "bogus"})
+        assert socket.receive_json()["type"] == "error"
+
+        socket.send_bytes(b"\x00")
+        with pytest.raises(WebSocketDisconnect) as closed:
+            socket.receive_json()
+        assert closed.value.code == 1003
+    assert 1 not in collab.rooms
+
+def test_edits_of_missing_rows_are_not_persisted(db, project):
+    project_id, user_id = project
+    device_id = crud.apply_topology_changeset(db, project_id, user_id, schemas.TopologyChangeset(
+        added_devices=[{"client_id": "a", "name": "a", "device_type": "PC", "properties": {}}],
+    )).device_id_map["a"]
+
+    room = collab.ProjectRoom(project_id)
+    room.submit("1", user_id, schemas.MoveDeviceOp(op="move", id=device_id + 100, x=1, y=2))
+    room.submit("1", user_id, schemas.AddLinkOp(op="add_link", client_id="l", source_device_id=device_id, target_device_id=device_id + 100))
+    room.submit("1", user_id, schemas.RemoveLinkOp(op="remove_link", id=1))
+    assert collab.apply_edits(db, project_id, user_id, room.pending_edits[user_id]) is None
+    assert crud.get_project_version(db, project_id, user_id)[0] == 1
+
+    room.submit("1", user_id, schemas.MoveDeviceOp(op="move", id=device_id, x=1, y=2))
+    result = collab.apply_edits(db, project_id, user_id, room.pending_edits[user_id])
+    assert result.revision == 2
+    assert db.get(models.Device, device_id).properties == {"x_position": 1.0, "y_position": 2.0}
+
+def test_edits_are_written_as_the_user_who_made_them(db, project):
+    project_id, user_id = project
+    device_id = crud.apply_topology_changeset(db, project_id, user_id, schemas.TopologyChangeset(
+        added_devices=[{"client_id": "a", "name": "a", "device_type": "PC", "properties": {}}],
+    )).device_id_map["a"]
+
+    room = collab.ProjectRoom(project_id)
+    room.submit("1", user_id + 1, schemas.UpdateDeviceOp(op="update", id=device_id, name="renamed"))
+    assert list(room.pending_edits) == [user_id + 1]
+    # Not the owner, so nothing is written
+    assert collab.apply_edits(db, project_id, user_id + 1, room.pending_edits[user_id + 1]) is None
+    assert db.get(models.Device, device_id).name == "a"
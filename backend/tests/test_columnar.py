@@ -0,0 +1,166 @@
+import io
+import json
+import struct
+
+import pytest
+
+from backend import columnar
+
+DEVICES = [
+    (1, 1, "core", "Router", json.dumps({"num_ports": 48, "estimated_load": 0.5, "vendor": "x", "x_position": 1e300})),
+    (2, 1, None, None, None),
+    (3, 1, "ünïcode", "Switch", json.dumps({"num_ports": 4.5, "total_bandwidth": True, "tags": ["a"]})),
+    (4, 1, "leaf", "Router", json.dumps([1, 2])),
+]
+LINKS = [(10, 1, 1, 3, "eth0", None), (11, 1, 3, 4, None, "ge-0/0/1")]
+
+def _export(tmp_path, codec="none", batch_size=2):
+    path = tmp_path / f"topology-{codec}.ntopo"
+    with open(path, "wb") as fileobj:
+        columnar.write_topology(
+            fileobj,
+            (DEVICES[start:start + batch_size] for start in range(0, len(DEVICES), batch_size)),
+            (LINKS[start:start + batch_size] for start in range(0, len(LINKS), batch_size)),
+            codec=codec,
+        )
+    return path
+
+@pytest.mark.parametrize("codec", columnar.CODECS)
+def test_round_trip_preserves_rows(tmp_path, codec):
+    with columnar.TopologyReader(str(_export(tmp_path, codec))) as reader:
+        devices = list(reader.iter_devices(batch_size=3))
+        links = list(reader.iter_links(batch_size=1))
+
+    assert devices == [
+        {"client_id": "1", "name": "core", "device_type": "Router",
+         "properties": {"num_ports": 48, "estimated_load": 0.5, "vendor": "x", "x_position": 1e300}},
+        {"client_id": "2", "name": None, "device_type": None, "properties": None},
+        {"client_id": "3", "name": "ünïcode", "device_type": "Switch",
+         "properties": {"num_ports": 4.5, "total_bandwidth": True, "tags": ["a"]}},
+        {"client_id": "4", "name": "leaf", "device_type": "Router", "properties": [1, 2]},
+    ]
+    assert isinstance(devices[0]["properties"]["num_ports"], int)
+    assert links == [
+        {"source_device_client_id": "1", "target_device_client_id": "3", "source_port": "eth0", "target_port": None},
+        {"source_device_client_id": "3", "target_device_client_id": "4", "source_port": None, "target_port": "ge-0/0/1"},
+    ]
+
+def test_batching_does_not_change_the_file(tmp_path):
+    assert _export(tmp_path, batch_size=1).read_bytes() == _export(tmp_path, batch_size=100).read_bytes()
+
+def test_empty_topology(tmp_path):
+    buffer = io.BytesIO()
+    columnar.write_topology(buffer, [], [])
+    path = tmp_path / "empty.ntopo"
+    path.write_bytes(buffer.getvalue())
+    with columnar.TopologyReader(str(path)) as reader:
+        assert (reader.device_count, reader.link_count) == (0, 0)
+        assert list(reader.iter_devices()) == [] and list(reader.iter_links()) == []
+
+def _corrupt_column(path, column, data):
+    with columnar.TopologyReader(str(path)) as reader:
+        position = reader._data_start + reader.columns[column]["offset"]
+    content = bytearray(path.read_bytes())
+    content[position:position + len(data)] = data
+    path.write_bytes(bytes(content))
+
+@pytest.mark.parametrize("column", ["device_name.data", "device_properties.data", "link_source_port.data", "link_target_port.data"])
+def test_invalid_utf8_is_a_format_error(tmp_path, column):
+    path = _export(tmp_path)
+    _corrupt_column(path, column, b"\xff")
+    with columnar.TopologyReader(str(path)) as reader:
+        with pytest.raises(columnar.FormatError):
+            list(reader.iter_devices())
+            list(reader.iter_links())
+
+def test_invalid_properties_json_is_a_format_error(tmp_path):
+    path = _export(tmp_path)
+    _corrupt_column(path, "device_properties.data", b"}")
+    with columnar.TopologyReader(str(path)) as reader:
+        with pytest.raises(columnar.FormatError):
+            list(reader.iter_devices())
+
+@pytest.mark.parametrize("damage", [
+    lambda content: b"NOTNTOPO" + content[8:],
+    lambda content: content[:12],
+    lambda content: content[:len(content) // 2],
+    lambda content: content.replace(b'"<i8"', b'"|O8"', 1),
+    lambda content: content.replace(b'"codec": "none"', b'"codec": "lz77"', 1),
+])
+def test_malformed_files_are_rejected_on_open(tmp_path, damage):
+    path = _export(tmp_path)
+    path.write_bytes(damage(path.read_bytes()))
+    with pytest.raises(columnar.FormatError):
+        columnar.TopologyReader(str(path))
+
+def test_corrupt_compressed_column_is_a_format_error(tmp_path):
+    path = _export(tmp_path, codec="zlib")
+    _corrupt_column(path, "link_source", b"\x00\x00\x00\x00")
+    with columnar.TopologyReader(str(path)) as reader:
+        with pytest.raises(columnar.FormatError):
+            reader.column("link_source")
+
+def _rewrite_header(path, edit):
+    """Applies edit(header) and writes the file back with the same column data."""
+    content = path.read_bytes()
+    with columnar.TopologyReader(str(path)) as reader:
+        data = content[reader._data_start:]
+    (length,) = struct.unpack_from("<Q", content, len(columnar.MAGIC))
+    header = json.loads(content[len(columnar.MAGIC) + 8:len(columnar.MAGIC) + 8 + length])
+    edit(header)
+    encoded = json.dumps(header).encode()
+    prefix = columnar.MAGIC + struct.pack("<Q", len(encoded)) + encoded
+    path.write_bytes(prefix + b"\0" * (columnar._aligned(len(prefix)) - len(prefix)) + data)
+
+def _set(column, key, value):
+    def edit(header):
+        header["columns"][column][key] = value
+    return edit
+
+@pytest.mark.parametrize("codec", columnar.CODECS)
+@pytest.mark.parametrize("edit", [
+    _set("link_source", "offset", -8),
+    _set("device_id", "count", -1),
+    _set("device_name.data", "length", -1),
+    _set("link_target", "count", 3), # Does not match the link count nor, uncompressed, the length
+    _set("device_id", "offset", "0"),
+    _set("link_id", "length", True),
+    lambda header: header.update(devices=-1),
+    lambda header: header["columns"].update(link_id=[]),
+])
+def test_inconsistent_column_directory_is_rejected_on_open(tmp_path, codec, edit):
+    path = _export(tmp_path, codec)
+    _rewrite_header(path, edit)
+    with pytest.raises(columnar.FormatError):
+        columnar.TopologyReader(str(path))
+
+def test_column_length_must_match_its_count_when_uncompressed(tmp_path):
+    path = _export(tmp_path)
+    _rewrite_header(path, _set("device_type", "length", 4 * 4 - 1))
+    with pytest.raises(columnar.FormatError, match="inconsistent length"):
+        columnar.TopologyReader(str(path))
+
+@pytest.fixture
+def project_id(client, login):
+    client.headers.update(login())
+    return client.post("/projects/", json={"project_name": "lab"}).json()["id"]
+
+def test_binary_import_of_an_inconsistent_file_is_a_bad_request(client, project_id, tmp_path):
+    path = _export(tmp_path)
+    _rewrite_header(path, _set("link_source", "offset", -8))
+    response = client.post(f"/projects/{project_id}/topology/import/binary", content=path.read_bytes())
+    assert response.status_code == 400
+    assert "non-negative" in response.json()["detail"]
+
+@pytest.mark.parametrize("path", ["topology/import/binary", "jobs/import"])
+def test_uploads_above_the_size_limit_are_rejected(client, project_id, tmp_path, monkeypatch, path):
+    content = _export(tmp_path).read_bytes()
+    monkeypatch.setattr(columnar, "MAX_UPLOAD_BYTES", len(content) - 1)
+    url = f"/projects/{project_id}/{path}"
+    assert client.post(url, content=content).status_code == 413
+    # Without a Content-Length the limit applies while the body streams in
+    assert client.post(url, content=iter([content[:100], content[100:]])).status_code == 413
+    assert client.get(f"/projects/{project_id}/topology/").json()["devices"] == []
+
+    monkeypatch.setattr(columnar, "MAX_UPLOAD_BYTES", len(content))
+    assert client.post(f"/projects/{project_id}/topology/import/binary", content=content).json()["devices_created"] == 4
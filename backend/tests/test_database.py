@@ -0,0 +1,30 @@
+import asyncio
+
+import anyio.to_thread
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import database
+
+def test_sync_mode_does_not_hold_connections_between_calls(client, login, monkeypatch):
+    # More requests in flight than pooled connections, and fewer threads than requests: a request that kept
+    # its connection while waiting for a thread would starve the threads waiting for a connection
+    headers = login()
+    project_id = client.post("/projects/", json={"project_name": "lab"}, headers=headers).json()["id"]
+    bounded = create_engine(database.SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+                            pool_size=2, max_overflow=0, pool_timeout=2)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=bounded))
+    paths = [f"/projects/{project_id}/topology/", "/projects/", f"/projects/{project_id}"] * 10
+
+    async def load():
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 4
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as load_client:
+            return await asyncio.gather(*(load_client.get(path) for path in paths))
+
+    try:
+        responses = asyncio.run(load())
+    finally:
+        bounded.dispose()
+    assert [response.status_code for response in responses] == [200] * len(paths)
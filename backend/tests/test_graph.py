@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from backend import graph
+
+def _index(device_count, links, capacity=None):
+    """Index with device ids 10, 20, ... and link ids 101, 102, ..., so ids never coincide with positions."""
+    links = np.array(links, dtype=np.int64).reshape(-1, 2)
+    capacity = np.zeros(len(links)) if capacity is None else np.array(capacity, dtype=np.float64)
+    return graph.GraphIndex(10 * np.arange(1, device_count + 1), np.arange(101, len(links) + 101),
+                            links[:, 0], links[:, 1], capacity)
+
+def _component_count(device_count, links):
+    links = np.array(links, dtype=np.int64).reshape(-1, 2)
+    adjacency = coo_matrix((np.ones(len(links)), (links[:, 0], links[:, 1])), shape=(device_count, device_count))
+    return connected_components(adjacency, directed=False)[0]
+
+def _brute_force_critical(device_count, links):
+    """Bridges and articulation points by removing each element and counting components."""
+    base = _component_count(device_count, links)
+    bridges = [101 + i for i in range(len(links)) if _component_count(device_count, links[:i] + links[i + 1:]) > base]
+    articulation = []
+    for device in range(device_count):
+        others = [position for position in range(device_count) if position != device]
+        renumber = {position: i for i, position in enumerate(others)}
+        kept = [(renumber[a], renumber[b]) for a, b in links if device not in (a, b)]
+        # Removing an isolated device removes its component; that is not a split
+        isolated = all(device not in (a, b) or a == b for a, b in links)
+        if not isolated and _component_count(device_count - 1, kept) > base:
+            articulation.append(10 * (device + 1))
+    return articulation, bridges
+
+# Two triangles joined by the link 2-3, and a separate pair 6-7
+BRIDGED = [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 5), (5, 3), (6, 7)]
+
+@pytest.mark.parametrize("links, articulation, bridges", [
+    (BRIDGED, [30, 40], [104, 108]),
+    # A second link between 2 and 3: no bridge there, but either device still separates the triangles
+    (BRIDGED + [(3, 2)], [30, 40], [108]),
+    # Self-loops neither create nor remove bridges or articulation points
+    ([(0, 1), (1, 1), (1, 2), (2, 2)], [20], [101, 103]),
+    ([(0, 0)], [], []),
+    ([], [], []),
+])
+def test_critical_elements(links, articulation, bridges):
+    device_count = max([8] + [max(link) + 1 for link in links])
+    result = _index(device_count, links).critical(limit=100)
+    assert result == {
+        "articulation_point_count": len(articulation),
+        "bridge_count": len(bridges),
+        "articulation_point_ids": articulation,
+        "bridge_link_ids": bridges,
+    }
+    assert (articulation, bridges) == _brute_force_critical(device_count, links)
+
+def test_critical_elements_match_brute_force_on_random_graphs():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        device_count = int(rng.integers(2, 12))
+        links = [tuple(int(end) for end in rng.integers(0, device_count, 2)) for _ in range(int(rng.integers(0, 16)))]
+        result = _index(device_count, links).critical(limit=100)
+        assert (result["articulation_point_ids"], result["bridge_link_ids"]) == _brute_force_critical(device_count, links)
+
+def test_critical_limit_truncates_ids_but_not_counts():
+    result = _index(8, BRIDGED).critical(limit=1)
+    assert result["articulation_point_ids"] == [30]
+    assert (result["articulation_point_count"], result["bridge_count"]) == (2, 2)
+
+def test_failure_of_a_bridge_disconnects_the_smaller_side():
+    # Triangle 0-1-2, bridge 2-3 to the pair 3-4, and the separate pair 5-6
+    index = _index(7, [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (5, 6)])
+    result = index.failure_impact(device_ids=[], link_ids=[104], limit=100)
+    assert result == {
+        "failed_device_ids": [],
+        "failed_link_ids": [104],
+        "partition_count": 1,
+        "disconnected_device_count": 2,
+        "truncated": False,
+        "disconnected_device_ids": [40, 50],
+    }
+
+    result = index.failure_impact(device_ids=[30], link_ids=[], limit=1)
+    assert (result["partition_count"], result["disconnected_device_count"]) == (1, 2)
+    assert (result["truncated"], result["disconnected_device_ids"]) == (True, [40])
+
+def test_failure_of_one_parallel_link_disconnects_nothing():
+    index = _index(3, [(0, 1), (1, 2), (2, 1)])
+    result = index.failure_impact(device_ids=[], link_ids=[102], limit=100)
+    assert (result["partition_count"], result["disconnected_device_ids"]) == (0, [])
+    result = index.failure_impact(device_ids=[], link_ids=[102, 103], limit=100)
+    assert result["disconnected_device_ids"] == [30]
+
+def test_failure_in_one_component_leaves_the_others_alone():
+    index = _index(6, [(0, 1), (1, 2), (3, 4), (4, 5)])
+    result = index.failure_impact(device_ids=[20], link_ids=[], limit=100)
+    assert (result["partition_count"], result["disconnected_device_count"]) == (1, 1)
+    assert result["disconnected_device_ids"] in ([10], [30])
+    with pytest.raises(graph.UnknownElementError) as exc:
+        index.failure_impact(device_ids=[20, 99], link_ids=[999], limit=100)
+    assert exc.value.ids == [99]
+
+def test_shortest_path_by_hops_and_by_capacity():
+    # A direct slow link 0-3 and a fast detour through 1 and 2
+    index = _index(4, [(0, 3), (0, 1), (1, 2), (2, 3)], capacity=[1, 100, 100, 100])
+    by_hops = index.shortest_path(10, 40, "hops")
+    assert (by_hops["device_ids"], by_hops["link_ids"], by_hops["hops"]) == ([10, 40], [101], 1)
+    assert (by_hops["cost"], by_hops["bottleneck_capacity"]) == (100.0, 1.0)
+    by_capacity = index.shortest_path(10, 40, "capacity")
+    assert (by_capacity["device_ids"], by_capacity["link_ids"]) == ([10, 20, 30, 40], [102, 103, 104])
+    assert (by_capacity["cost"], by_capacity["bottleneck_capacity"]) == (3.0, 100.0)
+
+def test_shortest_path_takes_the_cheapest_parallel_link_and_ignores_self_loops():
+    index = _index(2, [(0, 0), (0, 1), (1, 0), (1, 1)], capacity=[100, 10, 100, 100])
+    for weight in ("hops", "capacity"):
+        path = index.shortest_path(10, 20, weight)
+        assert (path["link_ids"], path["cost"]) == ([103], 1.0)
+    assert index.shortest_path(10, 10, "hops") == {
+        "found": True, "hops": 0, "cost": 0.0, "bottleneck_capacity": None, "device_ids": [10], "link_ids": [],
+    }
+
+def test_shortest_path_between_components_is_not_found():
+    index = _index(4, [(0, 1), (2, 3)])
+    for weight in ("hops", "capacity"):
+        assert index.shortest_path(10, 40, weight)["found"] is False
+    with pytest.raises(graph.UnknownElementError):
+        index.shortest_path(10, 50, "hops")
+
+def test_graph_endpoints(client, login):
+    headers = login()
+    project_id = client.post("/projects/", json={"project_name": "lab"}, headers=headers).json()["id"]
+    client.put(f"/projects/{project_id}/topology/", headers=headers, json={
+        "devices": [{"client_id": name, "name": name, "device_type": "Switch", "properties": {}} for name in "abc"],
+        "links": [{"source_device_client_id": "a", "target_device_client_id": "b"},
+                  {"source_device_client_id": "b", "target_device_client_id": "c"}],
+    }).raise_for_status()
+    topology = client.get(f"/projects/{project_id}/topology/", headers=headers).json()
+    a, b, c = (device["id"] for device in topology["devices"])
+    link_ids = sorted(link["id"] for link in topology["links"])
+
+    path = client.get(f"/projects/{project_id}/graph/path", params={"source": a, "target": c}, headers=headers)
+    assert path.status_code == 200
+    assert (path.json()["device_ids"], path.json()["link_ids"]) == ([a, b, c], link_ids)
+    critical = client.get(f"/projects/{project_id}/graph/critical", headers=headers).json()
+    assert (critical["articulation_point_ids"], critical["bridge_link_ids"]) == ([b], link_ids)
+    failure = client.get(f"/projects/{project_id}/graph/failure", params={"device_ids": [b]}, headers=headers).json()
+    assert failure["disconnected_device_count"] == 1
+
+    unknown = client.get(f"/projects/{project_id}/graph/path", params={"source": a, "target": c + 1000}, headers=headers)
+    assert unknown.status_code == 404
+    assert str(c + 1000) in unknown.json()["detail"]
+    assert client.get(f"/projects/{project_id}/graph/failure", params={"link_ids": [0]}, headers=headers).status_code == 404
+    assert client.get(f"/projects/{project_id}/graph/failure", headers=headers).status_code == 400
+    assert client.get(f"/projects/{project_id + 1000}/graph/critical", headers=headers).status_code == 404
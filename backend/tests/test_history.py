@@ -0,0 +1,65 @@
+import json
+import random
+
+import pytest
+
+from backend import crud, history, schemas
+
+def _live(db, project_id, user_id):
+    (revision, _), body = crud.get_project_topology_json(db, project_id, crud.get_project_version(db, project_id, user_id))
+    return revision, json.loads(body)
+
+@pytest.fixture
+def edited(db, project, monkeypatch):
+    """Runs a replace and a series of random changesets; returns the live topology after every revision."""
+    monkeypatch.setattr(history, "REVISION_CHECKPOINT_INTERVAL", 4) # Rebuilds then cross checkpoints
+    project_id, user_id = project
+    rng = random.Random(0)
+    crud.update_project_topology(db, project_id, user_id, schemas.TopologyData(
+        devices=[{"client_id": str(i), "name": f"d{i}", "device_type": "Switch", "properties": {"num_ports": i}} for i in range(6)],
+        links=[{"source_device_client_id": str(i), "target_device_client_id": str(i + 1)} for i in range(5)],
+    ))
+    snapshots = dict([_live(db, project_id, user_id)])
+    for step in range(10):
+        _, topology = _live(db, project_id, user_id)
+        device_ids = [device["id"] for device in topology["devices"]]
+        link_ids = [link["id"] for link in topology["links"]]
+        crud.apply_topology_changeset(db, project_id, user_id, schemas.TopologyChangeset(
+            added_devices=[{"client_id": "new", "name": f"n{step}", "device_type": "PC", "properties": {}}],
+            updated_devices=[{"id": rng.choice(device_ids), "properties": {"x_position": step}}],
+            removed_device_ids=[rng.choice(device_ids)] if step % 3 == 2 else [],
+            added_links=[{"source_device_client_id": "new", "target_device_id": rng.choice(device_ids)}],
+            removed_link_ids=[rng.choice(link_ids)] if link_ids and step % 2 else [],
+        ))
+        snapshots.update([_live(db, project_id, user_id)])
+    return project_id, snapshots
+
+def test_every_revision_is_rebuilt_exactly(db, edited):
+    project_id, snapshots = edited
+    kinds = {revision: kind for revision, kind, _, _ in history.list_revisions(db, project_id)}
+    assert sorted(kinds) == sorted(snapshots)
+    assert {"checkpoint", "delta"} == set(kinds.values())
+
+    for revision, topology in snapshots.items():
+        assert history.topology_dict(project_id, history.load_topology_at(db, project_id, revision)) == topology
+
+def test_diff_turns_one_revision_into_another(db, edited):
+    project_id, snapshots = edited
+    old, new = history.load_topology_at(db, project_id, 2), history.load_topology_at(db, project_id, 9)
+    diff = history.diff_states(project_id, old, new)
+
+    def apply(rows, added, removed_ids, changed):
+        by_id = {row["id"]: row for row in rows}
+        for row_id in removed_ids:
+            del by_id[row_id]
+        by_id.update((row["id"], row) for row in added + changed)
+        return [by_id[key] for key in sorted(by_id)]
+
+    before = snapshots[2]
+    assert apply(before["devices"], diff["added_devices"], diff["removed_device_ids"], diff["changed_devices"]) == snapshots[9]["devices"]
+    assert apply(before["links"], diff["added_links"], diff["removed_link_ids"], diff["changed_links"]) == snapshots[9]["links"]
+    assert history.diff_states(project_id, new, new) == {key: [] for key in diff}
+
+def test_revisions_before_the_history_cannot_be_rebuilt(db, project):
+    project_id, _ = project
+    assert history.load_topology_at(db, project_id, 0) is None
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend import columnar, crud, jobs, models, schemas
+from backend.benchmarks.generators import random_topology
+
+DAY = 24 * 3600
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = tmp_path / "jobs"
+    storage.mkdir()
+    monkeypatch.setattr(jobs, "JOB_STORAGE_DIR", str(storage))
+    return storage
+
+def _file(storage, name, age, now):
+    path = storage / name
+    path.write_bytes(b"x")
+    os.utime(path, (now - age, now - age))
+    return name
+
+def _job(db, user_id, project_id, kind, status, params=None):
+    job = models.Job(user_id=user_id, project_id=project_id, kind=kind, status=status, params=params)
+    db.add(job)
+    db.commit()
+    return job
+
+def test_sweep_removes_expired_exports_and_orphaned_uploads(db, project, storage):
+    project_id, user_id = project
+    now = 10 * DAY
+    queued_import = _job(db, user_id, project_id, "import", "queued", {"upload": "upload-queued.ntopo"})
+    running_export = _job(db, user_id, project_id, "export", "running", {"codec": "none"})
+    names = {
+        "fresh export": _file(storage, "job-1000.ntopo", jobs.JOB_RESULT_RETENTION_SECONDS - 60, now),
+        "expired export": _file(storage, "job-1001.ntopo", jobs.JOB_RESULT_RETENTION_SECONDS + 60, now),
+        "export being written": _file(storage, jobs.export_filename(running_export.id), 2 * DAY, now),
+        "upload of a queued import": _file(storage, queued_import.params["upload"], 2 * DAY, now),
+        "upload still streaming": _file(storage, "upload-new.ntopo", 60, now),
+        "orphaned upload": _file(storage, "upload-orphan.ntopo", jobs.JOB_UPLOAD_GRACE_SECONDS + 60, now),
+        "unrelated file": _file(storage, "notes.txt", 2 * DAY, now),
+    }
+
+    removed = jobs.sweep_job_files(db, now=now)
+
+    assert sorted(removed) == sorted([names["expired export"], names["orphaned upload"]])
+    assert sorted(os.listdir(storage)) == sorted(set(names.values()) - set(removed))
+
+def test_sweep_without_storage_dir(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_STORAGE_DIR", str(tmp_path / "missing"))
+    assert jobs.sweep_job_files(db) == []
+
+def test_failed_import_removes_its_upload(db, project, storage):
+    project_id, user_id = project
+    job = _job(db, user_id, project_id, "import", "running", {"upload": "upload-bad.ntopo"})
+    (storage / "upload-bad.ntopo").write_bytes(b"not a topology")
+
+    with pytest.raises(jobs.JobError):
+        jobs._run_import(db, job, lambda fraction, message=None: None)
+    assert not (storage / "upload-bad.ntopo").exists()
+
+def test_crashed_job_removes_its_files(db, project, storage):
+    project_id, user_id = project
+    job = _job(db, user_id, project_id, "import", "running", {"upload": "upload-crash.ntopo"})
+    (storage / "upload-crash.ntopo").write_bytes(b"x")
+
+    jobs._fail_crashed(db, job.id)
+
+    db.refresh(job)
+    assert (job.status, job.error) == ("failed", "Worker process crashed")
+    assert os.listdir(storage) == []
+
+def _upload(db, storage, user_id, devices, links):
+    """Writes a .ntopo upload of a random topology, exported from a scratch project."""
+    source = models.Project(project_name="source", user_id=user_id)
+    db.add(source)
+    db.commit()
+    crud.bulk_import_topology_rows(db, source.id, user_id, **random_topology(devices, links))
+    with open(storage / "upload-import.ntopo", "wb") as upload:
+        columnar.write_topology(upload, crud.iter_project_device_rows(db, source.id), crud.iter_project_link_rows(db, source.id))
+    return "upload-import.ntopo"
+
+def test_import_leaves_the_write_lock_to_other_writers(db, engine, project, storage, monkeypatch):
+    project_id, user_id = project
+    other = models.Project(project_name="other", user_id=user_id)
+    db.add(other)
+    db.commit()
+    upload = _upload(db, storage, user_id, 6000, 3000)
+    job = _job(db, user_id, project_id, "import", "running", {"upload": upload})
+    monkeypatch.setattr(crud, "BULK_INSERT_BATCH_SIZE", 1000)
+
+    # A writer of the web process that gives up quickly instead of after busy_timeout
+    impatient = sessionmaker(bind=create_engine(engine.url, connect_args={"check_same_thread": False, "timeout": 0.2}))
+    outcomes = []
+    def save_meanwhile(fraction, message=None):
+        # Called after 5000 of the 6000 devices were read, i.e. while the import is under way
+        with impatient() as writer:
+            try:
+                crud.apply_topology_changeset(writer, other.id, user_id, schemas.TopologyChangeset(
+                    added_devices=[{"client_id": "a", "name": "a", "device_type": "PC", "properties": {}}],
+                ))
+                outcomes.append("saved")
+            except OperationalError as exc:
+                outcomes.append(str(exc.orig))
+
+    summary = jobs._run_import(db, job, save_meanwhile)
+
+    assert outcomes == ["saved"]
+    assert (summary["devices_created"], summary["links_created"]) == (6000, 3000)
+    assert crud.count_project_devices(db, project_id) == 6000
+    assert crud.count_project_devices(db, other.id) == 1
+    assert db.execute(select(func.count()).select_from(models.Device).where(models.Device.project_id < 0)).scalar_one() == 0
+
+def test_failed_import_discards_its_staged_rows(db, project, storage, monkeypatch):
+    project_id, user_id = project
+    upload = _upload(db, storage, user_id, 20, 10)
+    job = _job(db, user_id, project_id, "import", "running", {"upload": upload})
+    monkeypatch.setattr(crud, "BULK_INSERT_BATCH_SIZE", 5)
+    def fail_after_staging(*args):
+        raise RuntimeError("worker stopped")
+    monkeypatch.setattr(crud, "publish_staged_topology", fail_after_staging)
+
+    with pytest.raises(RuntimeError):
+        jobs._run_import(db, job, lambda fraction, message=None: None)
+    assert db.execute(select(func.count()).select_from(models.Device).where(models.Device.project_id < 0)).scalar_one() == 0
+    assert crud.get_project_version(db, project_id, user_id)[0] == 0
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from backend import database, jobs, layout, models
+
+def _graph(device_count, links, positions=None, device_types=None):
+    links = np.array(links, dtype=np.int64).reshape(-1, 2)
+    positions = np.full((device_count, 2), np.nan) if positions is None else np.array(positions, dtype=np.float64)
+    return layout.LayoutGraph(
+        device_ids=np.arange(1, device_count + 1), device_types=device_types or ["Switch"] * device_count,
+        x=positions[:, 0], y=positions[:, 1], link_source=links[:, 0], link_target=links[:, 1],
+    )
+
+RING = [(i, (i + 1) % 12) for i in range(12)] + [(0, 6)]
+
+@pytest.mark.parametrize("algorithm", ["force", "hierarchical"])
+@pytest.mark.parametrize("incremental", [False, True])
+def test_pinned_devices_keep_their_stored_position(algorithm, incremental):
+    positions = np.random.default_rng(1).uniform(0, 1000, size=(12, 2))
+    positions[5] = np.nan # Pinned without a stored position: laid out like the others
+    graph = _graph(12, RING, positions, ["Router", "Switch", "PC"] * 4)
+    result = layout.compute_layout(graph, algorithm, pinned_device_ids=[1, 4, 6, 99], iterations=50, spacing=100.0,
+                                   incremental=incremental, seed=0)
+    assert np.array_equal(result[[0, 3]], positions[[0, 3]])
+    assert np.isfinite(result).all()
+    assert not np.array_equal(result[[1, 2]], positions[[1, 2]])
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_force_layout_is_deterministic_for_a_seed(incremental):
+    positions = np.full((12, 2), np.nan)
+    positions[:4] = [[0, 0], [100, 0], [100, 100], [0, 100]] # Others start at random spots around these
+    def run(seed):
+        return layout.compute_layout(_graph(12, RING, positions), "force", [], iterations=50, spacing=100.0,
+                                     incremental=incremental, seed=seed)
+    assert np.array_equal(run(3), run(3))
+    assert not np.allclose(run(3), run(4))
+
+def _project(client, headers, names, positions):
+    project_id = client.post("/projects/", json={"project_name": "lab"}, headers=headers).json()["id"]
+    client.put(f"/projects/{project_id}/topology/", headers=headers, json={
+        "devices": [
+            {"client_id": name, "name": name, "device_type": "Switch",
+             "properties": {"x_position": x, "y_position": y} if x is not None else {}}
+            for name, (x, y) in zip(names, positions)
+        ],
+        "links": [{"source_device_client_id": a, "target_device_client_id": b} for a, b in zip(names, names[1:])],
+    }).raise_for_status()
+    return project_id
+
+def _stored_positions(client, headers, project_id):
+    devices = client.get(f"/projects/{project_id}/topology/", headers=headers).json()["devices"]
+    positions = [(device["properties"].get("x_position"), device["properties"].get("y_position")) for device in devices]
+    return [device["id"] for device in devices], positions
+
+def test_layout_endpoint_writes_positions_and_keeps_pinned_devices(client, login):
+    headers = login()
+    project_id = _project(client, headers, "abcde", [(500, 500), (None, None), (None, None), (None, None), (None, None)])
+    device_ids, _ = _stored_positions(client, headers, project_id)
+
+    response = client.post(f"/projects/{project_id}/layout/", headers=headers, json={"seed": 5, "pinned_device_ids": device_ids[:1]})
+    assert response.status_code == 200
+    assert (response.json()["revision"], response.json()["device_count"], response.json()["moved_device_count"]) == (2, 5, 4)
+    _, positions = _stored_positions(client, headers, project_id)
+    assert positions[0] == (500, 500)
+    assert all(x is not None and y is not None for x, y in positions)
+
+    # The same topology and seed in another project give the same layout
+    other_id = _project(client, headers, "abcde", [(500, 500), (None, None), (None, None), (None, None), (None, None)])
+    other_device_ids, _ = _stored_positions(client, headers, other_id)
+    client.post(f"/projects/{other_id}/layout/", headers=headers, json={"seed": 5, "pinned_device_ids": other_device_ids[:1]}).raise_for_status()
+    assert _stored_positions(client, headers, other_id)[1] == positions
+
+def test_layout_against_a_stale_revision_is_rejected(client, login):
+    headers = login()
+    project_id = _project(client, headers, "abc", [(None, None)] * 3)
+    client.patch(f"/projects/{project_id}/topology/", headers=headers, json={"base_revision": 1}).raise_for_status()
+
+    response = client.post(f"/projects/{project_id}/layout/", headers=headers, json={"base_revision": 1})
+    assert response.status_code == 409
+    assert "current revision is 2" in response.json()["detail"]
+    assert _stored_positions(client, headers, project_id)[1] == [(None, None)] * 3
+
+def test_large_projects_are_handed_to_the_job_queue(client, login, monkeypatch):
+    headers = login()
+    project_id = _project(client, headers, "abc", [(None, None)] * 3)
+    monkeypatch.setattr(layout, "LAYOUT_SYNC_MAX_DEVICES", 2)
+    submitted = []
+    monkeypatch.setattr(jobs.manager, "submit", submitted.append)
+
+    response = client.post(f"/projects/{project_id}/layout/", headers=headers, json={"algorithm": "hierarchical", "seed": 9})
+    assert response.status_code == 202
+    job = response.json()
+    assert (job["kind"], job["status"], job["project_id"]) == ("layout", "queued", project_id)
+    with database.SessionLocal() as db:
+        params = db.get(models.Job, job["id"]).params
+    assert (params["algorithm"], params["seed"]) == ("hierarchical", 9)
+    assert submitted == [job["id"]]
+    assert response.headers["Location"] == f"/jobs/{job['id']}"
+    assert _stored_positions(client, headers, project_id)[1] == [(None, None)] * 3
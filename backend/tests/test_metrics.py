@@ -0,0 +1,85 @@
+import pytest
+
+from backend import instrumentation, metrics
+
+def test_label_values_and_help_text_are_escaped():
+    counter = metrics.Counter("jobs_total", 'Jobs by "kind".\nSecond line \\ backslash', ("kind",))
+    counter.inc(kind='say "hi"\\\n')
+    counter.inc(2.5, kind="plain")
+    assert counter.render() == [
+        '# HELP jobs_total Jobs by "kind".\\nSecond line \\\\ backslash',
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="plain"} 2.5',
+        'jobs_total{kind="say \\"hi\\"\\\\\\n"} 1',
+    ]
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = metrics.Histogram("latency_seconds", "Latency.", ("route",), buckets=(1, 0.5))
+    for value in (0.5, 0.7, 1, 30):
+        histogram.observe(value, route="/a")
+    histogram.observe(0.1, route="/b")
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.5"} 1', # Bounds are inclusive (le)
+        'latency_seconds_bucket{route="/a",le="1"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 32.2',
+        'latency_seconds_count{route="/a"} 4',
+        'latency_seconds_bucket{route="/b",le="0.5"} 1',
+        'latency_seconds_bucket{route="/b",le="1"} 1',
+        'latency_seconds_bucket{route="/b",le="+Inf"} 1',
+        'latency_seconds_sum{route="/b"} 0.1',
+        'latency_seconds_count{route="/b"} 1',
+    ]
+
+def test_unlabelled_metrics_render_without_braces():
+    histogram = metrics.Histogram("sizes", "Sizes.", buckets=(10,))
+    histogram.observe(3)
+    assert histogram.render()[2:] == ['sizes_bucket{le="10"} 1', 'sizes_bucket{le="+Inf"} 1', "sizes_sum 3", "sizes_count 1"]
+
+def _sample(text, line_prefix):
+    values = [float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(line_prefix + " ")]
+    return values[0] if values else 0.0
+
+def test_requests_are_labelled_by_route_template(client, login):
+    headers = login()
+    requests_404 = 'http_requests_total{method="GET",route="/projects/{project_id}",status="404"}'
+    unmatched = 'http_requests_total{method="GET",route="unmatched",status="404"}'
+    before = client.get("/metrics").text
+
+    for project_id in (987654, 987655):
+        assert client.get(f"/projects/{project_id}", headers=headers).status_code == 404
+    assert client.get("/no/such/path/123").status_code == 404
+
+    after = client.get("/metrics")
+    assert after.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert _sample(after.text, requests_404) - _sample(before, requests_404) == 2
+    assert _sample(after.text, unmatched) - _sample(before, unmatched) == 1
+    assert "987654" not in after.text and "/no/such/path" not in after.text # One series per route, not per path
+    duration_count = 'http_request_duration_seconds_count{method="GET",route="/projects/{project_id}"}'
+    assert _sample(after.text, duration_count) - _sample(before, duration_count) == 2
+
+@pytest.fixture
+def admin(client, login, monkeypatch):
+    username = "admin-profiler"
+    headers = login(username)
+    monkeypatch.setattr(instrumentation, "ADMIN_USERNAMES", frozenset([username]))
+    return headers
+
+def test_profile_is_served_to_admins_only(client, login, admin):
+    profiled = client.get("/projects/", params={"profile": 1}, headers=admin)
+    assert profiled.status_code == 200
+    assert profiled.headers["content-type"].startswith("text/plain")
+    assert profiled.headers["x-profiled-status"] == "200"
+    assert profiled.text.startswith("Sampled ")
+
+    # Anyone else gets the normal response, as does a token that does not verify
+    user = login()
+    forged = {"Authorization": admin["Authorization"][:-4] + "AAAA"}
+    for headers, status_code in ((user, 200), ({}, 401), (forged, 401)):
+        response = client.get("/projects/", params={"profile": 1}, headers=headers)
+        assert response.status_code == status_code
+        assert response.headers["content-type"] == "application/json"
+        assert "x-profiled-status" not in response.headers
+    assert client.get("/projects/", params={"profile": 0}, headers=admin).headers["content-type"] == "application/json"
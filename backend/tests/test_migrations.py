@@ -0,0 +1,110 @@
+import json
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from backend import crud, models, schemas
+from backend.migrations import MIGRATIONS, prepare_database
+
+# The schema create_all built before any migration existed
+PRE_SERIES_SCHEMA = """
+CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, password_hash VARCHAR);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE INDEX ix_users_id ON users (id);
+CREATE TABLE projects (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER REFERENCES users (id), project_name VARCHAR,
+    description VARCHAR, last_modified DATETIME
+);
+CREATE INDEX ix_projects_id ON projects (id);
+CREATE INDEX ix_projects_project_name ON projects (project_name);
+CREATE TABLE devices (
+    id INTEGER NOT NULL PRIMARY KEY, project_id INTEGER REFERENCES projects (id), device_type VARCHAR,
+    name VARCHAR, properties JSON
+);
+CREATE INDEX ix_devices_id ON devices (id);
+CREATE TABLE links (
+    id INTEGER NOT NULL PRIMARY KEY, project_id INTEGER REFERENCES projects (id),
+    source_device_id INTEGER REFERENCES devices (id), target_device_id INTEGER REFERENCES devices (id),
+    source_port VARCHAR, target_port VARCHAR
+);
+CREATE INDEX ix_links_id ON links (id);
+"""
+
+def _pre_series_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for statement in filter(str.strip, PRE_SERIES_SCHEMA.split(";")):
+            conn.exec_driver_sql(statement)
+        conn.execute(text("INSERT INTO users (id, username, password_hash) VALUES (1, 'alice', 'x')"))
+        conn.execute(text("INSERT INTO projects (id, user_id, project_name, last_modified) VALUES (1, 1, 'lab', '2024-01-01 00:00:00')"))
+        conn.execute(text("INSERT INTO devices (id, project_id, device_type, name, properties) VALUES (:id, 1, 'Router', :name, :properties)"), [
+            {"id": 1, "name": "r1", "properties": json.dumps({"num_ports": "8", "estimated_load": 2.5, "x_position": 10})},
+            {"id": 2, "name": "r2", "properties": json.dumps({"num_ports": "many", "total_bandwidth": True})},
+            {"id": 3, "name": "r3", "properties": None},
+        ])
+        conn.execute(text("INSERT INTO links (id, project_id, source_device_id, target_device_id) VALUES (1, 1, 1, 2)"))
+    return engine
+
+def test_pre_series_database_is_migrated_and_backfilled(tmp_path):
+    engine = _pre_series_engine(tmp_path / "old.db")
+    assert prepare_database(engine) == [version for version, _ in MIGRATIONS]
+
+    columns = {column["name"] for column in inspect(engine).get_columns("projects")}
+    assert "revision" in columns
+    assert "listing_version" in {column["name"] for column in inspect(engine).get_columns("users")}
+    indexes = {index["name"] for table in ("projects", "devices", "links") for index in inspect(engine).get_indexes(table)}
+    assert {"ix_devices_project_id", "ix_links_project_id", "ix_links_source_device_id",
+            "ix_devices_project_id_estimated_load"} <= indexes
+    assert "topology_revisions" in inspect(engine).get_table_names()
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT revision FROM projects")).scalar_one() == 0
+        rows = conn.execute(text("SELECT id, num_ports, estimated_load, x_position, total_bandwidth FROM devices ORDER BY id")).all()
+    # Numeric strings are converted; non-numeric values, booleans and missing properties become NULL
+    assert [tuple(row) for row in rows] == [(1, 8, 2.5, 10.0, None), (2, None, None, None, None), (3, None, None, None, None)]
+
+    # Existing rows are usable through the current code
+    with sessionmaker(bind=engine)() as db:
+        result = crud.apply_topology_changeset(db, 1, 1, schemas.TopologyChangeset(
+            base_revision=0, updated_devices=[{"id": 2, "properties": {"num_ports": 4}}],
+        ))
+        assert result.revision == 1
+        _, topology = crud.get_project_topology_json(db, 1, crud.get_project_version(db, 1, 1))
+        assert json.loads(topology)["links"][0]["source_device_id"] == 1
+    engine.dispose()
+
+def test_prepare_database_is_a_no_op_once_current(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    assert prepare_database(engine) == [version for version, _ in MIGRATIONS]
+    assert prepare_database(engine) == []
+    engine.dispose()
+
+def test_backfill_does_not_depend_on_current_application_code(tmp_path, monkeypatch):
+    def changed_conversion(properties):
+        raise AssertionError("0003 must use its own frozen conversion")
+    monkeypatch.setattr(crud, "device_property_columns", changed_conversion)
+    monkeypatch.setitem(models.DEVICE_PROPERTY_COLUMNS, "num_ports", str)
+    engine = _pre_series_engine(tmp_path / "old.db")
+    prepare_database(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT num_ports FROM devices WHERE id = 1")).scalar_one() == 8
+    engine.dispose()
+
+def test_removed_device_and_link_ids_are_not_reused_after_migration(tmp_path):
+    engine = _pre_series_engine(tmp_path / "old.db")
+    prepare_database(engine)
+    with engine.connect() as conn:
+        ddl = dict(conn.execute(text("SELECT name, sql FROM sqlite_master WHERE name IN ('devices', 'links')")).all())
+    assert all("AUTOINCREMENT" in sql for sql in ddl.values())
+    assert {"ix_devices_id", "ix_devices_project_id_device_type"} <= {index["name"] for index in inspect(engine).get_indexes("devices")}
+    assert {key["referred_table"] for key in inspect(engine).get_foreign_keys("links")} == {"devices", "projects"}
+
+    with sessionmaker(bind=engine)() as db:
+        # Remove the rows holding the highest ids, then add new ones
+        result = crud.apply_topology_changeset(db, 1, 1, schemas.TopologyChangeset(removed_device_ids=[3], removed_link_ids=[1]))
+        result = crud.apply_topology_changeset(db, 1, 1, schemas.TopologyChangeset(
+            added_devices=[{"client_id": "r4", "name": "r4", "device_type": "Router", "properties": {}}],
+            added_links=[{"source_device_client_id": "r4", "target_device_id": 1}],
+        ))
+    assert (result.device_id_map, result.link_ids) == ({"r4": 4}, [2])
+    engine.dispose()
@@ -0,0 +1,85 @@
+import base64
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from backend import database, models
+
+@pytest.fixture
+def user(client, login):
+    client.headers.update(login())
+    return client
+
+def _create(client, count):
+    return [client.post("/projects/", json={"project_name": f"p{i}"}).json()["id"] for i in range(count)]
+
+def _all_pages(client, limit, **params):
+    ids, pages, cursor = [], 0, None
+    while True:
+        response = client.get("/projects/", params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids += [project["id"] for project in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids, pages
+
+@pytest.mark.parametrize("count, limit, pages", [(5, 2, 3), (4, 2, 2), (2, 2, 1), (0, 2, 1), (5, 1, 5)])
+def test_cursor_pages_cover_every_project_once(user, count, limit, pages):
+    ids = _create(user, count)
+    # Newest first; a page that ends exactly on the last project has no next cursor
+    assert _all_pages(user, limit) == (ids[::-1], pages)
+    assert _all_pages(user, limit, summary=True) == (ids[::-1], pages)
+
+def test_projects_modified_at_the_same_time_are_ordered_by_id(user):
+    ids = _create(user, 5)
+    with database.SessionLocal() as db:
+        db.execute(update(models.Project).where(models.Project.id.in_(ids)).values(last_modified=datetime(2024, 1, 1)))
+        db.commit()
+    assert _all_pages(user, 2) == (ids[::-1], 3)
+
+def test_cursor_stays_valid_when_earlier_projects_change(user):
+    ids = _create(user, 4)
+    first = user.get("/projects/", params={"limit": 2})
+    user.delete(f"/projects/{ids[3]}").raise_for_status()
+    user.put(f"/projects/{ids[2]}", json={"project_name": "renamed"}).raise_for_status() # Moves to the front
+    second = user.get("/projects/", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [project["id"] for project in second.json()] == [ids[1], ids[0]]
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"no separator").decode(),
+    base64.urlsafe_b64encode(b"2024-01-01T00:00:00|one").decode(),
+    base64.urlsafe_b64encode(b"yesterday|1").decode(),
+    base64.urlsafe_b64encode(b"2024-01-01T00:00:00|1|2").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_tampered_cursor_is_a_bad_request(user, cursor):
+    response = user.get("/projects/", params={"cursor": cursor})
+    assert (response.status_code, response.json()["detail"]) == (400, "Invalid cursor")
+
+def test_listing_etag_changes_with_the_users_projects_only(user, login):
+    project_id, _ = _create(user, 2)
+    etags = [user.get("/projects/").headers["ETag"]]
+    assert user.get("/projects/", headers={"If-None-Match": etags[-1]}).status_code == 304
+    assert user.get("/projects/", params={"summary": True}).headers["ETag"] != etags[-1]
+
+    # Another user's changes leave it alone
+    other = login()
+    other_project = user.post("/projects/", json={"project_name": "theirs"}, headers=other).json()["id"]
+    user.put(f"/projects/{other_project}/topology/", json={"devices": [], "links": []}, headers=other).raise_for_status()
+    assert user.get("/projects/", headers={"If-None-Match": etags[-1]}).status_code == 304
+
+    for change in (
+        lambda: user.put(f"/projects/{project_id}/topology/", json={"devices": [], "links": []}),
+        lambda: user.patch(f"/projects/{project_id}/topology/", json={}),
+        lambda: user.put(f"/projects/{project_id}", json={"project_name": "renamed"}),
+        lambda: user.post("/projects/", json={"project_name": "new"}),
+        lambda: user.delete(f"/projects/{project_id}"),
+    ):
+        change().raise_for_status()
+        response = user.get("/projects/", headers={"If-None-Match": etags[-1]})
+        assert response.status_code == 200
+        assert response.headers["ETag"] not in etags
+        etags.append(response.headers["ETag"])
@@ -0,0 +1,85 @@
+"""
+Query-plan regression test for the hot crud paths.
+Runs the crud functions against a scratch SQLite database, captures every statement they emit and runs
+EXPLAIN QUERY PLAN on it. Fails if any statement scans a whole table instead of searching an index, so a
+dropped index or a rewritten query that stops using one is caught.
+"""
+from typing import List, Tuple
+
+import pytest
+from sqlalchemy import event
+
+from backend import crud, history, models, schemas
+from backend.benchmarks.generators import random_topology
+
+# Tables that grow with usage; a plain "SCAN" of one of them is a regression
+GUARDED_TABLES = ("users", "projects", "devices", "links", "topology_revisions")
+
+def _exercise_hot_paths(SessionLocal) -> None:
+    with SessionLocal() as db:
+        users = [models.User(username=f"user{i}", password_hash="x") for i in range(3)]
+        db.add_all(users)
+        db.flush()
+        projects = [models.Project(project_name=f"p{i}", user_id=users[i % 3].id) for i in range(6)]
+        db.add_all(projects)
+        db.commit()
+        user_id, project_id = users[0].id, projects[0].id
+
+    with SessionLocal() as db:
+        crud.get_user_by_username(db, "user0")
+        crud.get_projects_by_user(db, user_id)
+        _, cursor = crud.get_projects_page(db, user_id, limit=1, with_counts=True)
+        crud.get_projects_page(db, user_id, limit=1, after=crud.decode_project_cursor(cursor))
+        crud.get_projects_listing_etag(db, user_id)
+        crud.get_project(db, project_id, user_id)
+        crud.get_project_version(db, project_id, user_id)
+        crud.bulk_import_topology_rows(db, project_id, user_id, **random_topology(50, 100))
+        device_ids = [row[0] for batch in crud.iter_project_device_rows(db, project_id) for row in batch]
+        link_ids = [row[0] for batch in crud.iter_project_link_rows(db, project_id) for row in batch]
+        crud.apply_topology_changeset(db, project_id, user_id, schemas.TopologyChangeset(
+            updated_devices=[{"id": device_ids[0], "properties": {"x_position": 1}}],
+            removed_device_ids=device_ids[1:3],
+            removed_link_ids=link_ids[:2],
+            added_links=[{"source_device_id": device_ids[3], "target_device_id": device_ids[4]}],
+        ))
+        crud.get_project_topology_json(db, project_id, crud.get_project_version(db, project_id, user_id))
+        crud.search_project_devices(db, project_id, min_load=10, sort="estimated_load", descending=True)
+        crud.search_project_devices(db, project_id, device_type="Router", min_utilization=0.8)
+        history.list_revisions(db, project_id)
+        history.load_topology_at(db, project_id, revision=2)
+        crud.delete_project(db, project_id, user_id)
+
+@pytest.fixture
+def plans(engine, SessionLocal) -> List[Tuple[str, List[str]]]:
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        _exercise_hot_paths(SessionLocal)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    with engine.connect() as conn:
+        return [
+            (statement, [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)])
+            for statement, parameters in statements
+        ]
+
+def full_scans(plan: List[str]) -> List[str]:
+    # "SCAN devices" reads the whole table; "SEARCH devices USING INDEX ..." is what we want
+    return [step for step in plan if step.startswith("SCAN") and step.split()[1] in GUARDED_TABLES]
+
+def test_hot_paths_search_indexes(plans):
+    # Guards against passing vacuously because the capture missed the statements
+    touched = {step.split()[1] for _, plan in plans for step in plan}
+    assert {"projects", "devices", "links", "topology_revisions"} <= touched
+
+    failures = [
+        " ".join(statement.split()) + "\n    " + "\n    ".join(plan)
+        for statement, plan in plans
+        if full_scans(plan)
+    ]
+    assert not failures, "Full table scans:\n" + "\n".join(failures)
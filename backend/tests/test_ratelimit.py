@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from backend import cache, ratelimit
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    if request.param == "memory":
+        return ratelimit.MemoryTokenBuckets()
+    return cache.SQLiteCacheBackend(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+
+def test_burst_then_refill(buckets, clock):
+    limiter = ratelimit.RateLimiter("test", per_minute=60, burst=3, buckets=buckets)
+    assert [limiter.acquire("alice") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("alice") == pytest.approx(1.0)
+    assert limiter.acquire("bob") == 0.0 # Buckets are per subject
+
+    clock.now += 0.5
+    assert limiter.acquire("alice") == pytest.approx(0.5) # Rejected requests do not take tokens
+    clock.now += 0.5
+    assert limiter.acquire("alice") == 0.0
+    clock.now += 3600
+    assert [limiter.acquire("alice") for _ in range(4)] == [0.0, 0.0, 0.0, pytest.approx(1.0)] # Refills up to the burst
+
+def test_zero_rate_disables_limiting(buckets):
+    limiter = ratelimit.RateLimiter("test", per_minute=0, burst=1, buckets=buckets)
+    assert [limiter.acquire("alice") for _ in range(10)] == [0.0] * 10
+
+def test_backend_errors_do_not_fail_requests():
+    class BrokenBuckets:
+        errors = (sqlite3.Error,)
+
+        def take_token(self, key, rate, capacity):
+            raise sqlite3.OperationalError("database is locked")
+
+    limiter = ratelimit.RateLimiter("test", per_minute=60, burst=1, buckets=BrokenBuckets())
+    assert limiter.acquire("alice") == 0.0
+
+@pytest.fixture
+def api(client, login, monkeypatch, clock):
+    """Client logged in as a fresh user with an empty project, limited to a burst of 2 requests."""
+    monkeypatch.setattr(ratelimit, "topology_limiter", ratelimit.RateLimiter("topology", 60, 2, ratelimit.MemoryTokenBuckets()))
+    client.headers.update(login())
+    project_id = client.post("/projects/", json={"project_name": "lab"}).json()["id"]
+    return client, project_id
+
+def test_limited_requests_get_429_with_retry_after(api):
+    client, project_id = api
+    assert [client.get(f"/projects/{project_id}/topology/").status_code for _ in range(2)] == [200, 200]
+    response = client.get(f"/projects/{project_id}/topology/")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+def test_revalidation_is_not_charged(api, clock):
+    client, project_id = api
+    etag = client.get(f"/projects/{project_id}/topology/").headers["ETag"]
+    for _ in range(5):
+        assert client.get(f"/projects/{project_id}/topology/", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/projects/{project_id}/topology/").status_code == 200
+    assert client.get(f"/projects/{project_id}/topology/").status_code == 429
+
+@pytest.mark.parametrize("method, path, params", [
+    ("PATCH", "topology/", {"json": {}}),
+    ("GET", "graph/critical", {}),
+    ("GET", "graph/path", {"params": {"source": 1, "target": 2}}),
+])
+def test_changesets_and_graph_queries_are_limited(api, method, path, params):
+    client, project_id = api
+    statuses = [client.request(method, f"/projects/{project_id}/{path}", **params).status_code for _ in range(3)]
+    assert statuses[2] == 429
+    assert 429 not in statuses[:2]
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from backend import spatial
+
+def _brute_force(ids, xs, ys, min_x, min_y, max_x, max_y):
+    inside = np.isfinite(xs) & np.isfinite(ys) & (xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y)
+    return sorted(ids[inside].tolist())
+
+def _boxes(rng, low, high, count):
+    for _ in range(count):
+        x0, x1 = sorted(rng.uniform(low, high, 2))
+        y0, y1 = sorted(rng.uniform(low, high, 2))
+        yield x0, y0, x1, y1
+    yield low - 1e300, low - 1e300, high + 1e300, high + 1e300 # Far-out bounds
+    yield high + 1, high + 1, high + 2, high + 2 # Beyond every device
+    yield high, low, low, high # Inverted
+
+@pytest.mark.parametrize("device_count", [0, 1, 15, 17, 500, 5000])
+def test_grid_query_matches_brute_force(device_count):
+    rng = np.random.default_rng(device_count)
+    ids = rng.permutation(device_count).astype(np.int64) + 1
+    # Clustered positions, some devices stacked on one spot and some on cell boundaries
+    xs = np.concatenate([rng.normal(0, 50, device_count // 2), rng.uniform(-1000, 1000, device_count - device_count // 2)])
+    ys = rng.normal(0, 300, device_count)
+    if device_count > 10:
+        xs[:5], ys[:5] = 7.0, 7.0
+        xs[5:10] = np.round(xs[5:10])
+    index = spatial.GridIndex(ids, xs, ys)
+    for box in _boxes(rng, -1200, 1200, 200):
+        assert sorted(index.query(*box).tolist()) == _brute_force(ids, xs, ys, *box)
+    for x, y in zip(xs[:20], ys[:20]): # Zero-area boxes on a device hit it (bounds are inclusive)
+        assert sorted(index.query(x, y, x, y).tolist()) == _brute_force(ids, xs, ys, x, y, x, y)
+
+def test_devices_with_non_finite_positions_are_left_out():
+    ids = np.arange(1, 6)
+    xs = np.array([0.0, np.inf, 5.0, np.nan, 10.0])
+    ys = np.array([0.0, 1.0, -np.inf, 2.0, 10.0])
+    index = spatial.GridIndex(ids, xs, ys)
+    assert sorted(index.query(-1e308, -1e308, 1e308, 1e308).tolist()) == [1, 5]
+    assert index.cell_size == 10.0
+
+@pytest.fixture
+def viewport(client, login):
+    client.headers.update(login())
+    project_id = client.post("/projects/", json={"project_name": "lab"}).json()["id"]
+    client.put(f"/projects/{project_id}/topology/", json={
+        "devices": [{"client_id": "a", "name": "a", "device_type": "PC", "properties": {"x_position": 1, "y_position": 2}}],
+        "links": [],
+    }).raise_for_status()
+    return f"/projects/{project_id}/topology/viewport"
+
+@pytest.mark.parametrize("bad", ["inf", "-inf", "nan", "Infinity", "NaN"])
+@pytest.mark.parametrize("field", ["min_x", "max_y", "zoom"])
+def test_viewport_rejects_non_finite_values(client, viewport, field, bad):
+    params = {"min_x": 0, "min_y": 0, "max_x": 10, "max_y": 10, field: bad}
+    response = client.get(viewport, params=params)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["query", field]
+
+def test_viewport_with_far_out_bounds(client, viewport):
+    response = client.get(viewport, params={"min_x": -1e308, "min_y": -1e308, "max_x": 1e308, "max_y": 1e308})
+    assert response.status_code == 200
+    assert [device["name"] for device in response.json()["devices"]] == ["a"]
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from backend import database, models, schemas
+
+TOPOLOGY = {
+    "devices": [
+        {"client_id": "r1", "name": "core", "device_type": "Router",
+         "properties": {"num_ports": 48, "estimated_load": 0.5, "vendor": "x", "x_position": 1.5, "y_position": -2}},
+        {"client_id": "s1", "name": "ünïcode", "device_type": "Switch", "properties": {"tags": ["a", None], "nested": {"k": 1}}},
+        {"client_id": "p1", "name": "host", "device_type": "PC", "properties": {}},
+    ],
+    "links": [
+        {"source_device_client_id": "r1", "target_device_client_id": "s1", "source_port": "eth0"},
+        {"source_device_client_id": "s1", "target_device_client_id": "p1", "target_port": "ge-0/0/1"},
+        {"source_device_client_id": "s1", "target_device_client_id": "gone"}, # Unknown endpoints are skipped
+        {"source_device_client_id": "missing", "target_device_client_id": "r1"},
+        {"source_device_client_id": "p1", "target_device_client_id": "p1"},
+    ],
+}
+
+@pytest.fixture
+def api(client, login):
+    client.headers.update(login())
+    return client
+
+def _project(client):
+    return client.post("/projects/", json={"project_name": "lab"}).json()["id"]
+
+def _by_name(topology):
+    """Devices and links keyed by device names, so topologies with different ids compare equal."""
+    names = {device["id"]: device["name"] for device in topology["devices"]}
+    devices = sorted((device["name"], device["device_type"], device["properties"]) for device in topology["devices"])
+    links = sorted((names[link["source_device_id"]], names[link["target_device_id"]], link["source_port"] or "",
+                    link["target_port"] or "") for link in topology["links"])
+    return devices, links
+
+def test_bulk_import_reads_back_like_a_full_replace(api):
+    imported = _project(api)
+    api.put(f"/projects/{imported}/topology/", json={"devices": [TOPOLOGY["devices"][2]], "links": []}).raise_for_status()
+    response = api.post(f"/projects/{imported}/topology/import", json=TOPOLOGY)
+    assert response.status_code == 200
+    assert {key: response.json()[key] for key in ("devices_created", "links_created", "links_skipped")} == {
+        "devices_created": 3, "links_created": 3, "links_skipped": 2,
+    }
+
+    replaced = _project(api)
+    api.put(f"/projects/{replaced}/topology/", json=TOPOLOGY).raise_for_status()
+
+    topology = api.get(f"/projects/{imported}/topology/").json()
+    assert _by_name(topology) == _by_name(api.get(f"/projects/{replaced}/topology/").json())
+    devices, links = _by_name(topology)
+    assert [name for name, _, _ in devices] == ["core", "host", "ünïcode"] # The earlier device was replaced
+    assert links == [("core", "ünïcode", "eth0", ""), ("host", "host", "", ""), ("ünïcode", "host", "", "ge-0/0/1")]
+    assert all(device["project_id"] == imported for device in topology["devices"])
+    # The typed columns are filled in as well, so filtered searches see imported devices
+    loaded = api.get(f"/projects/{imported}/topology/devices", params={"min_load": 0.4}).json()
+    assert [device["name"] for device in loaded] == ["core"]
+
+def test_streamed_bodies_match_the_buffered_read(api):
+    project_id = _project(api)
+    # More rows than one read batch (crud.TOPOLOGY_STREAM_BATCH_SIZE), so the stream spans several chunks
+    names = [f"d{i}" for i in range(2500)]
+    api.post(f"/projects/{project_id}/topology/import", json={
+        "devices": [*TOPOLOGY["devices"], *({"client_id": name, "name": name, "device_type": "PC",
+                                              "properties": {"x_position": i / 3}} for i, name in enumerate(names))],
+        "links": [*TOPOLOGY["links"], *({"source_device_client_id": a, "target_device_client_id": b} for a, b in zip(names, names[1:]))],
+    }).raise_for_status()
+    buffered = api.get(f"/projects/{project_id}/topology/")
+    topology = buffered.json()
+    assert (len(topology["devices"]), len(topology["links"])) == (2503, 2502)
+
+    streamed = api.get(f"/projects/{project_id}/topology/stream", params={"format": "json"})
+    assert streamed.headers["content-type"] == "application/json"
+    assert streamed.content == buffered.content
+
+    lines = api.get(f"/projects/{project_id}/topology/stream").text.splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert rows == [{"device": device} for device in topology["devices"]] + [{"link": link} for link in topology["links"]]
+
+    # The lean encoders produce what the response models describe
+    with database.SessionLocal() as db:
+        project = db.get(models.Project, project_id)
+        expected = schemas.TopologyResponse(
+            devices=sorted(project.devices, key=lambda device: device.id), links=sorted(project.links, key=lambda link: link.id),
+        )
+    assert topology == json.loads(expected.model_dump_json())